@@ -0,0 +1,281 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+from flask import g, has_request_context, jsonify, request
+
+# Fuzzy corpus work vs. emissions math; other routes (health, admin, metrics) are never gated
+ENDPOINT_CLASSES = {
+    "/search": "expensive",
+    "/compare-dishes": "expensive",
+    "/rank-dishes": "expensive",
+    "/shard/search": "expensive",
+    "/shard/resolve": "expensive",
+    "/emissions": "cheap",
+    "/predict": "cheap",
+    "/substitute": "cheap",
+    "/search/by-ingredients": "cheap",
+}
+# Routes that take their slot themselves, around the computation only (see run_admitted): cache
+# hits, requests sharing an in-flight result and /search cursor pages never wait for one
+COMPUTE_GATED = {"/search", "/compare-dishes", "/rank-dishes"}
+CLASS_NAMES = ("expensive", "cheap")
+FIELDS = ("in_flight", "queued", "admitted", "rejected")
+
+# (concurrency, wait queue length, max queue wait in seconds) per worker process
+DEFAULT_LIMITS = {
+    "expensive": (1, 2, 5.0),
+    "cheap": (3, 2, 2.0),
+}
+MAX_WORKER_SLOTS = 64
+
+
+def _limits_for(name):
+    """ Limits for a class from GREENBITE_<CLASS>_CONCURRENCY / _QUEUE / _QUEUE_TIMEOUT, else defaults. """
+    concurrency, queue, timeout = DEFAULT_LIMITS[name]
+    prefix = f"GREENBITE_{name.upper()}"
+    try:
+        concurrency = max(int(os.environ.get(f"{prefix}_CONCURRENCY", concurrency)), 1)
+        queue = max(int(os.environ.get(f"{prefix}_QUEUE", queue)), 0)
+        timeout = float(os.environ.get(f"{prefix}_QUEUE_TIMEOUT", timeout))
+    except ValueError:
+        print(f"⚠ Warning: Invalid {prefix}_* admission setting, using defaults")
+        concurrency, queue, timeout = DEFAULT_LIMITS[name]
+    return concurrency, queue, timeout
+
+
+class _SharedBoard:
+    """
+    Per-worker gauges in shared memory. Created at import, so with preload_app every
+    worker forked from the master writes its own slot and any worker can report the
+    totals for the whole instance. Slots of dead workers are ignored and reused.
+    """
+
+    def __init__(self, slots=MAX_WORKER_SLOTS):
+        self.stride = 1 + len(CLASS_NAMES) * len(FIELDS)
+        self.values = multiprocessing.RawArray("q", slots * self.stride)
+        self.slots = slots
+        self._claim_lock = multiprocessing.Lock()
+        self._base = None
+        self._base_pid = None
+
+    def _slot_base(self):
+        pid = os.getpid()
+        if self._base_pid == pid:
+            return self._base
+        with self._claim_lock:
+            for slot in range(self.slots):
+                base = slot * self.stride
+                owner = self.values[base]
+                if owner == 0 or owner == pid or not _pid_alive(owner):
+                    for offset in range(self.stride):
+                        self.values[base + offset] = 0
+                    self.values[base] = pid
+                    self._base, self._base_pid = base, pid
+                    return base
+        return None  # More workers than slots: this one reports nothing
+
+    def publish(self, class_index, counts):
+        base = self._slot_base()
+        if base is None:
+            return
+        start = base + 1 + class_index * len(FIELDS)
+        for offset, field in enumerate(FIELDS):
+            self.values[start + offset] = counts[field]
+
+    def totals(self):
+        """ {class: {field: sum over live workers}} plus the number of reporting workers. """
+        totals = {name: dict.fromkeys(FIELDS, 0) for name in CLASS_NAMES}
+        workers = 0
+        for slot in range(self.slots):
+            base = slot * self.stride
+            owner = self.values[base]
+            if owner == 0 or not _pid_alive(owner):
+                continue
+            workers += 1
+            for class_index, name in enumerate(CLASS_NAMES):
+                start = base + 1 + class_index * len(FIELDS)
+                for offset, field in enumerate(FIELDS):
+                    totals[name][field] += self.values[start + offset]
+        return totals, workers
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded wait queue for one endpoint class. Requests beyond
+    the limit wait up to `queue_timeout` for a slot; when the queue is full (or the wait
+    times out) they are rejected immediately so the caller can shed them.
+    """
+
+    def __init__(self, name, limit, max_queue, queue_timeout, board=None, class_index=0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.counts = dict.fromkeys(FIELDS, 0)
+        self.service_seconds = 0.5  # Moving average of admitted request durations
+        self._cond = threading.Condition()
+        self._board = board
+        self._class_index = class_index
+
+    def _publish(self):
+        if self._board is not None:
+            self._board.publish(self._class_index, self.counts)
+
+    def acquire(self):
+        """ Take a slot, waiting in the queue if allowed; returns False when the request should be shed. """
+        counts = self.counts
+        with self._cond:
+            if counts["in_flight"] < self.limit and counts["queued"] == 0:
+                counts["in_flight"] += 1
+                counts["admitted"] += 1
+                self._publish()
+                return True
+            if counts["queued"] >= self.max_queue:
+                counts["rejected"] += 1
+                self._publish()
+                return False
+
+            counts["queued"] += 1
+            self._publish()
+            give_up_at = time.monotonic() + self.queue_timeout
+            while counts["in_flight"] >= self.limit:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    counts["queued"] -= 1
+                    counts["rejected"] += 1
+                    self._publish()
+                    return False
+                self._cond.wait(remaining)
+
+            counts["queued"] -= 1
+            counts["in_flight"] += 1
+            counts["admitted"] += 1
+            self._publish()
+            return True
+
+    def release(self, elapsed_seconds):
+        with self._cond:
+            self.counts["in_flight"] -= 1
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * elapsed_seconds
+            self._publish()
+            self._cond.notify()
+
+    def retry_after(self):
+        """ Seconds until a retry is likely to be admitted: the queue ahead drained at the current pace. """
+        waiting = self.counts["queued"] + self.counts["in_flight"]
+        return min(max(math.ceil(self.service_seconds * waiting / self.limit), 1), 30)
+
+
+BOARD = _SharedBoard()
+CONTROLLERS = {
+    name: AdmissionController(name, *_limits_for(name), board=BOARD, class_index=index)
+    for index, name in enumerate(CLASS_NAMES)
+}
+
+
+def admission_snapshot():
+    """ In-flight/queued/admitted/rejected per class for this worker and summed over all workers. """
+    totals, workers = BOARD.totals()
+    return {
+        "workers": workers,
+        "instance": totals,
+        "worker": {name: dict(controller.counts, limit=controller.limit, max_queue=controller.max_queue)
+                   for name, controller in CONTROLLERS.items()},
+    }
+
+
+def admission_metrics():
+    """ Instance-wide admission gauges and counters for /metrics. """
+    totals, workers = BOARD.totals()
+    samples = [("greenbite_workers", {}, workers, "Worker processes reporting admission state")]
+    for name, counts in totals.items():
+        labels = {"class": name}
+        samples += [
+            ("greenbite_requests_in_flight", labels, counts["in_flight"], "Admitted requests currently running"),
+            ("greenbite_requests_queued", labels, counts["queued"], "Requests waiting for an admission slot"),
+            ("greenbite_requests_admitted_total", labels, counts["admitted"], "Requests admitted by live workers"),
+            ("greenbite_requests_shed_total", labels, counts["rejected"], "Requests rejected with 503 by live workers"),
+        ]
+        samples.append(("greenbite_admission_limit", labels, CONTROLLERS[name].limit * max(workers, 1),
+                        "Concurrent requests allowed across workers"))
+    return samples
+
+
+def _busy_payload(controller, path):
+    retry_after = controller.retry_after()
+    print(f"🚦 Shedding {path}: {controller.name} load at capacity, retry in {retry_after}s")
+    return {"error": "Server is busy, please retry", "retry_after": retry_after}
+
+
+def run_admitted(endpoint_class, compute):
+    """
+    Run compute() -> (payload, status) in a slot of the endpoint class, for COMPUTE_GATED
+    routes once the caches and request coalescing have missed. Returns a busy (payload, 503)
+    instead when the request is shed; the response gets its Retry-After header on the way out.
+    """
+    controller = CONTROLLERS[endpoint_class]
+    if not controller.acquire():
+        payload = _busy_payload(controller, request.path if has_request_context() else endpoint_class)
+        if has_request_context():
+            g.retry_after = payload["retry_after"]
+        return payload, 503
+    started = time.monotonic()
+    try:
+        return compute()
+    finally:
+        controller.release(time.monotonic() - started)
+
+
+def install_admission_control(app):
+    """ Gate the expensive and cheap endpoints; shed excess load with a fast 503 and Retry-After. """
+
+    @app.before_request
+    def admit_request():
+        endpoint_class = ENDPOINT_CLASSES.get(request.path)
+        if endpoint_class is None or request.method == "OPTIONS" or request.path in COMPUTE_GATED:
+            return None
+        controller = CONTROLLERS[endpoint_class]
+        if not controller.acquire():
+            payload = _busy_payload(controller, request.path)
+            response = jsonify(payload)
+            response.status_code = 503
+            response.headers["Retry-After"] = str(payload["retry_after"])
+            return response
+        g.admission = (controller, time.monotonic())
+        return None
+
+    @app.after_request
+    def release_after_stream(response):
+        retry_after = g.pop("retry_after", None)
+        if retry_after is not None and response.status_code == 503:
+            response.headers["Retry-After"] = str(retry_after)
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            controller, started = admitted
+            if response.is_streamed:
+                # NDJSON bodies are produced while the server sends them; keep the slot until they finish
+                response.call_on_close(lambda: controller.release(time.monotonic() - started))
+            else:
+                controller.release(time.monotonic() - started)
+        return response
+
+    @app.teardown_request
+    def release_request(exception=None):
+        # Only still set when the request failed before after_request ran
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            controller, started = admitted
+            controller.release(time.monotonic() - started)
@@ -0,0 +1,259 @@
+"""
+Bulk sustainability scoring for menus and recipe files.
+
+Streams a CSV or JSONL file in chunks and scores every record in a process pool with
+the API's scoring code, writing results as they complete. Each record has either a
+`dish` (resolved to a recipe like /compare-dishes) or an `ingredients` list (scored
+like /predict; a JSON list or a comma-separated string).
+
+Usage:
+    python bulk_score.py menu.csv scores.csv
+    python bulk_score.py menu.jsonl scores.parquet --workers 4 --chunk-size 5000
+    python bulk_score.py menu.csv scores.csv --model   # adds the trained model's model_score column
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import dataset_store
+from model_scoring import DEFAULT_MODEL_PATH, load_model_scorer
+
+OUTPUT_COLUMNS = ["id", "dish", "matched_title", "ingredients", "sustainability_score",
+                  "total_emissions", "status", "error"]
+MODEL_COLUMN = "model_score"
+INPUT_FORMATS = ["csv", "jsonl"]
+OUTPUT_FORMATS = ["csv", "parquet"]
+
+# Set in the parent before the pool forks, so workers share the loaded datasets
+_generation = None
+_emissions = None
+_quiet = True
+
+
+def _ingredient_list(value):
+    """ Ingredients from a JSON list, a JSON-encoded list or a comma-separated string. """
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    if not isinstance(value, str) or not value.strip():
+        return []
+    value = value.strip()
+    if value.startswith("["):
+        try:
+            return _ingredient_list(json.loads(value))
+        except ValueError:
+            pass
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def score_record(record):
+    """ Score one input record; returns a row of OUTPUT_COLUMNS. """
+    from emissions import clean_ingredient
+    from scoring import resolve_dish, score_dish, score_ingredients
+
+    row = dict.fromkeys(OUTPUT_COLUMNS)
+    row["id"] = record.get("id")
+    dish_name = record.get("dish")
+    try:
+        if isinstance(dish_name, str) and dish_name.strip():
+            row["dish"] = dish_name
+            title, position = resolve_dish(dish_name, _generation)
+            if position is None:
+                row["status"] = "no_match"
+                return row
+            details, _ = score_dish(position, _generation)
+            row.update(matched_title=title, ingredients="; ".join(clean_ingredient(name) for name in details["ingredients"]),
+                       sustainability_score=details["sustainability_score"], total_emissions=details["total_emissions"])
+            if MODEL_COLUMN in details:
+                row[MODEL_COLUMN] = details[MODEL_COLUMN]
+        else:
+            ingredients = _ingredient_list(record.get("ingredients"))
+            if not ingredients:
+                row["status"] = "no_ingredients"
+                return row
+            result = score_ingredients(ingredients, _emissions)
+            row.update(ingredients="; ".join(ingredients), sustainability_score=result["sustainability_score"],
+                       total_emissions=result["total_emissions"])
+            if MODEL_COLUMN in result:
+                row[MODEL_COLUMN] = result[MODEL_COLUMN]
+        row["status"] = "ok"
+    except Exception as e:
+        row.update(status="error", error=str(e))
+    return row
+
+
+def score_batch(records):
+    """ Score a batch in a worker, silencing the per-ingredient debug output unless --verbose. """
+    if not _quiet:
+        return [score_record(record) for record in records]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return [score_record(record) for record in records]
+
+
+def read_records(path, input_format, chunk_size):
+    """ Yield lists of record dicts, `chunk_size` input rows at a time. """
+    if input_format == "jsonl":
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False)
+    else:
+        reader = pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    with reader:
+        for chunk in reader:
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            yield chunk.to_dict("records")
+
+
+class ResultWriter:
+    """ Append scored rows to a CSV or Parquet file as they are produced. """
+
+    def __init__(self, path, output_format, columns=OUTPUT_COLUMNS):
+        self.path = path
+        self.output_format = output_format
+        self.columns = columns
+        self._parquet = None
+        self._header_written = False
+
+    def write(self, rows):
+        frame = pd.DataFrame(rows, columns=self.columns)
+        frame["id"] = frame["id"].astype("string")
+        for column in ("sustainability_score", "total_emissions", MODEL_COLUMN):
+            if column in frame:
+                frame[column] = frame[column].astype("float64")
+        if self.output_format == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise SystemExit("❌ Parquet output needs pyarrow (pip install pyarrow)")
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+        else:
+            frame.to_csv(self.path, mode="a" if self._header_written else "w", header=not self._header_written, index=False)
+            self._header_written = True
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def _format_of(path, explicit):
+    """ The explicit format, else the one the file name suggests (csv when it suggests none). """
+    if explicit:
+        return explicit
+    name = path.lower()
+    for suffix in (".gz", ".bz2", ".zip", ".xz"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".parquet"):
+        return "parquet"
+    return "csv"
+
+
+def _needs_recipes(path, input_format):
+    """ Only inputs with a dish column need the recipes corpus and title matcher. """
+    first = next(read_records(path, input_format, 1), [])
+    return bool(first) and "dish" in first[0]
+
+
+def load_scoring_data(with_recipes, recipes_path, emissions_path):
+    """ Load the emissions table (and recipes when dishes are scored) exactly as the API does. """
+    global _generation, _emissions
+    import emissions
+    import sustainability
+    from ingredient_resolution import load_resolution_table
+
+    if with_recipes:
+        _generation = dataset_store.build_generation(recipes_path, emissions_path)
+        _emissions = _generation.emissions
+    else:
+        _emissions = dataset_store.load_emissions(emissions_path)
+    sustainability.load_emissions_dataset(emissions_path)
+    emissions.set_resolution_table(load_resolution_table(
+        dataset_store.dataset_path(dataset_store.RESOLUTION_FILENAME), _emissions
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score dishes or ingredient lists from a CSV/JSONL file.")
+    parser.add_argument("input", help="CSV or JSONL with `dish` or `ingredients` (and optional `id`) columns")
+    parser.add_argument("output", help="Results file (.csv or .parquet)")
+    parser.add_argument("--input-format", choices=INPUT_FORMATS)
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS)
+    parser.add_argument("--recipes", default=dataset_store.dataset_path(dataset_store.RECIPES_FILENAME))
+    parser.add_argument("--emissions", default=dataset_store.dataset_path(dataset_store.EMISSIONS_FILENAME))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Input rows read at a time")
+    parser.add_argument("--batch-size", type=int, default=100, help="Records per worker task")
+    parser.add_argument("--verbose", action="store_true", help="Keep the scoring debug output")
+    parser.add_argument("--model", nargs="?", const=DEFAULT_MODEL_PATH, metavar="PATH",
+                        help="Also score with the trained sustainability model (default: the bundled pickle)")
+    args = parser.parse_args()
+
+    global _quiet
+    _quiet = not args.verbose
+    input_format = _format_of(args.input, args.input_format)
+    output_format = _format_of(args.output, args.output_format)
+    if input_format not in INPUT_FORMATS:
+        parser.error(f"unsupported input format {input_format!r} (use {' or '.join(INPUT_FORMATS)})")
+    if output_format not in OUTPUT_FORMATS:
+        parser.error(f"unsupported output format {output_format!r} (use {' or '.join(OUTPUT_FORMATS)})")
+
+    with_recipes = _needs_recipes(args.input, input_format)
+    print(f"📥 Loading scoring data ({'recipes + emissions' if with_recipes else 'emissions only'})...")
+    load_scoring_data(with_recipes, args.recipes, args.emissions)
+    columns = OUTPUT_COLUMNS
+    if args.model:
+        import scoring
+        scorer = load_model_scorer(args.model)
+        if scorer is None:
+            raise SystemExit(f"❌ Could not load the sustainability model from {args.model}")
+        scoring.set_model_scorer(scorer)
+        columns = OUTPUT_COLUMNS + [MODEL_COLUMN]
+
+    # Workers fork after loading, so the datasets are shared instead of reloaded per process;
+    # at most `max_pending` batches are in flight, which bounds memory for any input size
+    context = multiprocessing.get_context("fork")
+    max_pending = args.workers * 2
+    writer = ResultWriter(args.output, output_format, columns)
+    started = time.perf_counter()
+    done = 0
+    statuses = {}
+
+    def drain(pending, until):
+        nonlocal done
+        while len(pending) > until:
+            rows = pending.popleft().result()
+            writer.write(rows)
+            done += len(rows)
+            for row in rows:
+                statuses[row["status"]] = statuses.get(row["status"], 0) + 1
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+            pending = deque()
+            for chunk in read_records(args.input, input_format, args.chunk_size):
+                for start in range(0, len(chunk), args.batch_size):
+                    drain(pending, max_pending - 1)
+                    pending.append(pool.submit(score_batch, chunk[start:start + args.batch_size]))
+                elapsed = time.perf_counter() - started
+                print(f"⏳ {done} scored, {done / max(elapsed, 1e-9):.0f} records/s", file=sys.stderr)
+            drain(pending, 0)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Scored {done} records in {elapsed:.1f}s ({statuses}) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
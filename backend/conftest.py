@@ -0,0 +1,60 @@
+import gzip
+import json
+import random
+
+import pytest
+
+from emissions import INGREDIENT_MAPPINGS
+
+# Named dishes the API tests look up, with per-kg emissions that rank them clearly
+DISHES = {
+    "Lentil Soup": ["lentils", "carrots", "onion", "tomato"],
+    "Buttermilk Pancakes": ["flour", "milk", "eggs", "butter", "sugar"],
+    "Beef Stew": ["beef", "potatoes", "carrots", "onion"],
+}
+EMISSIONS = {"lentils": 0.9, "carrots": 0.4, "onion": 0.5, "tomato": 1.4, "flour": 1.4, "milk": 3.2, "eggs": 4.7,
+             "butter": 11.5, "sugar": 3.2, "beef": 99.5, "potatoes": 0.5, "rice": 4.5, "tofu": 3.2, "cheese": 23.9}
+FILLER_WORDS = ["roasted", "garden", "spicy", "summer", "rustic", "golden", "quick", "harvest", "smoky", "herb",
+                "salad", "casserole", "bake", "skillet", "bowl", "wrap", "gratin", "risotto", "tart", "medley"]
+NUM_FILLER_RECIPES = 400
+
+
+def write_corpus(directory, seed=7):
+    """ A small recipes file (the named DISHES plus random filler) and a matching emissions file. """
+    rng = random.Random(seed)
+    recipes = list(DISHES.items())
+    for _ in range(NUM_FILLER_RECIPES):
+        title = " ".join(rng.sample(FILLER_WORDS, rng.randint(2, 3))).title()
+        recipes.append((title, rng.sample(sorted(EMISSIONS), rng.randint(2, 6))))
+    with gzip.open(directory / "filtered_recipes_1m.csv.gz", "wt") as f:
+        f.write("title,NER\n")
+        for title, ingredients in recipes:
+            f.write(f'{title},"{json.dumps(ingredients).replace(chr(34), chr(34) * 2)}"\n')
+
+    categories = ["Land Use Change", "Feed", "Farm", "Processing", "Transport", "Packaging", "Retail"]
+    with open(directory / "Food_Product_Emissions.csv", "w") as f:
+        f.write(",".join(["Food product"] + categories + ["Total from Land to Retail",
+                                                          "Total Global Average GHG Emissions per kg", "Total_emissions"]) + "\n")
+        for ingredient, total in EMISSIONS.items():
+            # Named like the real table's rows, so ingredients resolve through INGREDIENT_MAPPINGS
+            product = INGREDIENT_MAPPINGS.get(ingredient, ingredient).title()
+            stages = [round(total / len(categories), 4)] * len(categories)
+            f.write(",".join([product] + [str(stage) for stage in stages] + [str(round(sum(stages), 4)), str(total), str(total)]) + "\n")
+    return recipes
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """ main loaded against a small synthetic corpus, with the shared on-disk cache, popularity file and reload log off. """
+    directory = tmp_path_factory.mktemp("datasets")
+    write_corpus(directory)
+    with pytest.MonkeyPatch.context() as patch:
+        for name, value in {"GREENBITE_DATASETS_DIR": str(directory), "GREENBITE_BACKGROUND_LOAD": "0",
+                            "GREENBITE_CACHE": "off", "GREENBITE_POPULARITY": "off"}.items():
+            patch.setenv(name, value)
+        import dataset_store
+        patch.setattr(dataset_store, "DATASETS_DIR", str(directory))
+        patch.setattr(dataset_store, "RELOAD_POLL_SECONDS", None)  # Tests drive the reload log themselves
+        import main
+        assert dataset_store.current_generation() is not None
+        yield main
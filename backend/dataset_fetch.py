@@ -0,0 +1,252 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# fcntl serializes processes fetching the same object; without it (Windows) they may race
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CHUNK_SIZE = 32 * 1024 * 1024  # Bytes per ranged read
+MAX_WORKERS = 8
+MAX_ATTEMPTS = 3
+
+
+class DatasetFetchError(Exception):
+    """ Raised when a dataset blob cannot be downloaded or fails verification. """
+
+
+class LocalStorageBackend:
+    """ Filesystem stand-in for a GCS bucket, used for offline runs and tests. """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def stat(self, name):
+        """ Return {"size", "md5"} for a blob. """
+        path = self._path(name)
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                md5.update(block)
+        return {"size": os.path.getsize(path), "md5": md5.hexdigest()}
+
+    def read_range(self, name, start, end):
+        """ Read bytes [start, end) of a blob. """
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+class GCSStorageBackend:
+    """ Google Cloud Storage bucket; the client library is only imported when used. """
+
+    def __init__(self, bucket_name, client=None):
+        self.bucket_name = bucket_name
+        self._client = client
+        self._bucket = None
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            if self._client is None:
+                from google.cloud import storage
+                self._client = storage.Client()
+            self._bucket = self._client.bucket(self.bucket_name)
+        return self._bucket
+
+    def stat(self, name):
+        """ Return {"size"} plus "md5" or "crc32c" (composite objects only carry crc32c). """
+        blob = self._get_bucket().get_blob(name)
+        if blob is None:
+            raise DatasetFetchError(f"Blob not found: gs://{self.bucket_name}/{name}")
+        info = {"size": blob.size}
+        if blob.md5_hash:
+            info["md5"] = base64.b64decode(blob.md5_hash).hex()
+        elif blob.crc32c:
+            info["crc32c"] = base64.b64decode(blob.crc32c).hex()
+        return info
+
+    def read_range(self, name, start, end):
+        """ Read bytes [start, end) of a blob (GCS ranges are inclusive). """
+        return self._get_bucket().blob(name).download_as_bytes(start=start, end=end - 1)
+
+
+def storage_backend_from_env():
+    """ Pick a storage backend from GREENBITE_DATASET_BUCKET or GREENBITE_DATASET_SOURCE_DIR. """
+    bucket_name = os.environ.get("GREENBITE_DATASET_BUCKET")
+    if bucket_name:
+        return GCSStorageBackend(bucket_name)
+    source_dir = os.environ.get("GREENBITE_DATASET_SOURCE_DIR")
+    if source_dir:
+        return LocalStorageBackend(source_dir)
+    return None
+
+
+def _checksum_of(info):
+    """ Return (algorithm, hex digest) for a blob's metadata. """
+    if info.get("md5"):
+        return "md5", info["md5"]
+    if info.get("crc32c"):
+        return "crc32c", info["crc32c"]
+    raise DatasetFetchError("Blob metadata has no checksum to verify against")
+
+
+def _file_checksum(path, algorithm):
+    """ Stream a file through the given checksum algorithm. """
+    if algorithm == "md5":
+        digest = hashlib.md5()
+    else:
+        import google_crc32c
+        digest = google_crc32c.Checksum()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest() if algorithm == "md5" else digest.digest().hex()
+
+
+def _ref_path(cache_dir, name):
+    safe_name = name.replace("/", "__")
+    return os.path.join(cache_dir, "refs", f"{safe_name}.json")
+
+
+def _read_ref(cache_dir, name):
+    try:
+        with open(_ref_path(cache_dir, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_ref(cache_dir, name, info):
+    path = _ref_path(cache_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), delete=False) as f:
+        json.dump(info, f)
+    os.replace(f.name, path)
+
+
+def _download_ranges(backend, name, size, path, chunk_size, max_workers):
+    """ Download a blob into path with concurrent ranged reads written at their offsets. """
+    ranges = [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+    progress = {"bytes": 0}
+    progress_lock = threading.Lock()
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+
+        def fetch(byte_range):
+            start, end = byte_range
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    data = backend.read_range(name, start, end)
+                    if len(data) != end - start:
+                        raise DatasetFetchError(f"Short read for bytes {start}-{end}: got {len(data)}")
+                    os.pwrite(fd, data, start)
+                    break
+                except Exception as e:
+                    if attempt == MAX_ATTEMPTS:
+                        raise
+                    print(f"⚠ Retrying bytes {start}-{end} of {name} (attempt {attempt}): {str(e)}")
+            with progress_lock:
+                progress["bytes"] += end - start
+                print(f"📥 {name}: {progress['bytes'] * 100 // max(size, 1)}% downloaded")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(fetch, ranges))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _object_lock(object_path):
+    """ Hold an exclusive lock on one cached object, so only one process downloads or exposes it at a time. """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{object_path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _materialize(object_path, destination):
+    """ Expose a cached object at destination, hard-linking when possible. """
+    destination_dir = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(destination_dir, exist_ok=True)
+    temp_path = os.path.join(destination_dir, f".{os.path.basename(destination)}.{os.getpid()}.tmp")
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(object_path, temp_path)
+    except OSError:
+        shutil.copyfile(object_path, temp_path)
+    os.replace(temp_path, destination)
+
+
+def fetch_dataset(backend, name, destination, cache_dir, chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS):
+    """
+    Fetch blob `name` into `destination` through a content-addressed local cache.
+
+    The cache stores objects under their checksum, so a restart with an unchanged
+    blob only costs a metadata call (or nothing at all when the backend is offline).
+    """
+    cached_ref = _read_ref(cache_dir, name)
+    try:
+        info = backend.stat(name)
+    except Exception as e:
+        if cached_ref is None:
+            raise DatasetFetchError(f"Cannot stat {name} and nothing is cached: {str(e)}")
+        print(f"⚠ Storage unavailable ({str(e)}); using cached copy of {name}")
+        info = cached_ref
+
+    algorithm, checksum = _checksum_of(info)
+    object_path = os.path.join(cache_dir, "objects", f"{algorithm}-{checksum}")
+
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+    # Workers starting together fetch each object once: the others wait here and then find it cached
+    with _object_lock(object_path):
+        if os.path.exists(object_path) and os.path.getsize(object_path) == info["size"]:
+            print(f"✅ Cache hit for {name} ({algorithm} {checksum})")
+        else:
+            partial_path = f"{object_path}.{os.getpid()}.partial"
+            print(f"📥 Downloading {name} ({info['size']} bytes) with up to {max_workers} parallel ranges...")
+            try:
+                _download_ranges(backend, name, info["size"], partial_path, chunk_size, max_workers)
+            except Exception:
+                os.remove(partial_path)
+                raise
+
+            actual = _file_checksum(partial_path, algorithm)
+            if actual != checksum:
+                os.remove(partial_path)
+                raise DatasetFetchError(f"Checksum mismatch for {name}: expected {checksum}, got {actual}")
+            os.replace(partial_path, object_path)
+            print(f"✅ Downloaded and verified {name}")
+
+        _write_ref(cache_dir, name, info)
+        _materialize(object_path, destination)
+    return destination
+
+
+def download_from_gcs(bucket_name, source_blob_name, destination_file_name, cache_dir=None):
+    """Downloads a blob from the bucket (parallel, verified and cached)."""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(destination_file_name)), ".cache")
+    fetch_dataset(GCSStorageBackend(bucket_name), source_blob_name, destination_file_name, cache_dir)
+    print(f"Downloaded {source_blob_name} to {destination_file_name}")
+    return destination_file_name
@@ -0,0 +1,557 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from dataset_fetch import fetch_dataset, storage_backend_from_env
+
+# fcntl serializes workers appending to the reload log; without it (Windows) appends may interleave
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# pandas, numpy and thefuzz are imported inside the loaders so importing this module stays cheap
+
+# Get the absolute path to the datasets directory (overridable for local runs and tests)
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASETS_DIR = os.environ.get("GREENBITE_DATASETS_DIR", os.path.join(os.path.dirname(BACKEND_DIR), "datasets"))
+RECIPES_FILENAME = "filtered_recipes_1m.csv.gz"
+EMISSIONS_FILENAME = "Food_Product_Emissions.csv"
+RESOLUTION_FILENAME = "ingredient_resolution.json.gz"  # Built by ingredient_resolution.py
+RELOAD_LOG_FILENAME = "reload_log.jsonl"  # Reloads requested on any worker, replayed by every other one
+DEFAULT_RELOAD_POLL_SECONDS = 5.0
+
+
+def shard_from_env():
+    """ This node's (index, count) recipe partition from GREENBITE_SHARD="index/count"; None serves the whole corpus. """
+    value = os.environ.get("GREENBITE_SHARD", "").strip()
+    if not value:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"GREENBITE_SHARD must look like 'index/count', got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"GREENBITE_SHARD index must be in [0, {count}), got {value!r}")
+    return index, count
+
+
+SHARD = shard_from_env()
+
+
+def compaction_from_env():
+    """
+    Corpus compaction from GREENBITE_CORPUS_DEDUPE: None (off, the default), 1.0 for
+    exact groups ("on"/"exact"), or a Jaccard threshold in (0, 1) that also merges a
+    title's near-duplicate ingredient sets.
+    """
+    value = os.environ.get("GREENBITE_CORPUS_DEDUPE", "off").strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return None
+    if value in ("1", "on", "true", "yes", "exact"):
+        return 1.0
+    try:
+        threshold = float(value)
+    except ValueError:
+        raise ValueError(f"GREENBITE_CORPUS_DEDUPE must be off, exact or a threshold in (0, 1], got {value!r}")
+    if not 0 < threshold <= 1:
+        raise ValueError(f"GREENBITE_CORPUS_DEDUPE threshold must be in (0, 1], got {value!r}")
+    return threshold
+
+
+COMPACTION = compaction_from_env()
+
+
+def reload_poll_seconds_from_env():
+    """ Seconds between checks of the shared reload log (GREENBITE_RELOAD_POLL_SECONDS); None when off or 0. """
+    value = os.environ.get("GREENBITE_RELOAD_POLL_SECONDS", str(DEFAULT_RELOAD_POLL_SECONDS)).strip().lower()
+    if value in ("off", "false", "no"):
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        print("⚠ Warning: Invalid GREENBITE_RELOAD_POLL_SECONDS, using default")
+        seconds = DEFAULT_RELOAD_POLL_SECONDS
+    return seconds if seconds > 0 else None
+
+
+RELOAD_POLL_SECONDS = reload_poll_seconds_from_env()
+
+
+def dataset_path(filename):
+    """ Resolve a dataset file name inside the datasets directory. """
+    return os.path.join(DATASETS_DIR, os.path.basename(filename))
+
+
+def ensure_local_datasets(backend=None, filenames=(RECIPES_FILENAME, EMISSIONS_FILENAME)):
+    """
+    Fetch any missing dataset file from remote storage (GREENBITE_DATASET_BUCKET or
+    GREENBITE_DATASET_SOURCE_DIR) through the local download cache.
+    """
+    backend = backend or storage_backend_from_env()
+    cache_dir = os.environ.get("GREENBITE_DATASET_CACHE_DIR", os.path.join(DATASETS_DIR, ".cache"))
+    prefix = os.environ.get("GREENBITE_DATASET_PREFIX", "")
+
+    for filename in filenames:
+        path = dataset_path(filename)
+        if os.path.exists(path):
+            continue
+        if backend is None:
+            print(f"⚠ {filename} is missing and no dataset storage is configured")
+            continue
+        fetch_dataset(backend, prefix + filename, path, cache_dir)
+
+
+def shard_of_titles(titles, count):
+    """ Shard index of every title; all case variants of a title land on the same shard. """
+    import numpy as np
+
+    return np.fromiter((zlib.crc32(str(title).lower().encode("utf-8")) % count for title in titles),
+                       dtype=np.int64, count=len(titles))
+
+
+def load_recipes(path, chunksize=100000, shard=None, source=0):
+    """
+    Load a recipes CSV (optionally gzipped) in chunks and rename columns to match our code.
+
+    With `shard` (index, count) only that partition of the rows is kept, plus a Source_Row
+    column (source file number << 32 | row) that orders rows the way the whole corpus would.
+    """
+    import pandas as pd
+
+    chunks = []
+    for chunk in pd.read_csv(
+        path,
+        compression="infer",
+        usecols=["title", "NER"],
+        dtype={"title": "string", "NER": "string"},
+        chunksize=chunksize  # Process 100,000 rows at a time
+    ):
+        if shard is not None:
+            keep = shard_of_titles(chunk["title"].values, shard[1]) == shard[0]
+            chunk = chunk[keep].assign(Source_Row=(source << 32) + chunk.index.values[keep])
+        chunks.append(chunk)
+
+    if not chunks:
+        return empty_recipes(with_source_rows=shard is not None)
+    recipes_df = pd.concat(chunks, ignore_index=True)
+    return recipes_df.rename(columns={
+        "title": "Title",
+        "NER": "Cleaned_Ingredients"
+    })
+
+
+def empty_recipes(with_source_rows=False):
+    """ A recipes frame with no rows (empty files, and shard coordinators that hold no recipes). """
+    import pandas as pd
+
+    columns = {"Title": pd.Series(dtype="string"), "Cleaned_Ingredients": pd.Series(dtype="string")}
+    if with_source_rows:
+        columns["Source_Row"] = pd.Series(dtype="int64")
+    return pd.DataFrame(columns)
+
+
+def load_emissions(path):
+    """ Load the emissions dataset columns used by the API: the product name and every emission category. """
+    import pandas as pd
+    from emissions import EMISSION_CATEGORIES
+
+    emissions_df = pd.read_csv(path, usecols=["Food product"] + EMISSION_CATEGORIES, dtype={"Food product": "string"})
+    # Same cleaning as load_emissions_data: non-numeric or missing values count as 0
+    for category in EMISSION_CATEGORIES:
+        emissions_df[category] = pd.to_numeric(emissions_df[category], errors="coerce").fillna(0)
+    return emissions_df
+
+
+def _file_signature(path):
+    """ Identify a source file by path, size and modification time. """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+class DatasetGeneration:
+    """ An immutable snapshot of the datasets and every structure derived from them. """
+
+    def __init__(self, number, recipes, emissions, ingredient_index, title_matcher, sources, timings=None, derived=None):
+        self.number = number
+        self.recipes = recipes
+        self.emissions = emissions
+        self.ingredient_index = ingredient_index
+        self.title_matcher = title_matcher
+        self.sources = sources  # {"recipes": path, "base": its signature, "deltas": [paths], "emissions": path, "shard", "compaction"}
+        self.timings = timings or {}  # Build phase -> seconds, reported by /readyz
+        self.created_at = time.time()
+        self._derived = dict(derived or {})  # Structures the builder already derived, e.g. an extended group index
+        self._derived_lock = threading.Lock()
+
+        # Content fingerprint so caches shared across processes can key on the generation
+        paths = [sources["recipes"], sources["emissions"]] + sources.get("deltas", [])
+        signatures = [_file_signature(path) for path in paths if path is not None]
+        if sources.get("shard") is not None:
+            signatures.append("shard=%d/%d" % tuple(sources["shard"]))
+        if sources.get("compaction") is not None:
+            signatures.append(f"compaction={sources['compaction']}")
+        self.fingerprint = hashlib.sha1("|".join(signatures).encode("utf-8")).hexdigest()[:16]
+
+    def derived(self, name, builder):
+        """ Build a structure derived from this generation once and memoize it on the generation. """
+        value = self._derived.get(name)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = builder(self)
+                    self._derived[name] = value
+        return value
+
+
+def _compact(recipes_df, compaction):
+    """ One row per canonical recipe (see recipe_groups) with a Count column; exact groups at 1.0. """
+    from recipe_groups import compact_recipes
+
+    return compact_recipes(recipes_df, near_duplicate=compaction if compaction < 1 else None)
+
+
+def _group_index(generation):
+    """ Hash index of a compacted generation's recipe groups, built when its first delta arrives. """
+    from recipe_groups import build_group_index
+
+    return build_group_index(generation.recipes)
+
+
+def build_generation(recipes_path, emissions_path, number=1, shard=None, compaction=None):
+    """
+    Load both datasets from disk and build a fresh generation.
+
+    `shard` (index, count) loads only that partition of the recipes; a recipes_path of
+    None builds an emissions-only generation for a shard coordinator. `compaction` (see
+    compaction_from_env) folds duplicate recipes into one counted row before indexing.
+    """
+    from recipe_index import build_ingredient_index
+    from title_search import build_title_matcher
+
+    print(f"📁 Recipes path: {recipes_path}")
+    print(f"📁 Emissions path: {emissions_path}")
+
+    # Verify files exist
+    if (recipes_path is not None and not os.path.exists(recipes_path)) or not os.path.exists(emissions_path):
+        raise Exception("Required dataset files not found. Please ensure datasets are in the datasets directory.")
+
+    timings = {}
+    started = time.perf_counter()
+
+    if recipes_path is None:
+        print("📥 Shard coordinator: recipes are served by the shard nodes")
+        recipes_df = empty_recipes()
+    else:
+        print("📥 Loading recipes dataset in chunks..." if shard is None else f"📥 Loading recipes shard {shard[0]}/{shard[1]} in chunks...")
+        recipes_df = load_recipes(recipes_path, shard=shard)
+    timings["load_recipes"] = round(time.perf_counter() - started, 3)
+
+    if compaction is not None and recipes_path is not None:
+        started = time.perf_counter()
+        print("📥 Grouping duplicate recipes...")
+        recipes_df = _compact(recipes_df, compaction)
+        timings["compaction"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    emissions_df = load_emissions(emissions_path)
+    timings["load_emissions"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    print("📥 Building ingredient index...")
+    ingredient_index = build_ingredient_index(recipes_df["Cleaned_Ingredients"])
+    timings["ingredient_index"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    print("📥 Precomputing title signatures...")
+    title_matcher = build_title_matcher(recipes_df["Title"])
+    timings["title_matcher"] = round(time.perf_counter() - started, 3)
+
+    sources = {"recipes": recipes_path, "base": _file_signature(recipes_path) if recipes_path is not None else None,
+               "deltas": [], "emissions": emissions_path, "shard": shard,
+               "compaction": compaction if recipes_path is not None else None}
+    return DatasetGeneration(number, recipes_df, emissions_df, ingredient_index, title_matcher, sources, timings)
+
+
+def extend_generation(base, delta_path=None, emissions_path=None, number=None):
+    """
+    Build the next generation from base by appending a delta recipes file and/or
+    reloading the emissions dataset. The base generation is not modified.
+    """
+    import pandas as pd
+    from recipe_groups import append_compacted
+    from recipe_index import extend_ingredient_index
+    from title_search import extend_title_matcher
+
+    recipes_df = base.recipes
+    ingredient_index = base.ingredient_index
+    title_matcher = base.title_matcher
+    sources = dict(base.sources, deltas=list(base.sources["deltas"]))
+    derived = {}
+
+    if delta_path:
+        if sources["recipes"] is None:
+            raise Exception("Recipe deltas are applied on the shard nodes, not the coordinator")
+        print(f"📥 Appending delta recipes from: {delta_path}")
+        delta_df = load_recipes(delta_path, shard=sources.get("shard"), source=len(sources["deltas"]) + 1)
+        recipes_df = pd.concat([base.recipes, delta_df], ignore_index=True)
+        if sources.get("compaction") is not None:
+            # Base rows stay canonical and in place; only the delta rows are grouped against them:
+            # duplicates raise the base counts, and the new groups are appended
+            compaction = sources["compaction"]
+            recipes_df, group_index = append_compacted(base.recipes, base.derived("recipe_groups", _group_index),
+                                                       delta_df, near_duplicate=compaction if compaction < 1 else None)
+            derived["recipe_groups"] = group_index
+            delta_df = recipes_df.iloc[len(base.recipes):]
+        ingredient_index = extend_ingredient_index(base.ingredient_index, delta_df["Cleaned_Ingredients"])
+        title_matcher = extend_title_matcher(base.title_matcher, delta_df["Title"], row_offset=len(base.recipes))
+        sources["deltas"].append(delta_path)
+
+    emissions_df = base.emissions
+    if emissions_path:
+        print(f"📥 Reloading emissions dataset from: {emissions_path}")
+        emissions_df = load_emissions(emissions_path)
+        sources["emissions"] = emissions_path
+
+    return DatasetGeneration(number or base.number + 1, recipes_df, emissions_df, ingredient_index, title_matcher, sources,
+                             derived=derived)
+
+
+# Currently served generation and swap listeners
+_current_generation = None
+_swap_lock = threading.Lock()
+_swap_listeners = []
+
+# Background reload bookkeeping
+_reload_lock = threading.Lock()
+_reload_status = {"state": "idle", "generation": None, "error": None, "started_at": None, "finished_at": None}
+
+
+def current_generation():
+    """ Return the generation new requests should use. """
+    return _current_generation
+
+
+def on_generation_swap(listener):
+    """ Register listener(new_generation, old_generation), called after every swap (cache invalidation, globals). """
+    _swap_listeners.append(listener)
+    return listener
+
+
+def swap_generation(generation):
+    """ Atomically publish a new generation; requests holding the old one keep using it. """
+    global _current_generation
+    with _swap_lock:
+        old_generation = _current_generation
+        _current_generation = generation
+        for listener in _swap_listeners:
+            try:
+                listener(generation, old_generation)
+            except Exception as e:
+                print(f"⚠ Generation swap listener failed: {str(e)}")
+
+    print(f"🔄 Serving dataset generation {generation.number} ({len(generation.recipes)} recipes)")
+    return old_generation
+
+
+def reload_status():
+    """ Return a copy of the background reload status. """
+    return dict(_reload_status)
+
+
+def _run_reload(builder):
+    try:
+        generation = builder()
+        swap_generation(generation)
+        _reload_status.update(state="idle", generation=generation.number, error=None, finished_at=time.time())
+    except Exception as e:
+        print(f"❌ Dataset reload error: {str(e)}")
+        _reload_status.update(state="failed", error=str(e), finished_at=time.time())
+    finally:
+        _reload_lock.release()
+
+
+def _reload_builder(base, full=False, delta_path=None, emissions_path=None, deltas=None):
+    """
+    Builder of the generation a reload produces from base: full=True (or no base) re-reads
+    the base recipes file and replays `deltas` (default: base's plus delta_path); otherwise
+    only the new delta file and/or emissions file are loaded on top of base.
+    """
+    if full or base is None:
+        sources = base.sources if base is not None else {}
+        recipes_path = sources.get("recipes", dataset_path(RECIPES_FILENAME))
+        emissions = emissions_path or sources.get("emissions", dataset_path(EMISSIONS_FILENAME))
+        if deltas is None:
+            deltas = list(sources.get("deltas", [])) + ([delta_path] if delta_path else [])
+        number = base.number + 1 if base is not None else 1
+
+        def builder():
+            generation = build_generation(recipes_path, emissions, number=number, shard=sources.get("shard", SHARD),
+                                          compaction=sources.get("compaction", COMPACTION))
+            for path in deltas:
+                generation = extend_generation(generation, delta_path=path, number=number)
+            return generation
+    else:
+        def builder():
+            return extend_generation(base, delta_path=delta_path, emissions_path=emissions_path)
+    return builder
+
+
+def start_reload(full=False, delta_path=None, emissions_path=None):
+    """
+    Build the next generation in a background thread and swap it in when ready.
+
+    full=True re-reads the base recipes file and replays previously applied deltas;
+    otherwise only the new delta file and/or emissions file are loaded on top of the
+    current generation. The reload is also appended to the shared reload log, so the
+    other workers serving this datasets directory apply it too.
+    Returns False if a reload is already running.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        return False
+
+    base = current_generation()
+    sources = base.sources if base is not None else {}
+    recipes_path = sources.get("recipes", dataset_path(RECIPES_FILENAME))
+    _log_reload({
+        "full": bool(full or base is None), "delta": delta_path, "emissions": emissions_path,
+        "base": _file_signature(recipes_path) if full and recipes_path is not None and os.path.exists(recipes_path)
+        else sources.get("base"),
+        "deltas": list(sources.get("deltas", [])) + ([delta_path] if delta_path else [])
+    })
+
+    _reload_status.update(state="running", error=None, started_at=time.time(), finished_at=None)
+    threading.Thread(target=_run_reload, args=(_reload_builder(base, full, delta_path, emissions_path),),
+                     name="dataset-reload", daemon=True).start()
+    return True
+
+
+# Shared reload log: one JSON line per /admin/reload on any worker, with the recipe deltas the
+# reloaded generation holds. Each worker polls it and converges on the latest entry, so a reload
+# reaches every worker (and workers forked later from a preloaded master catch up).
+_applied_reload_id = 0
+_poller_lock = threading.Lock()
+_poller_pid = None
+
+
+@contextlib.contextmanager
+def _reload_log_lock():
+    """ Hold an exclusive lock on the reload log so concurrent appends get distinct ids. """
+    if fcntl is None:
+        yield
+        return
+    with open(dataset_path(RELOAD_LOG_FILENAME) + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_reload_log(after_id=0):
+    """ Logged reloads with an id above after_id, oldest first (unreadable lines are skipped). """
+    entries = []
+    try:
+        with open(dataset_path(RELOAD_LOG_FILENAME)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and entry.get("id", 0) > after_id:
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _log_reload(entry):
+    """ Append a reload to the shared log (best effort: a worker that cannot write it still reloads itself). """
+    try:
+        with _reload_log_lock():
+            logged = _read_reload_log()
+            entry = dict(entry, id=logged[-1]["id"] + 1 if logged else 1, at=time.time())
+            with open(dataset_path(RELOAD_LOG_FILENAME), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"⚠ Warning: Could not log the reload for the other workers: {e}")
+
+
+def _catch_up_builder(base, entries):
+    """ Builder that brings base up to the last logged reload, or None if base already matches it. """
+    target = entries[-1]
+    newer = [entry for entry in entries if entry["at"] > base.created_at]
+    emissions_path = next((entry["emissions"] for entry in reversed(newer) if entry.get("emissions")), None)
+
+    # A coordinator holds no recipes; its shard nodes apply the deltas
+    deltas = list(target["deltas"]) if base.sources["recipes"] is not None else []
+    applied = base.sources["deltas"]
+    extends_base = target["base"] == base.sources.get("base") and deltas[:len(applied)] == applied
+    if not extends_base or any(entry["full"] for entry in newer):
+        if not newer:
+            return None  # Logged against an older recipes file than the one this worker loaded
+        return _reload_builder(base, full=True, emissions_path=emissions_path, deltas=deltas)
+
+    pending = deltas[len(applied):]
+    if not pending and emissions_path is None:
+        return None
+
+    def builder():
+        generation = base
+        for position, path in enumerate(pending or [None]):
+            generation = extend_generation(generation, delta_path=path, number=base.number + 1,
+                                           emissions_path=emissions_path if position == 0 else None)
+        return generation
+    return builder
+
+
+def apply_logged_reloads():
+    """
+    Apply the reloads other workers logged since the last check, synchronously.
+    Returns True if a new generation was swapped in.
+    """
+    global _applied_reload_id
+    base = current_generation()
+    if base is None or not _reload_lock.acquire(blocking=False):
+        return False  # Not loaded yet, or this worker is already reloading
+
+    entries = _read_reload_log(_applied_reload_id)
+    builder = None
+    if entries:
+        _applied_reload_id = entries[-1]["id"]
+        builder = _catch_up_builder(base, entries)
+    if builder is None:
+        _reload_lock.release()
+        return False
+
+    print(f"🔄 Applying reload {_applied_reload_id} logged by another worker")
+    _reload_status.update(state="running", error=None, started_at=time.time(), finished_at=None)
+    _run_reload(builder)
+    return current_generation() is not base
+
+
+def start_reload_poller():
+    """ Check the reload log every RELOAD_POLL_SECONDS, once per process (threads do not survive a fork). """
+    global _poller_pid
+    if RELOAD_POLL_SECONDS is None or _poller_pid == os.getpid():
+        return False
+    with _poller_lock:
+        if _poller_pid == os.getpid():
+            return False
+        _poller_pid = os.getpid()
+
+    def run():
+        while True:
+            try:
+                apply_logged_reloads()
+            except Exception as e:
+                print(f"⚠ Reload log check failed: {str(e)}")
+            time.sleep(RELOAD_POLL_SECONDS)
+
+    threading.Thread(target=run, name="reload-poller", daemon=True).start()
+    return True
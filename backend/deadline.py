@@ -0,0 +1,66 @@
+import os
+import time
+
+# Default per-endpoint latency budgets, well under the gunicorn worker timeouts (120s/300s)
+DEFAULT_BUDGETS_MS = {
+    "search": 10000,
+    "compare-dishes": 20000,
+    "rank-dishes": 30000,
+}
+MAX_BUDGET_MS = 60000
+
+
+class Deadline:
+    """ A request's latency budget; consumers check it and degrade instead of running on. """
+
+    def __init__(self, budget_seconds=None, parent=None):
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds if budget_seconds is not None else None
+        self.exhausted = False  # Set once any consumer gave up early because the budget ran out
+        self.parent = parent
+
+    def remaining(self):
+        """ Seconds left in the budget (None when unbounded). """
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        """ True once the budget is spent; marks the deadline (and its parent) exhausted for the caller to report. """
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.exhausted = True
+            if self.parent is not None:
+                self.parent.exhausted = True
+        return self.exhausted
+
+    def share(self, fraction):
+        """ A child deadline limited to a fraction of the time left, so one step cannot starve the rest. """
+        remaining = self.remaining()
+        return Deadline(remaining * fraction if remaining is not None else None, parent=self)
+
+
+def budget_ms_for(endpoint):
+    """ Budget for an endpoint from GREENBITE_<ENDPOINT>_BUDGET_MS, else the default. """
+    env_name = f"GREENBITE_{endpoint.upper().replace('-', '_')}_BUDGET_MS"
+    try:
+        return int(os.environ.get(env_name, DEFAULT_BUDGETS_MS.get(endpoint, 0)))
+    except ValueError:
+        print(f"⚠ Warning: Invalid {env_name}, using default budget")
+        return DEFAULT_BUDGETS_MS.get(endpoint, 0)
+
+
+def effective_budget_ms(endpoint, requested_ms=None):
+    """ The budget a request gets: the client's (capped at MAX_BUDGET_MS) if valid, else the endpoint's. """
+    budget_ms = budget_ms_for(endpoint)
+    if requested_ms is not None:
+        try:
+            budget_ms = min(max(int(requested_ms), 1), MAX_BUDGET_MS)
+        except (TypeError, ValueError):
+            pass
+    return budget_ms
+
+
+def deadline_for(endpoint, requested_ms=None):
+    """ Build a Deadline for an endpoint; a client may ask for a tighter (or up to MAX_BUDGET_MS) budget. """
+    budget_ms = effective_budget_ms(endpoint, requested_ms)
+    return Deadline(budget_ms / 1000.0 if budget_ms > 0 else None)
@@ -1,5 +1,5 @@
 import pandas as pd
-from thefuzz import process
+from thefuzz import fuzz, process
 
 def load_emissions_data(filepath):
     """ Load emissions dataset from CSV file safely. """
@@ -32,6 +32,102 @@ def load_emissions_data(filepath):
         print(f"❌ Error loading emissions data: {str(e)}")
         return None
 
+# Expanded ingredient mappings with exact matches
+INGREDIENT_MAPPINGS = {
+    # Meats
+    "hamburger": "beef (beef herd)",
+    "beef": "beef (beef herd)",
+    "ground beef": "beef (beef herd)",
+    "steak": "beef (beef herd)",
+    "chicken": "poultry meat",
+    "poultry": "poultry meat",
+    "pork": "pig meat",
+    "bacon": "pig meat",
+    "lamb": "lamb & mutton",
+    "mutton": "lamb & mutton",
+    
+    # Dairy
+    "cheese": "cheese",
+    "cheddar": "cheese",
+    "mozzarella": "cheese",
+    "parmesan": "cheese",
+    "milk": "milk",
+    "cream": "milk",
+    "yogurt": "milk",
+    
+    # Vegetables
+    "onion": "onions & leeks",
+    "leek": "onions & leeks",
+    "tomato": "tomatoes",
+    "tomato sauce": "tomatoes",
+    "ketchup": "tomatoes",
+    "potato": "potatoes",
+    "carrot": "root vegetables",
+    "beet": "root vegetables",
+    "peas": "peas",
+    "beans": "other pulses",
+    "lentils": "other pulses",
+    
+    # Grains
+    "rice": "rice",
+    "wheat": "wheat & rye",
+    "rye": "wheat & rye",
+    "oats": "oatmeal",
+    "rolled oats": "oatmeal",
+    "barley": "barley",
+    "corn": "maize",
+    "maize": "maize",
+    
+    # Fruits
+    "apple": "apples",
+    "banana": "bananas",
+    "orange": "citrus fruit",
+    "lemon": "citrus fruit",
+    "grape": "berries & grapes",
+    "berry": "berries & grapes",
+    
+    # Other
+    "egg": "eggs",
+    "eggs": "eggs",
+    "egg whites": "eggs",
+    "egg whites whls": "eggs",
+    "water": "water",
+    "chili": "other vegetables",
+    "chili powder": "other vegetables",
+    "tabasco": "other vegetables",
+    "tabasco sauce": "other vegetables",
+    "onion soup": "onions & leeks",
+    "onion soup mix": "onions & leeks",
+    "onion soup mix adjust": "onions & leeks",
+    "sugar": "beet sugar",
+    "brown sugar": "beet sugar",
+    "white sugar": "beet sugar",
+    "coffee": "coffee",
+    "chocolate": "dark chocolate",
+    "cocoa": "dark chocolate"
+}
+
+EMISSION_CATEGORIES = [
+    "Land Use Change", "Feed", "Farm", "Processing", "Transport", "Packaging", "Retail",
+    "Total from Land to Retail", "Total Global Average GHG Emissions per kg"
+]
+
+# Offline-built cleaned ingredient -> (food product, tier, confidence) table, see ingredient_resolution.py
+RESOLUTION_TABLE = None
+
+# Shared cache (get/set by cleaned ingredient) for live resolutions of strings missing from the table
+RESOLUTION_CACHE = None
+
+def set_resolution_table(table):
+    """ Install (or clear with None) the prebuilt ingredient resolution table. """
+    global RESOLUTION_TABLE
+    RESOLUTION_TABLE = table
+
+def set_resolution_cache(cache):
+    """ Install (or clear with None) the cache consulted before live resolution. """
+    global RESOLUTION_CACHE
+    RESOLUTION_CACHE = cache
+
 def clean_ingredient(ingredient):
     """ Standardize ingredient formatting. """
     # Remove brackets, quotes, and extra spaces
@@ -45,8 +141,35 @@ def clean_ingredient(ingredient):
     
     return cleaned
 
-def match_ingredients_with_emissions(ingredients, emissions_dataset):
-    """ Match ingredients with emissions dataset using fuzzy matching. """
+def resolve_ingredient(cleaned_ingredient, food_products, allow_fuzzy=True):
+    """ Resolve a cleaned ingredient to (food product, tier, confidence) via the mapping, exact, substring and fuzzy tiers. """
+    # Try mapping first
+    mapped_ingredient = INGREDIENT_MAPPINGS.get(cleaned_ingredient, cleaned_ingredient)
+
+    # Try exact match first
+    for product in food_products:
+        if mapped_ingredient == product:
+            return product, "mapping" if mapped_ingredient != cleaned_ingredient else "exact", 100
+
+    # Try partial match
+    for product in food_products:
+        if mapped_ingredient in product or product in mapped_ingredient:
+            return product, "substring", fuzz.ratio(mapped_ingredient, product)
+
+    if allow_fuzzy:
+        # Try fuzzy matching with lower threshold (70%)
+        match = process.extractOne(mapped_ingredient, food_products)
+        if match and match[1] >= 70:
+            return match[0], "fuzzy", match[1]
+
+    return None, "none", 0
+
+def match_ingredients_with_emissions(ingredients, emissions_dataset, deadline=None, resolution_table=None):
+    """ Match ingredients with emissions dataset using fuzzy matching.
+
+    Ingredients found in the prebuilt resolution table are a plain lookup. Once
+    `deadline` expires, the fuzzy tier is skipped for the remaining live matches.
+    """
     if emissions_dataset is None:
         print("❌ Error: Emissions dataset not loaded.")
         return {}
@@ -58,140 +181,44 @@ def match_ingredients_with_emissions(ingredients, emissions_dataset):
     matched_ingredients = {}
     food_products = emissions_dataset["Food product"].str.lower().values
 
-    # Expanded ingredient mappings with exact matches
-    ingredient_mappings = {
-        # Meats
-        "hamburger": "beef (beef herd)",
-        "beef": "beef (beef herd)",
-        "ground beef": "beef (beef herd)",
-        "steak": "beef (beef herd)",
-        "chicken": "poultry meat",
-        "poultry": "poultry meat",
-        "pork": "pig meat",
-        "bacon": "pig meat",
-        "lamb": "lamb & mutton",
-        "mutton": "lamb & mutton",
-        
-        # Dairy
-        "cheese": "cheese",
-        "cheddar": "cheese",
-        "mozzarella": "cheese",
-        "parmesan": "cheese",
-        "milk": "milk",
-        "cream": "milk",
-        "yogurt": "milk",
-        
-        # Vegetables
-        "onion": "onions & leeks",
-        "leek": "onions & leeks",
-        "tomato": "tomatoes",
-        "tomato sauce": "tomatoes",
-        "ketchup": "tomatoes",
-        "potato": "potatoes",
-        "carrot": "root vegetables",
-        "beet": "root vegetables",
-        "peas": "peas",
-        "beans": "other pulses",
-        "lentils": "other pulses",
-        
-        # Grains
-        "rice": "rice",
-        "wheat": "wheat & rye",
-        "rye": "wheat & rye",
-        "oats": "oatmeal",
-        "rolled oats": "oatmeal",
-        "barley": "barley",
-        "corn": "maize",
-        "maize": "maize",
-        
-        # Fruits
-        "apple": "apples",
-        "banana": "bananas",
-        "orange": "citrus fruit",
-        "lemon": "citrus fruit",
-        "grape": "berries & grapes",
-        "berry": "berries & grapes",
-        
-        # Other
-        "egg": "eggs",
-        "eggs": "eggs",
-        "egg whites": "eggs",
-        "egg whites whls": "eggs",
-        "water": "water",
-        "chili": "other vegetables",
-        "chili powder": "other vegetables",
-        "tabasco": "other vegetables",
-        "tabasco sauce": "other vegetables",
-        "onion soup": "onions & leeks",
-        "onion soup mix": "onions & leeks",
-        "onion soup mix adjust": "onions & leeks",
-        "sugar": "beet sugar",
-        "brown sugar": "beet sugar",
-        "white sugar": "beet sugar",
-        "coffee": "coffee",
-        "chocolate": "dark chocolate",
-        "cocoa": "dark chocolate"
-    }
+    # First row of each product, keyed by its lowercase name
+    product_rows = {}
+    for position, product in enumerate(food_products):
+        product_rows.setdefault(product, position)
+
+    table = RESOLUTION_TABLE if resolution_table is None else resolution_table
 
     for ingredient in ingredients:
         cleaned_ingredient = clean_ingredient(ingredient).lower()
-        
-        # Try mapping first
-        mapped_ingredient = ingredient_mappings.get(cleaned_ingredient, cleaned_ingredient)
-        
-        # Try exact match first
-        exact_match = None
-        for product in food_products:
-            if mapped_ingredient == product:
-                exact_match = product
-                break
-
-        if not exact_match:
-            # Try partial match
-            for product in food_products:
-                if mapped_ingredient in product or product in mapped_ingredient:
-                    exact_match = product
-                    break
-
-        if not exact_match:
-            # Try fuzzy matching with lower threshold (70%)
-            match = process.extractOne(mapped_ingredient, food_products)
-            if match and match[1] >= 70:
-                exact_match = match[0]
+
+        # Prebuilt table first; strings it has never seen go through the live matcher
+        entry = table.get(cleaned_ingredient) if table else None
+        if entry is None and RESOLUTION_CACHE is not None:
+            entry = RESOLUTION_CACHE.get(cleaned_ingredient)
+        if entry is not None and (entry[0] is None or entry[0] in product_rows):
+            exact_match = entry[0]
+        else:
+            allow_fuzzy = not (deadline is not None and deadline.expired())
+            resolved = resolve_ingredient(cleaned_ingredient, food_products, allow_fuzzy=allow_fuzzy)
+            exact_match = resolved[0]
+            if allow_fuzzy and RESOLUTION_CACHE is not None:
+                RESOLUTION_CACHE.set(cleaned_ingredient, list(resolved))  # Only complete resolutions are shared
 
         if exact_match:
             # Find the original case version of the match
-            original_match = emissions_dataset.loc[emissions_dataset["Food product"].str.lower() == exact_match, "Food product"].iloc[0]
-            matched_data = emissions_dataset.loc[emissions_dataset["Food product"] == original_match].iloc[0]
-            
+            matched_data = emissions_dataset.iloc[product_rows[exact_match]]
+            original_match = matched_data["Food product"]
+
             # Store the matched ingredient with its emissions data
             matched_ingredients[ingredient] = {
-                "Land Use Change": float(matched_data.get("Land Use Change", 0) or 0),
-                "Feed": float(matched_data.get("Feed", 0) or 0),
-                "Farm": float(matched_data.get("Farm", 0) or 0),
-                "Processing": float(matched_data.get("Processing", 0) or 0),
-                "Transport": float(matched_data.get("Transport", 0) or 0),
-                "Packaging": float(matched_data.get("Packaging", 0) or 0),
-                "Retail": float(matched_data.get("Retail", 0) or 0),
-                "Total from Land to Retail": float(matched_data.get("Total from Land to Retail", 0) or 0),
-                "Total Global Average GHG Emissions per kg": float(matched_data.get("Total Global Average GHG Emissions per kg", 0) or 0)
+                category: float(matched_data.get(category, 0) or 0) for category in EMISSION_CATEGORIES
             }
-            
+
             print(f"✅ Matched '{ingredient}' to '{original_match}' with emissions: {matched_ingredients[ingredient]['Total Global Average GHG Emissions per kg']}")
         else:
             print(f"❌ No match found for ingredient: {ingredient}")
             # Add default values for unmatched ingredients
-            matched_ingredients[ingredient] = {
-                "Land Use Change": 0,
-                "Feed": 0,
-                "Farm": 0,
-                "Processing": 0,
-                "Transport": 0,
-                "Packaging": 0,
-                "Retail": 0,
-                "Total from Land to Retail": 0,
-                "Total Global Average GHG Emissions per kg": 0
-            }
+            matched_ingredients[ingredient] = {category: 0 for category in EMISSION_CATEGORIES}
 
     return matched_ingredients
 
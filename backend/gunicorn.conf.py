@@ -2,7 +2,7 @@ import multiprocessing
 
 # Gunicorn config variables
 workers = 1  # Keep only one worker to reduce memory usage
-threads = 2
+threads = 8  # Admission control (admission.py) limits how many of these do fuzzy work at once
 timeout = 300  # Increased timeout for dataset loading
 keepalive = 5
 max_requests = 1000
@@ -18,4 +18,13 @@ max_requests_jitter = 50  # Add some randomness to prevent all workers from rest
 worker_connections = 1000
 limit_request_line = 4094
 limit_request_fields = 100
-limit_request_field_size = 8190
\ No newline at end of file
+limit_request_field_size = 8190
+
+
+def post_fork(server, worker):
+    """Start background dataset loading in each worker (GREENBITE_BACKGROUND_LOAD=1), else follow logged reloads."""
+    import main
+    if main.BACKGROUND_LOAD:
+        main.start_background_load()
+    elif main.dataset_store.current_generation() is not None:
+        main.dataset_store.start_reload_poller()
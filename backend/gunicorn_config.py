@@ -7,8 +7,8 @@ workers = 2  # Reduced from default to save memory
 # Worker class
 worker_class = "gthread"
 
-# Threads per worker
-threads = 2
+# Threads per worker (admission.py limits how many run fuzzy searches at once; the rest wait or get a fast 503)
+threads = 8
 
 # Maximum requests per worker before restart
 max_requests = 1000
@@ -38,4 +38,13 @@ worker_timeout = 120
 # Worker memory management
 worker_connections = 1000
 worker_class = "gthread"
-threads = 2 
\ No newline at end of file
+threads = 8
+
+
+def post_fork(server, worker):
+    """Start background dataset loading in each worker (GREENBITE_BACKGROUND_LOAD=1), else follow logged reloads."""
+    import main
+    if main.BACKGROUND_LOAD:
+        main.start_background_load()
+    elif main.dataset_store.current_generation() is not None:
+        main.dataset_store.start_reload_poller()
@@ -0,0 +1,129 @@
+"""
+Offline ingredient -> emissions resolution table.
+
+Every distinct ingredient string in the recipes corpus is resolved once through the
+mapping, exact, substring and fuzzy tiers (in parallel across processes) and saved with
+its match tier and confidence. The API then resolves known ingredients with a dict
+lookup and only runs the live matcher for strings the table has never seen.
+
+Usage:
+    python ingredient_resolution.py                      # datasets dir -> ingredient_resolution.json.gz
+    python ingredient_resolution.py --workers 8 --recipes path/to/recipes.csv.gz
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import dataset_store
+from emissions import clean_ingredient, resolve_ingredient
+from recipe_index import parse_ingredient_list
+
+_worker_products = None
+
+
+def products_signature(emissions_dataset):
+    """ Identify the food product list a table was resolved against. """
+    products = sorted(emissions_dataset["Food product"].dropna().str.lower().unique())
+    return hashlib.sha1("\n".join(products).encode("utf-8")).hexdigest()
+
+
+def corpus_ingredients(ingredient_column):
+    """ Every distinct cleaned ingredient string the API can see for this corpus. """
+    ingredients = set()
+    for raw in ingredient_column:
+        if not isinstance(raw, str) or not raw:
+            continue
+        # /compare-dishes splits the raw cell; /search returns regex-cleaned names that clients post back
+        ingredients.update(clean_ingredient(piece).lower() for piece in raw.split(","))
+        ingredients.update(clean_ingredient(name).lower() for name in parse_ingredient_list(raw))
+    ingredients.discard("")
+    return ingredients
+
+
+def _init_worker(food_products):
+    global _worker_products
+    _worker_products = food_products
+
+
+def _resolve_chunk(ingredients):
+    return [(ingredient,) + resolve_ingredient(ingredient, _worker_products) for ingredient in ingredients]
+
+
+def build_resolution_table(ingredients, emissions_dataset, workers=None, chunk_size=2000):
+    """ Resolve every ingredient through all tiers; returns {ingredient: (product, tier, confidence)}. """
+    food_products = emissions_dataset["Food product"].str.lower().values
+    ingredients = sorted(ingredients)
+    chunks = [ingredients[start:start + chunk_size] for start in range(0, len(ingredients), chunk_size)]
+
+    table = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(food_products,)) as pool:
+        for resolved in pool.map(_resolve_chunk, chunks):
+            for ingredient, product, tier, confidence in resolved:
+                table[ingredient] = (product, tier, int(confidence))
+    return table
+
+
+def save_resolution_table(table, emissions_dataset, path):
+    """ Write the table as gzipped JSON, tagged with the product list it was resolved against. """
+    document = {
+        "products_sha1": products_signature(emissions_dataset),
+        "built_at": time.time(),
+        "entries": {ingredient: list(entry) for ingredient, entry in table.items()}
+    }
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(document, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_resolution_table(path, emissions_dataset):
+    """ Load a saved table, or None when it is missing or was built against other food products. """
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            document = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠ Warning: Could not read ingredient resolution table: {e}")
+        return None
+
+    if document.get("products_sha1") != products_signature(emissions_dataset):
+        print("⚠ Ingredient resolution table was built for a different emissions dataset, ignoring it")
+        return None
+
+    table = {ingredient: tuple(entry) for ingredient, entry in document["entries"].items()}
+    print(f"✅ Ingredient resolution table loaded: {len(table)} ingredients")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve every corpus ingredient to an emissions row ahead of time.")
+    parser.add_argument("--recipes", default=dataset_store.dataset_path(dataset_store.RECIPES_FILENAME))
+    parser.add_argument("--emissions", default=dataset_store.dataset_path(dataset_store.EMISSIONS_FILENAME))
+    parser.add_argument("--output", default=dataset_store.dataset_path(dataset_store.RESOLUTION_FILENAME))
+    parser.add_argument("--workers", type=int, default=None, help="Resolver processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    recipes = dataset_store.load_recipes(args.recipes)
+    emissions_dataset = dataset_store.load_emissions(args.emissions)
+    ingredients = corpus_ingredients(recipes["Cleaned_Ingredients"].values)
+    print(f"📥 {len(ingredients)} distinct ingredients in {len(recipes)} recipes")
+
+    table = build_resolution_table(ingredients, emissions_dataset, args.workers, args.chunk_size)
+    save_resolution_table(table, emissions_dataset, args.output)
+
+    tiers = {}
+    for _, tier, _ in table.values():
+        tiers[tier] = tiers.get(tier, 0) + 1
+    print(f"📊 Match tiers: {tiers}")
+    print(f"✅ Resolution table written to {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
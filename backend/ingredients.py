@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from thefuzz import process
 import re
@@ -32,13 +33,28 @@ def load_dataset(file_path):
     """Load a dataset from a CSV file."""
     return pd.read_csv(file_path)
 
+# Title-vocabulary typo corrector (spelling.SpellCorrector) for the current dataset generation
+SPELL_CORRECTOR = None
+
+# Words of the synonym map are never "corrected" away before the synonym lookup
+_SYNONYM_WORDS = {word for key, values in synonym_map.items()
+                  for phrase in [key] + (values if isinstance(values, list) else [values]) for word in phrase.lower().split()}
+
+def set_spell_corrector(corrector):
+    """Install (or clear with None) the spell corrector applied by normalize_input."""
+    global SPELL_CORRECTOR
+    SPELL_CORRECTOR = corrector
+
 def normalize_input(dish_name):
-    """Normalize input dish name using synonyms."""
+    """Normalize input dish name: correct misspelled words, then apply synonyms."""
     words = dish_name.lower().split()
     normalized_words = []
+    corrector = SPELL_CORRECTOR
 
     # Normalize each word based on synonym map
     for word in words:
+        if corrector is not None and word not in _SYNONYM_WORDS:
+            word = corrector.correct(word)
         normalized_word = word
         # Check if word has a synonym in the map and replace it
         for key, values in synonym_map.items():
@@ -49,28 +65,67 @@ def normalize_input(dish_name):
 
     return " ".join(normalized_words)
 
-def extract_ingredients(dish_name, dataset, threshold=80):
-    """Extract multiple recipe options and their ingredients using fuzzy matching."""
+def _extract_within_deadline(dish_name, titles, deadline, limit=5, chunk_size=50000):
+    """Run process.extract chunk by chunk, keeping the best matches seen before the deadline."""
+    matches = []
+    for start in range(0, len(titles), chunk_size):
+        if deadline.expired():
+            print(f"⏱ Title search budget exhausted after {start} of {len(titles)} titles")
+            break
+        matches.extend(process.extract(dish_name, titles[start:start + chunk_size], limit=limit))
+        matches = sorted(matches, key=lambda match: match[1], reverse=True)[:limit]
+    return matches
+
+def clean_ingredients(raw):
+    """Split a Cleaned_Ingredients cell into lowercase ingredient names (None for empty cells)."""
+    if not isinstance(raw, str) or not raw:
+        return None
+    raw = re.sub(r'[^\w\s,]', '', raw)  # Remove special characters
+    return [ingredient.strip().lower() for ingredient in raw.split(',')]
+
+def match_recipe_titles(dish_name, dataset, threshold=80, matcher=None, deadline=None):
+    """Fuzzy-match a dish name to up to 5 recipe titles; returns (title, title id, row positions) triples.
+
+    The title id indexes the TitleMatcher (None without one). With a `deadline`, the
+    search stops when the budget runs out and returns what it found so far (the
+    deadline is then marked exhausted).
+    """
     dish_name = normalize_input(dish_name)
 
-    # Fuzzy matching
-    matches = process.extract(dish_name, dataset["Title"].values, limit=5)
-    best_matches = [match[0] for match in matches if match[1] >= threshold]
+    # Fuzzy matching; a TitleMatcher skips titles that cannot reach the threshold
+    if matcher is not None:
+        matches = matcher.extract(dish_name, limit=5, score_cutoff=threshold, deadline=deadline)
+        return [(match[0], match[2], matcher.rows_for(match[2])) for match in matches]
+
+    titles = dataset["Title"].values
+    if deadline is not None:
+        matches = _extract_within_deadline(dish_name, titles, deadline)
+    else:
+        matches = process.extract(dish_name, titles, limit=5)
+    return [(match[0], None, np.flatnonzero(titles == match[0])) for match in matches if match[1] >= threshold]
 
-    all_ingredients = []
-    matched_titles = []
+def extract_recipe_rows(dish_name, dataset, threshold=80, matcher=None, deadline=None):
+    """Fuzzy-match a dish name to recipe titles; returns (title, row position) pairs in match order."""
+    best_matches = [(title, rows) for title, _, rows in match_recipe_titles(dish_name, dataset, threshold, matcher, deadline)]
 
-    for best_match in best_matches:
-        matched_rows = dataset.loc[dataset["Title"] == best_match]
+    ingredients_column = dataset["Cleaned_Ingredients"].values
+    matched_rows = []
 
-        for _, row in matched_rows.iterrows():
-            ingredients = row["Cleaned_Ingredients"]  # Using the renamed column
-            if isinstance(ingredients, str) and ingredients:
-                # Clean ingredients
-                ingredients = re.sub(r'[^\w\s,]', '', ingredients)  # Remove special characters
-                cleaned_ingredients = [ingredient.strip().lower() for ingredient in ingredients.split(',')]
+    for best_match, row_positions in best_matches:
+        if matched_rows and deadline is not None and deadline.expired():
+            break
 
-                all_ingredients.append(cleaned_ingredients)
-                matched_titles.append(best_match)
+        for position in row_positions.tolist():
+            raw = ingredients_column[position]  # Using the renamed column
+            if isinstance(raw, str) and raw:
+                matched_rows.append((best_match, position))
 
+    return matched_rows
+
+def extract_ingredients(dish_name, dataset, threshold=80, matcher=None, deadline=None):
+    """Extract multiple recipe options and their ingredients using fuzzy matching."""
+    matched_rows = extract_recipe_rows(dish_name, dataset, threshold, matcher=matcher, deadline=deadline)
+    ingredients_column = dataset["Cleaned_Ingredients"].values
+    all_ingredients = [clean_ingredients(ingredients_column[position]) for _, position in matched_rows]
+    matched_titles = [title for title, _ in matched_rows]
     return all_ingredients, matched_titles
@@ -1,19 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import pandas as pd
+import base64
+import itertools
+import json
 import re
 import os
-from thefuzz import process
-from ingredients import extract_ingredients, load_dataset
-from emissions import load_emissions_data, match_ingredients_with_emissions, calculate_total_impact, calculate_emissions_equivalence, calculate_sustainability_score
-from sustainability import get_sustainability_score
-from sustainability_comparison import compare_sustainability
-from google.cloud import storage
-import tempfile
-import requests
-from io import BytesIO
-import gzip
+import sys
+import threading
 import time
+from functools import lru_cache
+import dataset_store
+from admission import admission_metrics, admission_snapshot, install_admission_control, run_admitted
+from deadline import deadline_for, effective_budget_ms
+from persistent_cache import GenerationCacheView, cache_version, persistent_cache_from_env
+from popularity import query_popularity_from_env
+from singleflight import single_flight_from_env
+from metrics import register_collector, render_prometheus
+from model_scoring import model_scorer_from_env
+from memory_report import memory_report, register_memory_source, spell_corrector_bytes
+from profiling import install_profiling
+from responses import bytes_response, dumps, json_response, requested_fields, select_fields
+from shards import shard_coordinator_from_env
 
 app = Flask(__name__)
 
@@ -35,88 +42,460 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
-def download_from_gcs(bucket_name, source_blob_name, destination_file_name):
-    """Downloads a blob from the bucket."""
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(source_blob_name)
-    blob.download_to_filename(destination_file_name)
-    print(f"Downloaded {source_blob_name} to {destination_file_name}")
-
-# Load datasets with error handling
-try:
-    # Get the absolute path to the datasets directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    datasets_dir = os.path.join(os.path.dirname(current_dir), 'datasets')
-    
-    # Create datasets directory if it doesn't exist
-    os.makedirs(datasets_dir, exist_ok=True)
-    
-    # Define dataset paths
-    recipes_path = os.path.join(datasets_dir, 'filtered_recipes_1m.csv.gz')
-    emissions_path = os.path.join(datasets_dir, 'Food_Product_Emissions.csv')
-    
-    print(f"📁 Loading datasets from: {datasets_dir}")
-    print(f"📁 Recipes path: {recipes_path}")
-    print(f"📁 Emissions path: {emissions_path}")
-    
-    # Verify files exist
-    if not os.path.exists(recipes_path) or not os.path.exists(emissions_path):
-        raise Exception("Required dataset files not found. Please ensure datasets are in the datasets directory.")
-    
-    # Load recipes dataset in chunks
-    print("📥 Loading recipes dataset in chunks...")
-    chunks = []
-    for chunk in pd.read_csv(
-        recipes_path,
-        compression='gzip',
-        usecols=['title', 'NER'],
-        dtype={'title': 'string', 'NER': 'string'},
-        chunksize=100000  # Process 100,000 rows at a time
-    ):
-        chunks.append(chunk)
-    
-    # Combine all chunks
-    recipes_df = pd.concat(chunks, ignore_index=True)
-    
-    # Rename columns to match our code
-    recipes_df = recipes_df.rename(columns={
-        'title': 'Title',
-        'NER': 'Cleaned_Ingredients'
-    })
-    
-    # Load emissions dataset
-    emissions_df = pd.read_csv(
-        emissions_path,
-        usecols=['Food product', 'Total_emissions'],
-        dtype={'Food product': 'string', 'Total_emissions': 'float32'}
-    )
-    
-    print("✅ Successfully loaded both datasets")
-    print(f"📊 Recipes dataset columns: {recipes_df.columns.tolist()}")
-    print(f"📊 Emissions dataset columns: {emissions_df.columns.tolist()}")
-    print(f"📊 Total recipes loaded: {len(recipes_df)}")
-    
-    # Print sample data to verify
-    print("Sample recipe titles:", recipes_df['Title'].head().tolist())
-    print("Sample emissions data:", emissions_df.head().to_dict('records'))
-    
-except Exception as e:
-    print(f"❌ Dataset loading error: {str(e)}")
-    raise
-
-# Global variables to store the datasets
-RECIPES_DATASET = recipes_df
-EMISSIONS_DATASET = emissions_df
+def _is_admin_request():
+    """Check the admin token header against GREENBITE_ADMIN_TOKEN (admin routes are off when unset)."""
+    admin_token = os.environ.get("GREENBITE_ADMIN_TOKEN")
+    return bool(admin_token) and request.headers.get("X-Admin-Token") == admin_token
+
+# Opt-in request profiling (X-Profile header on admin requests, or GREENBITE_PROFILE_SAMPLE_RATE)
+install_profiling(app, _is_admin_request)
+
+# Concurrency limits and load shedding for the expensive (fuzzy) and cheap (emissions) endpoints
+install_admission_control(app)
+register_collector(admission_metrics)
+
+# GREENBITE_MODEL_SCORING=on adds the trained model's "model_score" to /predict, /compare-dishes and /substitute.
+# It is unpickled here, at import, so with preload_app every worker shares the master's copy.
+MODEL_SCORER = model_scorer_from_env()
+
+# Global variables to store the datasets (rebound on every generation swap)
+RECIPES_DATASET = None
+EMISSIONS_DATASET = None
+RECIPE_INDEX = None
+
+def _import_heavy_modules():
+    """Import the pandas/thefuzz-backed modules; deferred so the app can bind before paying for them."""
+    global extract_ingredients, normalize_input, parse_ingredient_list, rank_recipes_by_emissions
+    global match_ingredients_with_emissions, calculate_total_impact, calculate_emissions_equivalence
+    global calculate_sustainability_score, get_sustainability_score, sustainability, emissions_module
+    global match_recipe_titles, clean_ingredients, set_resolution_table, set_resolution_cache, load_resolution_table
+    global score_ingredients, resolve_dish, resolve_dish_match, resolve_dishes, score_recipe, score_recipes
+    global parse_edits, score_substitutions
+    global ingredients_module, build_spell_corrector, spell_corrector_from_counts
+    from ingredients import extract_ingredients, match_recipe_titles, clean_ingredients, normalize_input
+    from recipe_index import parse_ingredient_list, rank_recipes_by_emissions
+    from emissions import match_ingredients_with_emissions, calculate_total_impact, calculate_emissions_equivalence, calculate_sustainability_score
+    from emissions import set_resolution_table, set_resolution_cache
+    from ingredient_resolution import load_resolution_table
+    from sustainability import get_sustainability_score
+    from scoring import score_ingredients, resolve_dish, resolve_dish_match, resolve_dishes, score_recipe, score_recipes
+    from scoring import parse_edits, score_substitutions
+    from spelling import build_spell_corrector, spell_corrector_from_counts
+    import sustainability
+    import emissions as emissions_module
+    import ingredients as ingredients_module
+    import scoring
+    scoring.set_model_scorer(MODEL_SCORER)
+
+@dataset_store.on_generation_swap
+def _activate_generation(generation, old_generation):
+    """Point the module-level dataset references at a newly built generation."""
+    global RECIPES_DATASET, EMISSIONS_DATASET, RECIPE_INDEX
+    RECIPES_DATASET = generation.recipes
+    EMISSIONS_DATASET = generation.emissions
+    RECIPE_INDEX = generation.ingredient_index
+
+    # Scoring keeps its own full copy of the emissions table; refresh it when emissions change
+    if old_generation is None or generation.emissions is not old_generation.emissions:
+        sustainability.load_emissions_dataset(generation.sources["emissions"])
+
+        # Prebuilt ingredient resolutions only apply to the food products they were resolved against
+        set_resolution_table(load_resolution_table(
+            dataset_store.dataset_path(dataset_store.RESOLUTION_FILENAME), generation.emissions
+        ))
+
+    # Query words are corrected against this generation's title vocabulary (GREENBITE_SPELLING=off disables it);
+    # a coordinator holds no titles and uses the vocabulary merged from every shard instead
+    if SPELLING and SHARD_COORDINATOR is not None:
+        threading.Thread(target=_load_shard_vocabulary, name="shard-vocabulary", daemon=True).start()
+    elif SPELLING:
+        ingredients_module.set_spell_corrector(
+            generation.derived("spell_corrector", lambda generation: build_spell_corrector(generation.title_matcher))
+        )
+
+    # Live ingredient resolutions are shared through the persistent cache, per generation
+    if PERSISTENT_CACHE is not None:
+        set_resolution_cache(GenerationCacheView(PERSISTENT_CACHE, "ingredient", _cache_generation(generation)))
+
+SPELLING = os.environ.get("GREENBITE_SPELLING", "on").lower() not in ("0", "off", "false", "no")
+SHARD_VOCABULARY_RETRY_SECONDS = 5.0
+
+def _load_shard_vocabulary():
+    """Build a coordinator's spell corrector from the shards' merged title vocabularies, retrying until all answer."""
+    while True:
+        words = SHARD_COORDINATOR.vocabulary()
+        if words is not None:
+            ingredients_module.set_spell_corrector(spell_corrector_from_counts(words))
+            return
+        print(f"⚠ Shard vocabularies incomplete, retrying in {SHARD_VOCABULARY_RETRY_SECONDS:.0f}s")
+        time.sleep(SHARD_VOCABULARY_RETRY_SECONDS)
+
+# Host-local SQLite cache shared by all workers, so cached results survive worker recycling
+PERSISTENT_CACHE = persistent_cache_from_env()
+if PERSISTENT_CACHE is not None:
+    register_collector(PERSISTENT_CACHE.metrics)
+
+# Cached results also depend on the matching code and settings, not just the data: entries are
+# keyed by the generation fingerprint plus a digest of these modules and the settings below
+# (GREENBITE_CODE_VERSION, e.g. a release id, adds to it)
+CACHE_CODE_MODULES = ("main.py", "ingredients.py", "title_search.py", "spelling.py", "emissions.py",
+                      "ingredient_resolution.py", "recipe_index.py", "recipe_groups.py", "dataset_store.py")
+CACHE_VERSION = cache_version(
+    [os.path.join(os.path.dirname(os.path.abspath(__file__)), name) for name in CACHE_CODE_MODULES],
+    {"spelling": SPELLING, "compaction": dataset_store.COMPACTION, "code_version": os.environ.get("GREENBITE_CODE_VERSION")}
+)
+
+def _cache_generation(generation):
+    """Generation key of persistent cache entries: the data fingerprint plus CACHE_VERSION."""
+    return f"{generation.fingerprint}:{CACHE_VERSION}"
+
+def _cached(namespace, key, generation, compute):
+    """Return a (payload, status) from the persistent cache, else compute it and store it if complete."""
+    if PERSISTENT_CACHE is None:
+        return compute()
+    stored = PERSISTENT_CACHE.get(namespace, _cache_generation(generation), key)
+    if stored is not None:
+        return stored[0], stored[1]
+    payload, status = compute()
+    if status in (200, 400) and not payload.get("partial"):
+        PERSISTENT_CACHE.set(namespace, _cache_generation(generation), key, [payload, status])
+    return payload, status
+
+# GREENBITE_SHARD_NODES makes this process a coordinator: it holds only the emissions table and
+# fans title searches out to shard nodes, each started with GREENBITE_SHARD=index/count
+SHARD_COORDINATOR = shard_coordinator_from_env()
+if SHARD_COORDINATOR is not None:
+    register_collector(SHARD_COORDINATOR.metrics)
+
+# Counts normalized /search and /compare-dishes queries; the most popular are replayed after a load or reload
+POPULARITY = query_popularity_from_env(dataset_store.DATASETS_DIR)
+PREWARM_TOP = int(os.environ.get("GREENBITE_PREWARM_TOP", "50"))
+PREWARM_SECONDS = float(os.environ.get("GREENBITE_PREWARM_SECONDS", "30"))
+PREWARM_ROWS = 20  # Recipes serialized per prewarmed search, about a first page
+
+def _prewarm_caches(generation):
+    """Replay the most popular queries against a generation to fill the search and ingredient caches."""
+    if POPULARITY is None or PREWARM_TOP <= 0 or SHARD_COORDINATOR is not None:
+        return 0
+    started = time.perf_counter()
+    replayed = 0
+    for key, count in POPULARITY.top(PREWARM_TOP):
+        if time.perf_counter() - started > PREWARM_SECONDS:
+            print(f"⏱ Prewarm time limit reached after {replayed} queries")
+            break
+        try:
+            if key[0] == "search":
+                payload, status = _cached("search", key[1], generation, lambda: _run_search(key[1], generation))
+                if status == 200:
+                    recipe_json = _recipe_json_cache(generation)
+                    for _, position, _ in itertools.islice(_search_rows(generation, payload["title_ids"]), PREWARM_ROWS):
+                        recipe_json(position)
+            elif key[0] == "compare-dishes":
+                _run_comparison(key[1], key[2], generation)
+            replayed += 1
+        except Exception as e:
+            print(f"⚠ Prewarm of {key} failed: {str(e)}")
+    if replayed:
+        print(f"🔥 Prewarmed caches with {replayed} popular queries in {time.perf_counter() - started:.2f}s")
+    return replayed
+
+@dataset_store.on_generation_swap
+def _prewarm_reloaded_generation(generation, old_generation):
+    """After a reload, prewarm the new generation in the background (the first load does it before ready)."""
+    if old_generation is not None and POPULARITY is not None:
+        threading.Thread(target=_prewarm_caches, args=(generation,), name="cache-prewarm", daemon=True).start()
+
+# Startup state reported by /readyz
+STARTUP = {"state": "starting", "error": None, "started_at": time.time(), "ready_at": None, "pid": None}
+
+def load_datasets():
+    """Import scoring modules, fetch and load the datasets, then publish the first generation."""
+    STARTUP.update(state="loading", error=None, pid=os.getpid())
+    try:
+        started = time.perf_counter()
+        _import_heavy_modules()
+        STARTUP["heavy_imports_seconds"] = round(time.perf_counter() - started, 3)
+
+        print(f"📁 Loading datasets from: {dataset_store.DATASETS_DIR}")
+
+        # Create datasets directory if it doesn't exist
+        os.makedirs(dataset_store.DATASETS_DIR, exist_ok=True)
+
+        # Fetch missing dataset files from storage (cached across restarts); a coordinator needs no recipes
+        if SHARD_COORDINATOR is not None:
+            dataset_store.ensure_local_datasets(filenames=(dataset_store.EMISSIONS_FILENAME,))
+            recipes_path = None
+        else:
+            dataset_store.ensure_local_datasets()
+            recipes_path = dataset_store.dataset_path(dataset_store.RECIPES_FILENAME)
+
+        generation = dataset_store.build_generation(
+            recipes_path,
+            dataset_store.dataset_path(dataset_store.EMISSIONS_FILENAME),
+            shard=dataset_store.SHARD,
+            compaction=dataset_store.COMPACTION
+        )
+
+        print("✅ Successfully loaded both datasets")
+        print(f"📊 Recipes dataset columns: {generation.recipes.columns.tolist()}")
+        print(f"📊 Emissions dataset columns: {generation.emissions.columns.tolist()}")
+        print(f"📊 Total recipes loaded: {len(generation.recipes)}")
+
+        # Print sample data to verify
+        print("Sample recipe titles:", generation.recipes['Title'].head().tolist())
+        print("Sample emissions data:", generation.emissions.head().to_dict('records'))
+
+        dataset_store.swap_generation(generation)
+        dataset_store.start_reload_poller()
+
+        # Not ready until the most popular queries have warmed this worker's caches
+        STARTUP["state"] = "prewarming"
+        _prewarm_caches(generation)
+        STARTUP.update(state="ready", ready_at=time.time())
+
+    except Exception as e:
+        print(f"❌ Dataset loading error: {str(e)}")
+        STARTUP.update(state="failed", error=str(e))
+        raise
+
+_loader_lock = threading.Lock()
+_loader_pid = None
+
+def start_background_load():
+    """Load datasets in a background thread (once per process, so forked workers start their own)."""
+    global _loader_pid
+    with _loader_lock:
+        if _loader_pid == os.getpid():
+            return False
+        _loader_pid = os.getpid()
+
+    def run():
+        try:
+            load_datasets()
+        except Exception:
+            pass  # Reported through /readyz
+
+    threading.Thread(target=run, name="dataset-loader", daemon=True).start()
+    return True
+
+def _not_ready_response():
+    """503 while datasets are still loading (or failed to load)."""
+    response = jsonify({"error": "Datasets are not loaded yet", "startup": STARTUP["state"]})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+# GREENBITE_BACKGROUND_LOAD=1 binds immediately and loads in the background; otherwise load before serving
+# (at the end of this module, once the handlers used for prewarming are defined).
+# In background mode each worker starts loading from gunicorn's post_fork hook (or its first request),
+# so a preloading master never holds a copy of the datasets.
+BACKGROUND_LOAD = os.environ.get("GREENBITE_BACKGROUND_LOAD", "0").lower() in ("1", "true", "yes")
+
+@app.before_request
+def ensure_datasets_loading():
+    """Kick off background loading in this process if nothing started it yet."""
+    if BACKGROUND_LOAD and _loader_pid != os.getpid():
+        start_background_load()
+    # Workers forked from a preloading master follow the reloads logged by the others
+    if dataset_store.RELOAD_POLL_SECONDS is not None and dataset_store.current_generation() is not None:
+        dataset_store.start_reload_poller()
+
+# Coalesces identical concurrent /search and /compare-dishes requests (GREENBITE_SINGLEFLIGHT)
+REQUEST_COALESCER = single_flight_from_env()
+
+def _coalesce(key, compute):
+    """Run compute() once for concurrent requests with the same key and share its (payload, status)."""
+    if REQUEST_COALESCER is None:
+        return compute()
+    (payload, status), shared = REQUEST_COALESCER.do(key, compute)
+    if shared:
+        print(f"🤝 Shared in-flight result for {key[0]}")
+    return payload, status
+
+def _run_search(query, generation, budget_ms=None):
+    """Run the fuzzy recipe search for one query; returns (payload, status) with the matched title ids."""
+    # Stop fuzzy matching when the latency budget runs out and return what was found
+    deadline = deadline_for("search", budget_ms)
+    matches = match_recipe_titles(query, generation.recipes, matcher=generation.title_matcher, deadline=deadline)
+    print(f"📌 Matched Titles: {[title for title, _, _ in matches]}")
+
+    title_ids = [int(title_id) for _, title_id, _ in matches]
+    if next(_search_rows(generation, title_ids), None) is None:
+        return {"error": "No ingredients recognized", "partial": deadline.exhausted}, 400
+
+    if deadline.exhausted:
+        print("⏱ Search budget exhausted, returning partial results")
+    return {"title_ids": title_ids, "partial": deadline.exhausted}, 200
+
+def _search_rows(generation, title_ids, dedupe=False):
+    """Yield (title, row position, duplicates) for the matched titles' recipes, in match order.
+
+    With `dedupe`, rows repeating an earlier row's title and ingredient list are folded
+    into it and counted in `duplicates`. A compacted corpus (GREENBITE_CORPUS_DEDUPE)
+    already holds one row per recipe group, counted in its Count column.
+    """
+    matcher = generation.title_matcher
+    raw_ingredients = generation.recipes["Cleaned_Ingredients"].values
+    counts = generation.recipes["Count"].values if "Count" in generation.recipes.columns else None
+    if not dedupe:
+        for title_id in title_ids:
+            title = matcher.titles[title_id]
+            for position in matcher.rows_for(title_id).tolist():
+                raw = raw_ingredients[position]
+                if isinstance(raw, str) and raw:
+                    yield title, position, int(counts[position]) if counts is not None else 1
+        return
+
+    # Counts need every row, but rows are only ints until a page is serialized
+    unique_rows = {}
+    for title_id in title_ids:
+        title = matcher.titles[title_id]
+        for position in matcher.rows_for(title_id).tolist():
+            ingredients = clean_ingredients(raw_ingredients[position])
+            if ingredients is None:
+                continue
+            duplicates = int(counts[position]) if counts is not None else 1
+            entry = unique_rows.get((title_id, tuple(ingredients)))
+            if entry is None:
+                unique_rows[(title_id, tuple(ingredients))] = [title, position, duplicates]
+            else:
+                entry[2] += duplicates
+    for title, position, duplicates in unique_rows.values():
+        yield title, position, duplicates
+
+# Serialized {"title", "ingredients"} objects kept per generation; recipe rows never change within one
+RECIPE_JSON_CACHE_SIZE = int(os.environ.get("GREENBITE_RECIPE_JSON_CACHE_SIZE", "50000"))
+SEARCH_PAGE_MAX = 500
+
+def _recipe_json_cache(generation):
+    """Per-generation LRU of recipe row position -> pre-serialized JSON bytes."""
+    def build(generation):
+        titles = generation.recipes["Title"].values
+        raw_ingredients = generation.recipes["Cleaned_Ingredients"].values
+
+        @lru_cache(maxsize=RECIPE_JSON_CACHE_SIZE)
+        def recipe_json(position):
+            return dumps({"title": titles[position], "ingredients": clean_ingredients(raw_ingredients[position])})
+        return recipe_json
+    return generation.derived("recipe_json", build)
+
+def _encode_cursor(state):
+    """Opaque page cursor: the generation, matched titles and position, so later pages skip the fuzzy search."""
+    return base64.urlsafe_b64encode(dumps(state)).decode("ascii").rstrip("=")
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def _decode_cursor(cursor):
+    """The cursor's state with its offset and page size checked (the size clamped to SEARCH_PAGE_MAX), or None."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(state, dict) or not {"g", "o"} <= state.keys() or not _is_count(state["o"]):
+        return None
+    # Coordinator cursors carry the query ("q") instead of title ids, which are shard-local
+    if "q" in state:
+        if not isinstance(state["q"], str):
+            return None
+    elif not isinstance(state.get("t"), list) or not all(_is_count(title_id) for title_id in state["t"]):
+        return None
+    limit = state.get("l")
+    if limit is not None:
+        if not _is_count(limit) or limit == 0:
+            return None
+        state["l"] = min(limit, SEARCH_PAGE_MAX)
+    return state
+
+class _SearchRenderer:
+    """Turns matched title ids into one page of recipes, as a JSON body or an NDJSON stream."""
+
+    def __init__(self, generation, title_ids, partial, dedupe=False, offset=0, limit=None, fields=None):
+        self.generation = generation
+        self.title_ids = title_ids
+        self.partial = partial
+        self.dedupe = dedupe
+        self.offset = offset
+        self.limit = limit
+
+        # `fields` address the whole response ("recipes.title"); each recipe is projected on its own
+        self.include_recipes = True
+        self.recipe_fields = None
+        if fields and "recipes" not in fields:
+            self.recipe_fields = [field[len("recipes."):] for field in fields if field.startswith("recipes.")]
+            self.include_recipes = bool(self.recipe_fields)
+
+    def page(self):
+        """(rows on this page, next cursor or None, total matching rows or None when not paginating)."""
+        rows = _search_rows(self.generation, self.title_ids, self.dedupe)
+        if self.limit is None and self.offset == 0:
+            return rows, None, None
+
+        rows = list(rows)  # ints only; recipes are serialized per page
+        end = self.offset + (self.limit if self.limit is not None else len(rows))
+        next_cursor = None
+        if end < len(rows):
+            next_cursor = _encode_cursor({"g": self.generation.fingerprint, "t": self.title_ids, "o": end,
+                                          "l": self.limit, "d": self.dedupe, "p": self.partial})
+        return iter(rows[self.offset:end]), next_cursor, len(rows)
+
+    def _recipe_bytes(self, recipe_json, raw_ingredients, title, position, duplicates):
+        if self.recipe_fields:
+            recipe = {"title": title, "ingredients": clean_ingredients(raw_ingredients[position])}
+            if self.dedupe:
+                recipe["duplicates"] = duplicates
+            return dumps(select_fields(recipe, self.recipe_fields))
+        # Titles in the matched rows equal the dataset titles, so the cached objects are exact
+        body = recipe_json(position)
+        return body[:-1] + b',"duplicates":' + str(duplicates).encode() + b"}" if self.dedupe else body
+
+    def _recipes(self, rows):
+        recipe_json = _recipe_json_cache(self.generation)
+        raw_ingredients = self.generation.recipes["Cleaned_Ingredients"].values
+        for title, position, duplicates in rows:
+            yield self._recipe_bytes(recipe_json, raw_ingredients, title, position, duplicates)
+
+    def _meta(self, next_cursor, total):
+        meta = {"partial": self.partial}
+        if total is not None:
+            meta.update(next_cursor=next_cursor, total_matches=total)
+        return meta
+
+    def json_response(self):
+        rows, next_cursor, total = self.page()
+        meta = dumps(self._meta(next_cursor, total))
+        if not self.include_recipes:
+            return bytes_response(meta, 200)
+        body = b'{"recipes":[' + b",".join(self._recipes(rows)) + b"]," + meta[1:]
+        return bytes_response(body, 200)
+
+    def ndjson_response(self):
+        """One recipe per line as soon as it is serialized, then a {"meta": ...} line."""
+        rows, next_cursor, total = self.page()
+
+        def generate():
+            for recipe in self._recipes(rows if self.include_recipes else ()):
+                yield recipe + b"\n"
+            yield dumps({"meta": self._meta(next_cursor, total)}) + b"\n"
+        return Response(generate(), mimetype="application/x-ndjson")
+
+def _wants_ndjson(data):
+    return bool(data.get("stream")) or "application/x-ndjson" in request.headers.get("Accept", "")
 
 @app.route("/search", methods=["POST"])
 def search():
-    """Extract ingredients from the query and find matching recipes."""
+    """Extract ingredients from the query and find matching recipes.
+
+    Optional body fields: `limit` (page size, returns `next_cursor`), `cursor` (from a
+    previous page), `dedupe` (fold identical ingredient lists) and `stream` (NDJSON).
+    """
     try:
         print(f"🔥 Raw request data: {request.data}")  # Debug request data
         data = request.get_json(silent=True)
         print(f"🔥 Parsed JSON: {data}")  # Debug parsed JSON
 
+        if data and isinstance(data.get("cursor"), str):
+            return _search_page(data)
+
         if not data or "query" not in data or not isinstance(data["query"], str):
             print("❌ Invalid request format received!")
             return jsonify({"error": "Invalid request format"}), 400
@@ -125,37 +504,266 @@ def search():
         if not query:
             return jsonify({"error": "Query cannot be empty"}), 400
 
+        limit = data.get("limit")
+        if limit is not None:
+            try:
+                limit = max(1, min(int(limit), SEARCH_PAGE_MAX))
+            except (TypeError, ValueError):
+                return jsonify({"error": "Invalid request format"}), 400
+
         print(f"✅ Query received: {query}")
 
         # Extract ingredients using `ingredients.py`
-        if RECIPES_DATASET is None:
-            return jsonify({"error": "Recipes dataset not loaded"}), 500
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
+
+        if SHARD_COORDINATOR is not None:
+            return _coordinated_search(data, query, generation, bool(data.get("dedupe")), limit=limit)
+
+        # Queries another worker already ran come from the shared cache; identical concurrent
+        # queries with the same latency budget share one computation, which alone takes an admission slot
+        key = ("search", generation.fingerprint, normalize_input(query), effective_budget_ms("search", data.get("budget_ms")))
+        if POPULARITY is not None:
+            POPULARITY.record("search", key[2])
+        payload, status = _cached("search", key[2], generation, lambda: _coalesce(
+            key, lambda: run_admitted("expensive", lambda: _run_search(query, generation, data.get("budget_ms")))
+        ))
+        if status != 200:
+            return json_response(payload, status, requested_fields(data))
+
+        renderer = _SearchRenderer(generation, payload["title_ids"], payload["partial"], bool(data.get("dedupe")),
+                                   limit=limit, fields=requested_fields(data))
+        return renderer.ndjson_response() if _wants_ndjson(data) else renderer.json_response()
 
-        extracted_ingredients, matched_titles = extract_ingredients(query, RECIPES_DATASET)
-        print(f"🔍 Extracted Ingredients: {extracted_ingredients}")
-        print(f"📌 Matched Titles: {matched_titles}")
+    except Exception as e:
+        print(f"❌ Search error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        if not extracted_ingredients:
-            return jsonify({"error": "No ingredients recognized"}), 400
+def _search_page(data):
+    """Serve a later /search page from its cursor without repeating the fuzzy search."""
+    state = _decode_cursor(data["cursor"])
+    if state is None:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    generation = dataset_store.current_generation()
+    if generation is None:
+        return _not_ready_response()
+    if state["g"] != generation.fingerprint or ("q" in state) != (SHARD_COORDINATOR is not None):
+        return jsonify({"error": "Cursor expired after a dataset reload, repeat the search"}), 410
+    if SHARD_COORDINATOR is not None:
+        return _coordinated_search(data, state["q"], generation, bool(state.get("d")),
+                                   offset=state["o"], limit=state.get("l"))
+    if any(title_id >= len(generation.title_matcher) for title_id in state["t"]):
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    renderer = _SearchRenderer(generation, state["t"], bool(state.get("p")), bool(state.get("d")),
+                               offset=state["o"], limit=state.get("l"), fields=requested_fields(data))
+    return renderer.ndjson_response() if _wants_ndjson(data) else renderer.json_response()
+
+def _coordinated_search(data, query, generation, dedupe, offset=0, limit=None):
+    """/search on a shard coordinator: merge the shards' top titles, then page through their recipes.
+
+    Later pages repeat the fan-out (title ids are shard-local); shards answer repeated queries from their caches.
+    """
+    # Normalized and spell-corrected once here, against the whole corpus's vocabulary merged from the
+    # shards; until that is loaded, every shard normalizes the query itself
+    normalized = normalize_input(query)
+    corrected = not SPELLING or ingredients_module.SPELL_CORRECTOR is not None
+
+    def compute():
+        deadline = deadline_for("search", data.get("budget_ms"))
+        matches, partial, failed = SHARD_COORDINATOR.search_titles(normalized if corrected else query, deadline, dedupe,
+                                                                   normalized=corrected)
+        if SHARD_COORDINATOR.all_failed(failed):
+            return {"error": "No search shards are available", "failed_shards": failed}, 503
+        recipes = [recipe for match in matches for recipe in match["recipes"]]
+        print(f"📌 Matched Titles: {[match['title'] for match in matches]} ({len(failed)} shards failed)")
+        if not recipes:
+            return {"error": "No ingredients recognized", "partial": partial}, 400
+        return {"recipes": recipes, "partial": partial, "failed_shards": failed}, 200
+
+    key = ("search", generation.fingerprint, normalized, "shards", dedupe, effective_budget_ms("search", data.get("budget_ms")))
+    # Cursor pages repeat the fan-out but, like local cursor pages, do not wait for an admission slot
+    payload, status = _coalesce(key, compute if offset else lambda: run_admitted("expensive", compute))
+    if status != 200:
+        return json_response(payload, status, requested_fields(data))
+
+    payload = dict(payload)
+    if limit is not None or offset:
+        recipes = payload["recipes"]
+        end = offset + (limit if limit is not None else len(recipes))
+        payload["recipes"] = recipes[offset:end]
+        payload["total_matches"] = len(recipes)
+        payload["next_cursor"] = _encode_cursor({"g": generation.fingerprint, "q": query, "o": end, "l": limit,
+                                                 "d": dedupe, "p": payload["partial"]}) if end < len(recipes) else None
+    payload = select_fields(payload, requested_fields(data))
+    if not _wants_ndjson(data):
+        return json_response(payload, 200)
+
+    recipes = payload.pop("recipes", [])
+    def generate():
+        for recipe in recipes:
+            yield dumps(recipe) + b"\n"
+        yield dumps({"meta": payload}) + b"\n"
+    return Response(generate(), mimetype="application/x-ndjson")
+
+def _source_row(generation, position):
+    """Row number of a recipe in the whole corpus (shard nodes keep it in Source_Row), for merge tie-breaks."""
+    if "Source_Row" in generation.recipes.columns:
+        return int(generation.recipes["Source_Row"].values[position])
+    return int(position)
+
+@app.route("/shard/search", methods=["POST"])
+def shard_search():
+    """Shard-local title search for a coordinator: the top scored titles with their recipes."""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get("query"), str) or not data["query"].strip():
+            return jsonify({"error": "Invalid request format"}), 400
 
-        # Clean the extracted ingredients
-        cleaned_ingredients = []
-        for ingredients in extracted_ingredients:
-            # Remove unnecessary quotes, brackets, and any non-alphanumeric characters
-            cleaned = re.sub(r'[^\w\s,]', '', str(ingredients))  # Clean unwanted characters
-            cleaned = cleaned.replace('"', '').replace('[', '').replace(']', '')  # Clean extra quotes and brackets
-            cleaned_ingredients.append([ingredient.strip() for ingredient in cleaned.split(',')])
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
+
+        # Same normalization, limit and threshold as match_recipe_titles, keeping the scores for the merge.
+        # Coordinators send queries already normalized against the whole corpus ("normalized"), which
+        # this shard's partition-only spelling vocabulary must not correct again.
+        deadline = deadline_for("search", data.get("budget_ms"))
+        matcher = generation.title_matcher
+        query = data["query"].strip() if data.get("normalized") else normalize_input(data["query"].strip())
+        matches = matcher.extract(query, limit=5, score_cutoff=80, deadline=deadline)
+
+        results = []
+        for title, score, title_id in matches:
+            recipes = []
+            for recipe_title, position, duplicates in _search_rows(generation, [title_id], bool(data.get("dedupe"))):
+                recipe = {"title": recipe_title, "ingredients": clean_ingredients(generation.recipes["Cleaned_Ingredients"].values[position])}
+                if data.get("dedupe"):
+                    recipe["duplicates"] = duplicates
+                recipes.append(recipe)
+            results.append({"title": title, "score": score, "first_row": _source_row(generation, matcher.rows_for(title_id)[0]),
+                            "recipes": recipes})
+        return json_response({"matches": results, "partial": deadline.exhausted, "recipes_loaded": len(generation.recipes)})
 
-        # Combine cleaned ingredients with matched titles
-        response = [
-            {"title": title, "ingredients": ingredients}
-            for title, ingredients in zip(matched_titles, cleaned_ingredients)
-        ]
+    except Exception as e:
+        print(f"❌ Shard search error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"recipes": response}), 200
+@app.route("/shard/vocabulary", methods=["POST"])
+def shard_vocabulary():
+    """Shard-local title words with the number of titles containing each, for a coordinator's spell corrector."""
+    generation = dataset_store.current_generation()
+    if generation is None:
+        return _not_ready_response()
+    matcher = generation.title_matcher
+    offsets = matcher.token_offsets.tolist()
+    return json_response({"words": {word: offsets[token_id + 1] - offsets[token_id]
+                                    for word, token_id in matcher.token_vocabulary.items()}})
+
+@app.route("/shard/resolve", methods=["POST"])
+def shard_resolve():
+    """Shard-local dish resolution for a coordinator's /compare-dishes: best title, score and recipe row."""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get("dish"), str):
+            return jsonify({"error": "Invalid request format"}), 400
+
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
+
+        deadline = deadline_for("compare-dishes", data.get("budget_ms"))
+        match = resolve_dish_match(data["dish"], generation, deadline=deadline)
+        if match is None:
+            return json_response({"title": None, "partial": deadline.exhausted})
+
+        title, score, title_id, position = match
+        recipe = None
+        if position is not None:
+            row = generation.recipes.iloc[position]
+            recipe = [row["Title"], row["Cleaned_Ingredients"]]
+        return json_response({"title": title, "score": score, "recipe": recipe, "partial": deadline.exhausted,
+                              "first_row": _source_row(generation, generation.title_matcher.rows_for(title_id)[0])})
 
     except Exception as e:
-        print(f"❌ Search error: {str(e)}")
+        print(f"❌ Shard resolve error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/search/by-ingredients", methods=["POST"])
+def search_by_ingredients():
+    """Find recipes that use the given ingredients, ranked by overlap."""
+    try:
+        data = request.get_json(silent=True)
+        print(f"🔥 Parsed JSON: {data}")  # Debug parsed JSON
+
+        if not data or "ingredients" not in data or not isinstance(data["ingredients"], list):
+            print("❌ Invalid request format received!")
+            return jsonify({"error": "Invalid request format"}), 400
+
+        ingredients = [ing.strip() for ing in data["ingredients"] if isinstance(ing, str) and ing.strip()]
+        if not ingredients:
+            return jsonify({"error": "Ingredients cannot be empty"}), 400
+
+        match = data.get("match", "any")
+        rank_by = data.get("rank_by", "overlap")
+        if match not in ("any", "all") or rank_by not in ("overlap", "emissions"):
+            return jsonify({"error": "Invalid request format"}), 400
+
+        try:
+            limit = max(1, min(int(data.get("limit", 20)), 100))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid request format"}), 400
+
+        # Only a JSON boolean: the string "false" would otherwise turn expansion on
+        expand = data.get("expand", True)
+        if not isinstance(expand, bool):
+            return jsonify({"error": "Invalid request format"}), 400
+
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
+        if SHARD_COORDINATOR is not None:
+            return jsonify({"error": "Ingredient search is served by the shard nodes"}), 501
+
+        # Emissions ranking reorders a wider pool of the best-overlapping recipes
+        pool_size = limit * 5 if rank_by == "emissions" else limit
+        row_ids, overlaps, total_matches = generation.ingredient_index.search(
+            ingredients, match=match, limit=pool_size, expand=expand
+        )
+        print(f"🔍 {total_matches} recipes contain {ingredients} (match={match})")
+
+        # A term may match several of a recipe's ingredients (or none of its others), so the
+        # missing ones are counted from the matched ingredients, not the matched terms
+        matched_ingredients = generation.ingredient_index.matched_ingredient_counts(ingredients, row_ids, expand=expand)
+        titles = generation.recipes["Title"].values
+        raw_ingredients = generation.recipes["Cleaned_Ingredients"].values
+        counts = generation.recipes["Count"].values if "Count" in generation.recipes.columns else None
+
+        recipes = []
+        for row_id, overlap, matched in zip(row_ids.tolist(), overlaps.tolist(), matched_ingredients.tolist()):
+            recipe_ingredients = parse_ingredient_list(raw_ingredients[row_id])
+            missing_count = max(len(set(recipe_ingredients)) - matched, 0)
+            recipes.append({
+                "title": titles[row_id],
+                "ingredients": recipe_ingredients,
+                "matched_count": overlap,
+                "missing_count": missing_count,
+                "uses_only_requested": missing_count == 0
+            })
+            if counts is not None:
+                recipes[-1]["duplicates"] = int(counts[row_id])
+
+        if rank_by == "emissions" and recipes:
+            rank_recipes_by_emissions(recipes, generation.emissions)
+            recipes.sort(key=lambda recipe: (-recipe["matched_count"], recipe["total_emissions"]))
+            recipes = recipes[:limit]
+
+        return json_response({"recipes": recipes, "total_matches": int(total_matches)}, 200, requested_fields(data))
+
+    except Exception as e:
+        print(f"❌ Ingredient search error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -175,19 +783,20 @@ def emissions():
 
         if not ingredients:
             print("⚠ No valid ingredients found!")
-            return jsonify({"breakdown": {}, "total_emissions": 0}), 200  
+            return json_response({"breakdown": {}, "total_emissions": 0}, 200, requested_fields(data))
 
         print(f"✅ Ingredients received: {ingredients}")
 
         # Match ingredients with emissions data
-        if EMISSIONS_DATASET is None:
+        generation = dataset_store.current_generation()
+        if generation is None:
             print("❌ Emissions dataset not loaded!")
-            return jsonify({"error": "Emissions dataset not loaded"}), 500
+            return _not_ready_response()
 
-        matched_ingredients = match_ingredients_with_emissions(ingredients, EMISSIONS_DATASET)
+        matched_ingredients = match_ingredients_with_emissions(ingredients, generation.emissions)
         if not matched_ingredients:
             print("⚠ No matching ingredients found in emissions dataset!")
-            return jsonify({"breakdown": {}, "total_emissions": 0}), 200  
+            return json_response({"breakdown": {}, "total_emissions": 0}, 200, requested_fields(data))
 
         print(f"🔍 Matched Ingredients: {matched_ingredients}")
 
@@ -206,7 +815,7 @@ def emissions():
         }
 
         print("📌 Computed Emissions Data:", response)
-        return jsonify(response), 200
+        return json_response(response, 200, requested_fields(data))
 
     except Exception as e:
         print(f"❌ Emissions error: {str(e)}")
@@ -229,58 +838,159 @@ def predict():
 
         if not ingredients:
             print("⚠ No valid ingredients found!")
-            return jsonify({
-                "sustainability_score": 3.0,
-                "total_emissions": 0,
-                "emissions_equivalence": calculate_emissions_equivalence(0),
-                "breakdown": {}
-            }), 200
+            return json_response(score_ingredients([], None), 200, requested_fields(data))
 
         print(f"✅ Ingredients received: {ingredients}")
 
-        # Match ingredients with emissions data
-        if EMISSIONS_DATASET is None:
-            return jsonify({"error": "Emissions dataset not loaded"}), 500
+        # Match ingredients with emissions data and score them
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
 
-        matched_ingredients = match_ingredients_with_emissions(ingredients, EMISSIONS_DATASET)
-        if not matched_ingredients:
-            print("⚠ No matching ingredients found in emissions dataset!")
-            return jsonify({
-                "sustainability_score": 3.0,
-                "total_emissions": 0,
-                "emissions_equivalence": calculate_emissions_equivalence(0),
-                "breakdown": {}
-            }), 200
+        response = score_ingredients(ingredients, generation.emissions)
 
-        print(f"🔍 Matched Ingredients: {matched_ingredients}")
+        print("📌 Final Response:", response)
+        return json_response(response, 200, requested_fields(data))
 
-        # Calculate total impact
-        total_impact, total_emissions = calculate_total_impact(matched_ingredients)
-        print(f"📊 Total Impact: {total_impact}, Total Emissions: {total_emissions}")
+    except Exception as e:
+        print(f"❌ Predict error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Calculate emissions equivalence
-        emissions_equivalence_data = calculate_emissions_equivalence(total_emissions)
-        print(f"📊 Emissions Equivalence Data: {emissions_equivalence_data}")
+def _resolve_recipes(dish_names, generation, deadline, score_cutoff=0):
+    """Resolve dish names like resolve_dish, locally or on the shards.
+
+    Returns ([(matched title, (recipe title, Cleaned_Ingredients) or None)], failed shards);
+    names without a match scoring at least `score_cutoff` resolve to (None, None).
+    """
+    if SHARD_COORDINATOR is not None:
+        # Repeated names are fanned out once
+        unique_names = list(dict.fromkeys(dish_names))
+        answers, partial, failed = SHARD_COORDINATOR.resolve_dishes(unique_names, deadline.share(0.5))
+        if partial:
+            deadline.exhausted = True
+        by_name = {name: (answer["title"], tuple(answer["recipe"]) if answer["recipe"] else None)
+                   if answer and answer["score"] >= score_cutoff else (None, None)
+                   for name, answer in zip(unique_names, answers)}
+        return [by_name[name] for name in dish_names], failed
+
+    # Half the budget goes to title resolution, leaving the rest for ingredient matching
+    resolved = []
+    for title, position in resolve_dishes(dish_names, generation, deadline=deadline, budget_share=0.5,
+                                          score_cutoff=score_cutoff):
+        recipe = None
+        if position is not None:
+            row = generation.recipes.iloc[position]
+            recipe = (row["Title"], row["Cleaned_Ingredients"])
+        resolved.append((title, recipe))
+    return resolved, []
+
+SUBSTITUTE_MAX_CANDIDATES = 100
+
+def _base_analysis(data, emissions_dataset):
+    """Per-ingredient emissions of the dish being edited: a previous `base` (or a /compare-dishes dish) or an ingredient list."""
+    base = data.get("base")
+    if isinstance(base, dict) and isinstance(base.get("ingredient_emissions"), dict):
+        matched = base["ingredient_emissions"]
+        if all(isinstance(values, dict) and all(isinstance(value, (int, float)) for value in values.values())
+               for values in matched.values()):
+            return matched
+        return None
+    if isinstance(data.get("ingredients"), list):
+        ingredients = [ing.strip() for ing in data["ingredients"] if isinstance(ing, str) and ing.strip()]
+        return match_ingredients_with_emissions(ingredients, emissions_dataset) if ingredients else {}
+    return None
 
-        # Calculate sustainability score based on total emissions
-        sustainability_score = calculate_sustainability_score(total_emissions)
-        print(f"📈 Sustainability Score: {sustainability_score}")
+@app.route("/substitute", methods=["POST"])
+def substitute():
+    """What-if ingredient substitutions for one dish, scored as deltas against its base analysis.
 
-        response = {
-            "sustainability_score": sustainability_score,
-            "total_emissions": round(total_emissions, 2),
-            "emissions_equivalence": emissions_equivalence_data,
-            "breakdown": {key: round(value, 3) for key, value in total_impact.items()}
-        }
+    Body: the dish as `ingredients` or a previous response's `base`, and either `edits` (one
+    candidate) or `candidates` (a list of edit lists), each edit being {"op": "add"|"remove",
+    "ingredient": x} or {"op": "replace", "from": x, "to": y}.
+    """
+    try:
+        data = request.get_json(silent=True)
+        print(f"🔥 Parsed JSON: {data}")  # Debug parsed JSON
+        if not data:
+            return jsonify({"error": "Invalid request format"}), 400
 
-        print("📌 Final Response:", response)
-        return jsonify(response), 200
+        candidates = data["candidates"] if "candidates" in data else [data.get("edits")]
+        if not isinstance(candidates, list) or not candidates:
+            return jsonify({"error": "Invalid request format"}), 400
+        if len(candidates) > SUBSTITUTE_MAX_CANDIDATES:
+            return jsonify({"error": f"At most {SUBSTITUTE_MAX_CANDIDATES} candidates per request"}), 400
+        try:
+            candidates = [parse_edits(edits) for edits in candidates]
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
+
+        base_matched = _base_analysis(data, generation.emissions)
+        if base_matched is None:
+            return jsonify({"error": "Invalid request format"}), 400
+
+        try:
+            base, results = score_substitutions(base_matched, candidates, generation.emissions)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # The base's per-ingredient emissions let the client send further edits without re-resolving
+        base["ingredient_emissions"] = base_matched
+        print(f"📌 Scored {len(results)} substitution candidates")
+        return json_response({"base": base, "results": results}, 200, requested_fields(data))
 
     except Exception as e:
-        print(f"❌ Predict error: {str(e)}")
+        print(f"❌ Substitute error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-from sustainability import get_sustainability_score  # Import your existing function
+def _run_comparison(dish1_name, dish2_name, generation, budget_ms=None):
+    """Resolve and compare two dishes; returns (payload, status)."""
+    # One latency budget covers title resolution and ingredient matching for both dishes
+    deadline = deadline_for("compare-dishes", budget_ms)
+
+    # Find dishes in dataset using fuzzy matching over the precomputed title signatures
+    print(f"🔍 Searching for dish1: {dish1_name}")
+    print(f"🔍 Searching for dish2: {dish2_name}")
+    resolved, failed_shards = _resolve_recipes([dish1_name, dish2_name], generation, deadline)
+    if SHARD_COORDINATOR is not None and SHARD_COORDINATOR.all_failed(failed_shards):
+        return {"error": "No search shards are available", "failed_shards": failed_shards}, 503
+    (dish1_title, dish1_recipe), (dish2_title, dish2_recipe) = resolved
+
+    if not dish1_title or not dish2_title:
+        print("❌ Could not find good matches for one or both dishes!")
+        return {"error": "Could not find good matches for one or both dishes", "partial": deadline.exhausted}, 404
+
+    if dish1_recipe is None or dish2_recipe is None:
+        print("❌ One or both dishes not found in dataset!")
+        return {"error": "One or both dishes not found"}, 404
+
+    # Match ingredients with emissions data and score both dishes
+    dish1, dish1_total = score_recipe(*dish1_recipe, generation.emissions, deadline=deadline)
+    dish2, dish2_total = score_recipe(*dish2_recipe, generation.emissions, deadline=deadline)
+    dish1_score = dish1["sustainability_score"]
+    dish2_score = dish2["sustainability_score"]
+
+    # Prepare detailed results
+    result = {
+        "dish1": dish1,
+        "dish2": dish2,
+        "comparison_result": {
+            "more_eco_friendly": dish1["title"] if dish1_score > dish2_score else dish2["title"],
+            "score_difference": round(abs(dish1_score - dish2_score), 2),
+            "emissions_difference": round(abs(dish1_total - dish2_total), 2)
+        },
+        "partial": deadline.exhausted
+    }
+    if failed_shards:
+        result["failed_shards"] = failed_shards
+
+    if deadline.exhausted:
+        print("⏱ Comparison budget exhausted, returning partial results")
+    print("📌 Final comparison result:", result)
+    return result, 200
 
 @app.route("/compare-dishes", methods=["POST"])
 def compare_dishes():
@@ -300,116 +1010,207 @@ def compare_dishes():
 
         print(f"✅ Comparing dishes: {dish1_name} vs {dish2_name}")
 
-        # Find dishes in dataset using fuzzy matching
-        try:
-            print(f"🔍 Searching for dish1: {dish1_name}")
-            print(f"🔍 Searching for dish2: {dish2_name}")
-            
-            # Get all unique titles for fuzzy matching
-            all_titles = RECIPES_DATASET['Title'].unique()
-            
-            # Find best matches using fuzzy matching
-            dish1_matches = process.extract(dish1_name.lower(), [title.lower() for title in all_titles], limit=5)
-            dish2_matches = process.extract(dish2_name.lower(), [title.lower() for title in all_titles], limit=5)
-            
-            print(f"📊 Dish1 fuzzy matches: {dish1_matches}")
-            print(f"📊 Dish2 fuzzy matches: {dish2_matches}")
-            
-            # Get the best match for each dish
-            dish1_best_match = dish1_matches[0][0] if dish1_matches else None
-            dish2_best_match = dish2_matches[0][0] if dish2_matches else None
-            
-            if not dish1_best_match or not dish2_best_match:
-                print("❌ Could not find good matches for one or both dishes!")
-                return jsonify({"error": "Could not find good matches for one or both dishes"}), 404
-            
-            # Find the exact matches in the dataset
-            dish1_matches = RECIPES_DATASET[RECIPES_DATASET["Title"].str.lower() == dish1_best_match]
-            dish2_matches = RECIPES_DATASET[RECIPES_DATASET["Title"].str.lower() == dish2_best_match]
-            
-            print(f"📊 Dish1 exact matches found: {len(dish1_matches)}")
-            print(f"📊 Dish2 exact matches found: {len(dish2_matches)}")
-            
-            if len(dish1_matches) == 0 or len(dish2_matches) == 0:
-                print("❌ One or both dishes not found in dataset!")
-                return jsonify({"error": "One or both dishes not found"}), 404
-            
-            dish1 = dish1_matches.iloc[0]
-            dish2 = dish2_matches.iloc[0]
-            
-            print(f"✅ Found dish1: {dish1['Title']}")
-            print(f"✅ Found dish2: {dish2['Title']}")
-            
-        except IndexError:
-            print("❌ One or both dishes not found in dataset!")
-            return jsonify({"error": "One or both dishes not found"}), 404
-
-        # Extract and clean ingredients
-        dish1_ingredients = [ing.strip() for ing in dish1["Cleaned_Ingredients"].split(",")]
-        dish2_ingredients = [ing.strip() for ing in dish2["Cleaned_Ingredients"].split(",")]
-
-        print(f"🔍 Dish 1 ingredients: {dish1_ingredients}")
-        print(f"🔍 Dish 2 ingredients: {dish2_ingredients}")
+        # Pin one generation for the whole comparison, even if a reload swaps it mid-request
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
+
+        # Identical concurrent comparisons with the same latency budget share one computation
+        key = ("compare-dishes", generation.fingerprint, " ".join(str(dish1_name).lower().split()), " ".join(str(dish2_name).lower().split()),
+               effective_budget_ms("compare-dishes", data.get("budget_ms")))
+        if POPULARITY is not None:
+            POPULARITY.record("compare-dishes", key[2], key[3])
+        payload, status = _coalesce(key, lambda: run_admitted(
+            "expensive", lambda: _run_comparison(dish1_name, dish2_name, generation, data.get("budget_ms"))
+        ))
+        return json_response(payload, status, requested_fields(data))
 
-        # Match ingredients with emissions data
-        dish1_matched = match_ingredients_with_emissions(dish1_ingredients, EMISSIONS_DATASET)
-        dish2_matched = match_ingredients_with_emissions(dish2_ingredients, EMISSIONS_DATASET)
-
-        print(f"📊 Dish 1 matched emissions: {dish1_matched}")
-        print(f"📊 Dish 2 matched emissions: {dish2_matched}")
-
-        # Calculate total emissions
-        dish1_impact, dish1_total = calculate_total_impact(dish1_matched)
-        dish2_impact, dish2_total = calculate_total_impact(dish2_matched)
-
-        print(f"📈 Dish 1 total emissions: {dish1_total}")
-        print(f"📈 Dish 2 total emissions: {dish2_total}")
-
-        # Calculate sustainability scores
-        dish1_score = get_sustainability_score(dish1_ingredients)
-        dish2_score = get_sustainability_score(dish2_ingredients)
-        
-        # Cap scores at 5.0
-        dish1_score = min(5.0, float(dish1_score)) if isinstance(dish1_score, (int, float)) else 3.0
-        dish2_score = min(5.0, float(dish2_score)) if isinstance(dish2_score, (int, float)) else 3.0
-
-        print(f"⭐ Dish 1 sustainability score: {dish1_score}")
-        print(f"⭐ Dish 2 sustainability score: {dish2_score}")
-
-        # Prepare detailed results
-        result = {
-            "dish1": {
-                "title": dish1["Title"],
-                "ingredients": dish1_ingredients,
-                "ingredient_emissions": dish1_matched,
-                "sustainability_score": dish1_score,
-                "total_emissions": round(dish1_total, 2),
-                "emissions_breakdown": {key: round(value, 3) for key, value in dish1_impact.items()},
-                "emissions_equivalence": calculate_emissions_equivalence(dish1_total)
-            },
-            "dish2": {
-                "title": dish2["Title"],
-                "ingredients": dish2_ingredients,
-                "ingredient_emissions": dish2_matched,
-                "sustainability_score": dish2_score,
-                "total_emissions": round(dish2_total, 2),
-                "emissions_breakdown": {key: round(value, 3) for key, value in dish2_impact.items()},
-                "emissions_equivalence": calculate_emissions_equivalence(dish2_total)
-            },
-            "comparison_result": {
-                "more_eco_friendly": dish1["Title"] if dish1_score > dish2_score else dish2["Title"],
-                "score_difference": round(abs(dish1_score - dish2_score), 2),
-                "emissions_difference": round(abs(dish1_total - dish2_total), 2)
-            }
-        }
+    except Exception as e:
+        print(f"❌ Error comparing dishes: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+RANK_DISHES_MAX = 20
+RANK_MATCH_THRESHOLD = 80  # Like match_recipe_titles: weaker title matches are reported as unmatched
+
+def _run_ranking(dish_names, generation, budget_ms=None):
+    """Resolve and rank several dishes by sustainability score, then total emissions; returns (payload, status)."""
+    deadline = deadline_for("rank-dishes", budget_ms)
+
+    resolved, failed_shards = _resolve_recipes(dish_names, generation, deadline, score_cutoff=RANK_MATCH_THRESHOLD)
+    if SHARD_COORDINATOR is not None and SHARD_COORDINATOR.all_failed(failed_shards):
+        return {"error": "No search shards are available", "failed_shards": failed_shards}, 503
+
+    # Dishes resolving to the same recipe are scored once; all ingredients are matched in one pass
+    recipes = list(dict.fromkeys(recipe for _, recipe in resolved if recipe is not None))
+    if not recipes:
+        print("❌ Could not find good matches for any dish!")
+        return {"error": "Could not find good matches for any dish", "partial": deadline.exhausted}, 404
+    scored = dict(zip(recipes, score_recipes(recipes, generation.emissions, deadline=deadline)))
+
+    ranking = []
+    for dish_name, (_, recipe) in zip(dish_names, resolved):
+        if recipe is not None:
+            details, total_emissions = scored[recipe]
+            ranking.append((-details["sustainability_score"], total_emissions, len(ranking), dict(details, dish=dish_name)))
+    ranking.sort(key=lambda entry: entry[:3])
+
+    result = {
+        "ranking": [dict(details, rank=rank) for rank, (_, _, _, details) in enumerate(ranking, start=1)],
+        "unmatched": [dish_name for dish_name, (_, recipe) in zip(dish_names, resolved) if recipe is None],
+        "partial": deadline.exhausted
+    }
+    if failed_shards:
+        result["failed_shards"] = failed_shards
+
+    if deadline.exhausted:
+        print("⏱ Ranking budget exhausted, returning partial results")
+    print(f"📌 Ranked {len(ranking)} dishes: {[details['title'] for _, _, _, details in ranking]}")
+    return result, 200
+
+@app.route("/rank-dishes", methods=["POST"])
+def rank_dishes():
+    """Rank up to RANK_DISHES_MAX dishes by environmental impact.
+
+    Body: `dishes`, a list of dish names. Each ranked entry has the per-dish fields of
+    /compare-dishes plus the requested `dish` name and its `rank`; names without a match
+    are listed in `unmatched`.
+    """
+    try:
+        data = request.get_json(silent=True)
+        print(f"🔥 Parsed JSON: {data}")  # Debug parsed JSON
+
+        dishes = data.get("dishes") if isinstance(data, dict) else None
+        if not isinstance(dishes, list) or not all(isinstance(dish, str) for dish in dishes):
+            print("❌ Invalid request format!")
+            return jsonify({"error": "Invalid request format"}), 400
+
+        dish_names = [dish.strip() for dish in dishes if dish.strip()]
+        if not dish_names:
+            return jsonify({"error": "Dishes cannot be empty"}), 400
+        if len(dish_names) > RANK_DISHES_MAX:
+            return jsonify({"error": f"At most {RANK_DISHES_MAX} dishes can be ranked at once"}), 400
+
+        print(f"✅ Ranking dishes: {dish_names}")
+
+        generation = dataset_store.current_generation()
+        if generation is None:
+            return _not_ready_response()
 
-        print("📌 Final comparison result:", result)
-        return jsonify(result), 200
+        # Identical concurrent rankings with the same latency budget share one computation
+        key = ("rank-dishes", generation.fingerprint, effective_budget_ms("rank-dishes", data.get("budget_ms"))) + tuple(" ".join(name.lower().split()) for name in dish_names)
+        payload, status = _coalesce(key, lambda: run_admitted(
+            "expensive", lambda: _run_ranking(dish_names, generation, data.get("budget_ms"))
+        ))
+        return json_response(payload, status, requested_fields(data))
 
     except Exception as e:
-        print(f"❌ Error comparing dishes: {str(e)}")
+        print(f"❌ Error ranking dishes: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: datasets and indexes are loaded and searches can be served."""
+    generation = dataset_store.current_generation()
+    if STARTUP["state"] == "prewarming":
+        generation = None  # Serving already works, but caches are still being filled
+    body = {
+        "status": "ready" if generation is not None else STARTUP["state"],
+        "error": STARTUP["error"],
+        "startup_seconds": round((STARTUP["ready_at"] or time.time()) - STARTUP["started_at"], 3),
+        "heavy_imports_seconds": STARTUP.get("heavy_imports_seconds")
+    }
+    if generation is None:
+        return jsonify(body), 503
+
+    body.update(generation=generation.number, recipes=len(generation.recipes), build_timings=generation.timings)
+    return jsonify(body), 200
+
+
+# Scoring keeps a second, full-width copy of the emissions table
+register_memory_source(
+    "sustainability.emissions_df",
+    lambda: sustainability.emissions_df.memory_usage(deep=True).sum() if "sustainability" in globals() and sustainability.emissions_df is not None else 0
+)
+
+
+register_memory_source(
+    "emissions.resolution_table",
+    lambda: sum(sys.getsizeof(key) + sys.getsizeof(entry) for key, entry in emissions_module.RESOLUTION_TABLE.items())
+    if "emissions_module" in globals() and emissions_module.RESOLUTION_TABLE else 0
+)
+
+
+register_memory_source("model_scorer", lambda: MODEL_SCORER.nbytes if MODEL_SCORER is not None else 0)
+
+
+register_memory_source(
+    "ingredients.spell_corrector",
+    lambda: spell_corrector_bytes(ingredients_module.SPELL_CORRECTOR)
+    if "ingredients_module" in globals() and ingredients_module.SPELL_CORRECTOR is not None else 0
+)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics: in-flight and queued requests per endpoint class, for autoscaling."""
+    if request.args.get("format") == "json":
+        return jsonify({"admission": admission_snapshot()}), 200
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/debug/memory", methods=["GET"])
+def debug_memory():
+    """Per-structure memory breakdown of the loaded datasets and indexes, plus process RSS."""
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(memory_report(dataset_store.current_generation())), 200
+
+
+@app.route("/admin/reload", methods=["GET", "POST"])
+def admin_reload():
+    """Reload datasets in the background and swap them in without a restart."""
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    if request.method == "GET":
+        generation = dataset_store.current_generation()
+        return jsonify({
+            "reload": dataset_store.reload_status(),
+            "generation": generation.number if generation else None,
+            "recipes": len(generation.recipes) if generation else 0
+        }), 200
+
+    data = request.get_json(silent=True) or {}
+
+    # Only file names inside the datasets directory are accepted
+    delta_path = dataset_store.dataset_path(data["delta_file"]) if data.get("delta_file") else None
+    emissions_path = dataset_store.dataset_path(dataset_store.EMISSIONS_FILENAME) if data.get("reload_emissions") else None
+    if delta_path and SHARD_COORDINATOR is not None:
+        return jsonify({"error": "Recipe deltas are applied on the shard nodes"}), 400
+    for path in (delta_path, emissions_path):
+        if path and not os.path.exists(path):
+            return jsonify({"error": f"Dataset file not found: {os.path.basename(path)}"}), 404
+
+    if not dataset_store.start_reload(full=bool(data.get("full")), delta_path=delta_path, emissions_path=emissions_path):
+        return jsonify({"error": "A reload is already running"}), 409
+
+    print(f"🔄 Dataset reload started (full={bool(data.get('full'))}, delta={delta_path}, emissions={emissions_path})")
+    return jsonify({"status": "reloading", "reload": dataset_store.reload_status()}), 202
+
+
+if not BACKGROUND_LOAD:
+    load_datasets()
+
+
 if __name__ == "__main__":
+    if BACKGROUND_LOAD:
+        start_background_load()
     app.run(debug=True, port=5000)
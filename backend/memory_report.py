@@ -0,0 +1,95 @@
+import sys
+import tracemalloc
+
+# Extra structures (caches, models) report themselves here: name -> callable returning bytes
+_sources = {}
+
+
+def register_memory_source(name, measure):
+    """ Include a structure in the memory report; `measure()` returns its size in bytes. """
+    _sources[name] = measure
+    return measure
+
+
+def process_rss_bytes():
+    """ Resident set size of this process (peak RSS where /proc is unavailable). """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _array_bytes(*arrays):
+    return int(sum(array.nbytes for array in arrays if array is not None))
+
+
+def _dict_bytes(mapping):
+    """ Size of a str-keyed dict including its key strings (values are assumed small ints). """
+    return sys.getsizeof(mapping) + sum(sys.getsizeof(key) for key in mapping)
+
+
+def column_bytes(frame, column):
+    """ Bytes held by one DataFrame column, including the Python string objects it references. """
+    return int(frame[column].memory_usage(deep=True, index=False))
+
+
+def ingredient_index_bytes(index):
+    word_tokens = index._word_tokens or {}
+    return (_array_bytes(index.offsets, index.postings, index.recipe_sizes) + _dict_bytes(index.vocabulary)
+            + _dict_bytes(word_tokens) + sum(sys.getsizeof(ids) for ids in word_tokens.values()))
+
+
+def title_matcher_bytes(matcher):
+    return (_array_bytes(matcher.histograms, matcher.lengths, matcher.joined_lengths, matcher.token_offsets,
+                         matcher.token_postings, matcher.row_offsets, matcher.row_ids, matcher.titles)
+            + sum(sys.getsizeof(title) for title in matcher.titles) + _dict_bytes(matcher.token_vocabulary))
+
+
+def spell_corrector_bytes(corrector):
+    # Words are the vocabulary's own strings, so only the list itself is counted
+    return (_array_bytes(corrector.delete_hashes, corrector.delete_offsets, corrector.delete_postings, corrector.counts)
+            + sys.getsizeof(corrector.words) + _dict_bytes(corrector._memo))
+
+
+def generation_breakdown(generation):
+    """ Per-structure byte counts for one dataset generation. """
+    breakdown = {
+        "recipes.Title": column_bytes(generation.recipes, "Title"),
+        "recipes.Cleaned_Ingredients": column_bytes(generation.recipes, "Cleaned_Ingredients"),
+        "recipes.index": int(generation.recipes.index.memory_usage(deep=True)),
+        "emissions": int(generation.emissions.memory_usage(deep=True).sum()),
+        "ingredient_index": ingredient_index_bytes(generation.ingredient_index),
+        "title_matcher": title_matcher_bytes(generation.title_matcher),
+    }
+    if "Count" in generation.recipes.columns:
+        breakdown["recipes.Count"] = column_bytes(generation.recipes, "Count")
+    return breakdown
+
+
+def memory_report(generation=None):
+    """ Byte breakdown of the loaded structures plus process RSS and traced transient allocations. """
+    structures = generation_breakdown(generation) if generation is not None else {}
+    for name, measure in list(_sources.items()):
+        try:
+            structures[name] = int(measure())
+        except Exception as e:
+            print(f"⚠ Warning: Could not measure {name}: {e}")
+
+    report = {
+        "rss_bytes": process_rss_bytes(),
+        "structures": structures,
+        "structures_total_bytes": sum(structures.values()),
+        "generation": generation.number if generation is not None else None,
+    }
+
+    # Transient per-request allocations are only visible when tracemalloc is on (PYTHONTRACEMALLOC=1)
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report["traced"] = {"current_bytes": current, "peak_bytes": peak}
+    return report
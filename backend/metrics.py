@@ -0,0 +1,34 @@
+# Metric collectors: callables returning [(name, labels dict, value, help text)]
+_collectors = []
+
+
+def register_collector(collect):
+    """ Add a collector whose samples are included in /metrics. """
+    _collectors.append(collect)
+    return collect
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+def render_prometheus():
+    """ All collected samples in the Prometheus text exposition format. """
+    grouped = {}  # Samples of one metric must be contiguous, in first-seen order
+    for collect in _collectors:
+        try:
+            samples = collect()
+        except Exception as e:
+            print(f"⚠ Warning: Metrics collector failed: {e}")
+            continue
+        for name, labels, value, help_text in samples:
+            grouped.setdefault(name, (help_text, []))[1].append((labels, value))
+
+    lines = []
+    for name, (help_text, samples) in grouped.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+        lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
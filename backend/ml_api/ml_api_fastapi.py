@@ -1,11 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import os
 import pickle
 import numpy as np
 from pydantic import BaseModel
 
-# Load the trained model
-MODEL_PATH = r"C:\greenbite\backend\sustainability_model.pkl"
+# Load the trained model (the same pickle and override the main API's in-process scoring uses)
+MODEL_PATH = os.environ.get(
+    "GREENBITE_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sustainability_model.pkl")
+)
 
 try:
     with open(MODEL_PATH, "rb") as model_file:
@@ -0,0 +1,107 @@
+"""
+Latency of the sustainability model in-process vs. through the FastAPI service.
+
+Scores random category totals (shaped like calculate_total_impact's) with the packed
+in-process forest, with the model's own predict, and over HTTP against ml_api's
+/predict (one request per row, as a client of that service has to), then prints
+per-call p50/p95 latency and checks that all three agree.
+
+Usage:
+    uvicorn ml_api.ml_api_fastapi:app --port 8000 &
+    python model_benchmark.py
+    python model_benchmark.py --batch-sizes 1 10 100 --repeat 50 --no-http
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from model_scoring import DEFAULT_MODEL_PATH, MODEL_FEATURES, load_model_scorer
+
+# ml_api's EmissionsData fields, in MODEL_FEATURES order
+HTTP_FIELDS = ["land_use_change", "feed", "farm", "processing", "transport", "packaging", "retail",
+               "total_land_to_retail"]
+
+
+def random_totals(count, seed=0):
+    """ Category totals for `count` synthetic dishes (the last feature is the sum of the stages). """
+    rng = np.random.default_rng(seed)
+    stages = rng.gamma(1.0, 1.5, size=(count, len(MODEL_FEATURES) - 1))
+    return [dict(zip(MODEL_FEATURES, row + [sum(row)])) for row in stages.tolist()]
+
+
+def time_calls(function, batches, repeat):
+    """ Per-call latencies (seconds) of function(batch) over every batch, `repeat` times. """
+    function(batches[0])  # Warm-up
+    timings = []
+    for _ in range(repeat):
+        for batch in batches:
+            started = time.perf_counter()
+            function(batch)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def http_predictor(url):
+    """ Scores a batch with one POST per row to ml_api's /predict, reusing a keep-alive session. """
+    import requests
+    session = requests.Session()
+
+    def predict(batch):
+        scores = []
+        for totals in batch:
+            response = session.post(url, json={field: totals[name] for field, name in zip(HTTP_FIELDS, MODEL_FEATURES)},
+                                    timeout=10)
+            response.raise_for_status()
+            scores.append(response.json()["sustainability_score"])
+        return scores
+    return predict
+
+
+def _report(label, batch_size, timings):
+    p50, p95 = np.percentile(np.array(timings) * 1e6, [50, 95])
+    print(f"{label:>10} {batch_size:>6} {p50:12.0f} {p95:12.0f} {p50 / batch_size:12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process and HTTP sustainability model latency.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--http-url", default="http://127.0.0.1:8000/predict", help="ml_api's /predict endpoint")
+    parser.add_argument("--no-http", action="store_true", help="Only time the in-process paths")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--batches", type=int, default=20, help="Distinct batches per batch size")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    scorer = load_model_scorer(args.model)
+    if scorer is None:
+        return 1
+    predictors = {"sklearn": lambda batch: scorer.model.predict(
+        np.array([[totals[name] for name in MODEL_FEATURES] for totals in batch]))}
+    if scorer.forest is not None:
+        predictors = dict(packed=scorer.predict, **predictors)
+    if not args.no_http:
+        predictors["http"] = http_predictor(args.http_url)
+
+    # Agreement check on one batch before timing anything
+    sample = random_totals(max(args.batch_sizes), seed=1)
+    reference = scorer.predict(sample)
+    for label, predict in predictors.items():
+        scores = [round(float(score), 2) for score in predict(sample)]
+        mismatches = sum(abs(score - expected) > 0.011 for score, expected in zip(scores, reference))
+        print(f"{'✅' if not mismatches else '❌'} {label}: {mismatches} of {len(sample)} predictions differ")
+        if mismatches:
+            return 1
+
+    print(f"{'path':>10} {'rows':>6} {'p50 us':>12} {'p95 us':>12} {'p50 us/row':>12}")
+    for batch_size in args.batch_sizes:
+        batches = [random_totals(batch_size, seed=seed) for seed in range(args.batches)]
+        for label, predict in predictors.items():
+            repeat = 1 if label == "http" and batch_size > 10 else args.repeat
+            _report(label, batch_size, time_calls(predict, batches, repeat))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
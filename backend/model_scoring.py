@@ -0,0 +1,111 @@
+import os
+import pickle
+
+# calculate_total_impact's category totals, in the order the model was trained on (see ml_api)
+MODEL_FEATURES = ["Land Use Change", "Feed", "Farm", "Processing", "Transport", "Packaging", "Retail",
+                  "Total from Land to Retail"]
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sustainability_model.pkl")
+
+
+class PackedForest:
+    """
+    A fitted sklearn tree ensemble (random forest regressor) flattened into one set of
+    node arrays. Prediction walks every tree for every row at once, one depth level per
+    numpy step, instead of sklearn's per-call and per-tree Python overhead.
+    """
+
+    def __init__(self, roots, features, thresholds, left, right, values, depth):
+        self.roots = roots            # node id of each tree's root
+        self.features = features      # split feature per node (-2 for leaves, as in sklearn)
+        self.thresholds = thresholds
+        self.left = left              # leaves point to themselves, so extra steps are no-ops
+        self.right = right
+        self.values = values          # leaf prediction per node
+        self.depth = depth
+
+    @classmethod
+    def from_model(cls, model):
+        """ Pack a RandomForestRegressor-like model; None for anything else (it is then scored with predict). """
+        estimators = getattr(model, "estimators_", None)
+        if not estimators or type(model).__name__ not in ("RandomForestRegressor", "ExtraTreesRegressor"):
+            return None
+        trees = [estimator.tree_ for estimator in estimators]
+        if any(tree.value.shape[1:] != (1, 1) for tree in trees):
+            return None  # Multi-output forests are left to sklearn
+        import numpy as np
+
+        roots, features, thresholds, left, right, values = [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            values.append(tree.value[:, 0, 0])
+            offset += tree.node_count
+        return cls(np.array(roots, dtype=np.int64), np.concatenate(features).astype(np.int64),
+                   np.concatenate(thresholds), np.concatenate(left).astype(np.int64),
+                   np.concatenate(right).astype(np.int64), np.concatenate(values),
+                   max(tree.max_depth for tree in trees))
+
+    def predict(self, features):
+        """ Mean leaf value over all trees for each row of an (n, n_features) array. """
+        import numpy as np
+        # sklearn compares float32 features against float64 thresholds; do the same for identical splits
+        features = np.asarray(features, dtype=np.float32).astype(np.float64)
+        rows = np.arange(len(features))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(features), len(self.roots)))
+        for _ in range(self.depth):
+            go_left = features[rows, self.features[nodes]] <= self.thresholds[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.values[nodes].mean(axis=1)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.roots, self.features, self.thresholds, self.left, self.right, self.values))
+
+
+class ModelScorer:
+    """ The trained sustainability model, scoring category totals in-process (many at a time). """
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self.forest = PackedForest.from_model(model)
+
+    def predict(self, totals_list):
+        """ Model output for each calculate_total_impact totals dict, rounded like the ML API's response. """
+        if not totals_list:
+            return []
+        import numpy as np
+        features = np.array([[float(totals.get(name, 0) or 0) for name in MODEL_FEATURES] for totals in totals_list],
+                            dtype=np.float64)
+        predictions = self.forest.predict(features) if self.forest is not None else self.model.predict(features)
+        return [round(float(value), 2) for value in predictions]
+
+    @property
+    def nbytes(self):
+        return self.forest.nbytes if self.forest is not None else os.path.getsize(self.path)
+
+
+def load_model_scorer(path=DEFAULT_MODEL_PATH):
+    """ Unpickle the model once; None (with a warning) when it cannot be loaded. """
+    try:
+        with open(path, "rb") as model_file:
+            model = pickle.load(model_file)
+    except Exception as e:
+        print(f"⚠ Warning: Could not load sustainability model from {path}: {e}")
+        return None
+    scorer = ModelScorer(model, path)
+    print(f"✅ Sustainability model loaded from {path} ({'packed forest' if scorer.forest is not None else 'predict'})")
+    return scorer
+
+
+def model_scorer_from_env():
+    """ Scorer for GREENBITE_MODEL_PATH (default: the bundled pickle) when GREENBITE_MODEL_SCORING is on. """
+    if os.environ.get("GREENBITE_MODEL_SCORING", "off").lower() not in ("1", "on", "true", "yes"):
+        return None
+    return load_model_scorer(os.environ.get("GREENBITE_MODEL_PATH", DEFAULT_MODEL_PATH))
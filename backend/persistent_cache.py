@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+EVICT_CHECK_EVERY = 200      # Writes between size checks
+STATS_FLUSH_EVERY = 100      # Lookups between hit/miss counter flushes
+TOUCH_INTERVAL = 60.0        # Seconds before a hit refreshes an entry's last access time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    generation TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, generation, key)
+);
+CREATE INDEX IF NOT EXISTS entries_by_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    namespace TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _digest(key):
+    return hashlib.sha1(json.dumps(key, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+
+class PersistentCache:
+    """
+    Host-local cache shared by every worker through one SQLite file (on /dev/shm by
+    default), so cached results outlive worker recycling. Entries are keyed by namespace,
+    dataset generation fingerprint and key, hold JSON values and are evicted least
+    recently used (entries of other generations first) once the file exceeds max_bytes.
+    Any SQLite error is treated as a miss: the cache never fails a request.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending_stats = {}
+        self._lookups = 0
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        """ One connection per thread and process (connections must not cross a fork). """
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _count(self, namespace, hit):
+        with self._lock:
+            hits, misses = self._pending_stats.get(namespace, (0, 0))
+            self._pending_stats[namespace] = (hits + 1, misses) if hit else (hits, misses + 1)
+            self._lookups += 1
+            flush = self._lookups % STATS_FLUSH_EVERY == 0
+        if flush:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """ Add this worker's pending hit/miss counts to the shared totals. """
+        with self._lock:
+            pending, self._pending_stats = self._pending_stats, {}
+        try:
+            connection = self._connection()
+            for namespace, (hits, misses) in pending.items():
+                connection.execute(
+                    "INSERT INTO stats (namespace, hits, misses) VALUES (?, ?, ?) "
+                    "ON CONFLICT(namespace) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                    (namespace, hits, misses)
+                )
+        except sqlite3.Error as e:
+            print(f"⚠ Warning: Could not flush cache stats: {e}")
+
+    def get(self, namespace, generation, key):
+        """ Cached value for a key in this generation, or None. """
+        digest = _digest(key)
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT value, last_access FROM entries WHERE namespace = ? AND generation = ? AND key = ?",
+                (namespace, generation, digest)
+            ).fetchone()
+            if row is not None and time.time() - row[1] > TOUCH_INTERVAL:
+                connection.execute(
+                    "UPDATE entries SET last_access = ? WHERE namespace = ? AND generation = ? AND key = ?",
+                    (time.time(), namespace, generation, digest)
+                )
+        except sqlite3.Error as e:
+            print(f"⚠ Warning: Cache read failed: {e}")
+            row = None
+        self._count(namespace, row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, namespace, generation, key, value):
+        """ Store a JSON-serializable value; evicts old entries when the cache grows past max_bytes. """
+        blob = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO entries (namespace, generation, key, value, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, generation, _digest(key), blob, len(blob), time.time())
+            )
+        except sqlite3.Error as e:
+            print(f"⚠ Warning: Cache write failed: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICT_CHECK_EVERY == 0
+        if check:
+            self.evict(generation)
+
+    def evict(self, current_generation=None):
+        """ Drop entries (other generations first, then least recently used) until under 90% of max_bytes. """
+        try:
+            connection = self._connection()
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            target = total - int(self.max_bytes * 0.9)
+            removed = 0
+            while removed < target:
+                victims = connection.execute(
+                    "SELECT rowid, size FROM entries ORDER BY generation = ?, last_access LIMIT 500",
+                    (current_generation,)
+                ).fetchall()
+                if not victims:
+                    break
+                # Stop at the target rather than at the end of the batch
+                doomed = []
+                for rowid, size in victims:
+                    if removed >= target:
+                        break
+                    doomed.append((rowid,))
+                    removed += size
+                connection.executemany("DELETE FROM entries WHERE rowid = ?", doomed)
+            print(f"🧹 Persistent cache evicted {removed / 1024:.0f} KiB")
+            return removed
+        except sqlite3.Error as e:
+            print(f"⚠ Warning: Cache eviction failed: {e}")
+            return 0
+
+    def stats(self):
+        """ Shared hit/miss totals per namespace plus entry count and size. """
+        self.flush_stats()
+        try:
+            connection = self._connection()
+            namespaces = {namespace: {"hits": hits, "misses": misses}
+                          for namespace, hits, misses in connection.execute("SELECT namespace, hits, misses FROM stats")}
+            for namespace, entries, size in connection.execute(
+                    "SELECT namespace, COUNT(*), SUM(size) FROM entries GROUP BY namespace"):
+                namespaces.setdefault(namespace, {"hits": 0, "misses": 0}).update(entries=entries, bytes=size)
+        except sqlite3.Error as e:
+            print(f"⚠ Warning: Could not read cache stats: {e}")
+            return {}
+        for counts in namespaces.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else 0.0
+        return namespaces
+
+    def metrics(self):
+        """ Samples for /metrics. """
+        samples = []
+        for namespace, counts in self.stats().items():
+            labels = {"namespace": namespace}
+            samples += [
+                ("greenbite_cache_hits_total", labels, counts["hits"], "Persistent cache hits across workers"),
+                ("greenbite_cache_misses_total", labels, counts["misses"], "Persistent cache misses across workers"),
+                ("greenbite_cache_hit_rate", labels, counts["hit_rate"], "Persistent cache hit rate"),
+                ("greenbite_cache_entries", labels, counts.get("entries", 0), "Entries in the persistent cache"),
+                ("greenbite_cache_bytes", labels, counts.get("bytes", 0) or 0, "Bytes of values in the persistent cache"),
+            ]
+        return samples
+
+
+def cache_version(source_paths, settings):
+    """
+    Short digest of the code and settings cached results were computed with: the contents
+    of source_paths (unreadable files count as missing) plus the settings dict. Appended to
+    the generation key, so a deploy or a config change never serves older results.
+    """
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    for path in sorted(source_paths):
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"missing")
+        digest.update(os.path.basename(path).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class GenerationCacheView:
+    """ A namespace of the cache bound to one dataset generation, with a get/set interface. """
+
+    def __init__(self, cache, namespace, generation):
+        self.cache = cache
+        self.namespace = namespace
+        self.generation = generation
+
+    def get(self, key):
+        return self.cache.get(self.namespace, self.generation, key)
+
+    def set(self, key, value):
+        self.cache.set(self.namespace, self.generation, key, value)
+
+
+def persistent_cache_from_env():
+    """ Cache at GREENBITE_CACHE_PATH (default on /dev/shm) capped at GREENBITE_CACHE_MAX_MB; None if GREENBITE_CACHE=off. """
+    if os.environ.get("GREENBITE_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    path = os.environ.get("GREENBITE_CACHE_PATH", os.path.join(default_dir, "greenbite-cache.sqlite3"))
+    try:
+        max_bytes = int(float(os.environ.get("GREENBITE_CACHE_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024)
+        return PersistentCache(path, max_bytes)
+    except (ValueError, sqlite3.Error, OSError) as e:
+        print(f"⚠ Warning: Persistent cache disabled: {e}")
+        return None
@@ -0,0 +1,197 @@
+import atexit
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+# fcntl serializes flushes from several workers; without it (Windows) the last writer wins
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SKETCH_WIDTH = 4096
+SKETCH_DEPTH = 4
+HEAVY_HITTERS = 256          # Most frequent queries tracked by key
+DEFAULT_FLUSH_SECONDS = 60.0
+
+
+class CountMinSketch:
+    """
+    Approximate counts for an unbounded set of keys in fixed memory: each key increments
+    one counter per row, and its estimate is the smallest of those counters (never an
+    undercount). Updates are conservative (only counters below the new estimate grow),
+    which keeps collisions from inflating estimates. Sketches of the same shape merge by
+    adding their counters, which is still an upper bound.
+    """
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, counts=None):
+        import numpy as np
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else np.zeros((depth, width), dtype=np.int64)
+
+    def _cells(self, key):
+        # Stable across processes (unlike hash()), so sketches persisted by any worker line up
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+                for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        """ Count key and return its new estimate. """
+        flat = self.counts.reshape(-1)
+        cells = self._cells(key)
+        values = [int(flat[cell]) for cell in cells]
+        estimate = min(values) + count
+        for cell, value in zip(cells, values):
+            if value < estimate:
+                flat[cell] = estimate
+        return estimate
+
+    def estimate(self, key):
+        flat = self.counts.reshape(-1)
+        return min(int(flat[cell]) for cell in self._cells(key))
+
+
+def _key_text(key):
+    return "\t".join(key)
+
+
+class QueryPopularity:
+    """
+    Popularity of normalized queries, as ("search", query) or ("compare-dishes", dish1,
+    dish2) keys: a count-min sketch over every query plus the HEAVY_HITTERS most frequent
+    keys. Each worker counts locally and periodically merges what it counted since the
+    last flush into one file shared by all workers and restarts.
+    """
+
+    def __init__(self, path, flush_seconds=DEFAULT_FLUSH_SECONDS, capacity=HEAVY_HITTERS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.capacity = capacity
+        self.sketch = CountMinSketch()
+        self.heavy = {}              # key tuple -> estimated count
+        self._floor = 0              # Smallest heavy hitter count once the list is full
+        self._flushed = self.sketch.counts.copy()  # Counters as of the last flush (the shared part)
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self.load()
+
+    def record(self, *key):
+        """ Count one query; cheap enough to call on every request. """
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+        with self._lock:
+            self._offer(key, self.sketch.add(_key_text(key)))
+
+    def _offer(self, key, count):
+        if key in self.heavy or len(self.heavy) < self.capacity:
+            self.heavy[key] = count
+        elif count > self._floor:
+            del self.heavy[min(self.heavy, key=self.heavy.get)]
+            self.heavy[key] = count
+        else:
+            return
+        if len(self.heavy) >= self.capacity:
+            self._floor = min(self.heavy.values())
+
+    def top(self, n):
+        """ The n most popular keys with their estimated counts, most popular first. """
+        with self._lock:
+            return sorted(self.heavy.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def load(self):
+        """ Replace local state with the shared file (missing or unreadable files start empty). """
+        import numpy as np
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            counts = np.frombuffer(base64.b64decode(state["counts"]), dtype="<i8").reshape(state["depth"], state["width"])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠ Warning: Could not read query popularity from {self.path}: {e}")
+            return
+        if counts.shape != self.sketch.counts.shape:
+            print("⚠ Warning: Query popularity sketch has a different shape, starting empty")
+            return
+        with self._lock:
+            self._merge_state(counts.copy(), [tuple(key) for key, _ in state.get("heavy_hitters", [])])
+
+    def _merge_state(self, counts, candidates):
+        """ Adopt counts and rebuild the heavy hitters from the candidate keys' estimates. """
+        self.sketch.counts = counts
+        self._flushed = counts.copy()
+        estimates = {key: self.sketch.estimate(_key_text(key)) for key in set(candidates) | set(self.heavy)}
+        self.heavy = dict(sorted(estimates.items(), key=lambda item: (-item[1], item[0]))[:self.capacity])
+        self._floor = min(self.heavy.values()) if len(self.heavy) >= self.capacity else 0
+
+    def flush(self):
+        """ Add this worker's counts since the last flush to the shared file and pick up the other workers'. """
+        import numpy as np
+        lock_file = None
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if fcntl is not None:
+                lock_file = open(self.path + ".lock", "w")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                delta = self.sketch.counts - self._flushed
+                changed = bool(delta.any())
+                shared, candidates = np.zeros_like(delta), list(self.heavy)
+                try:
+                    with open(self.path) as f:
+                        state = json.load(f)
+                    stored = np.frombuffer(base64.b64decode(state["counts"]), dtype="<i8")
+                    if stored.size == delta.size:
+                        shared = stored.reshape(delta.shape).copy()
+                        candidates += [tuple(key) for key, _ in state.get("heavy_hitters", [])]
+                except (FileNotFoundError, ValueError, KeyError, TypeError):
+                    pass  # Missing or corrupt: rewritten from this worker's counts
+                self._merge_state(shared + delta, candidates)
+                state = {
+                    "width": self.sketch.width, "depth": self.sketch.depth, "saved_at": time.time(),
+                    "counts": base64.b64encode(self.sketch.counts.astype("<i8").tobytes()).decode("ascii"),
+                    "heavy_hitters": [[list(key), count] for key, count in self.heavy.items()]
+                }
+            if not changed:
+                return  # Only picked up the other workers' counts
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"⚠ Warning: Could not save query popularity: {e}")
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def _start_flusher(self):
+        """ Flush periodically and at exit, once per process (threads do not survive a fork). """
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(self.flush_seconds)
+                self.flush()
+
+        threading.Thread(target=run, name="popularity-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+
+def query_popularity_from_env(default_dir):
+    """ Tracker persisted to GREENBITE_POPULARITY_PATH (default: in default_dir); None if GREENBITE_POPULARITY=off. """
+    if os.environ.get("GREENBITE_POPULARITY", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    path = os.environ.get("GREENBITE_POPULARITY_PATH", os.path.join(default_dir, "query_popularity.json"))
+    try:
+        flush_seconds = float(os.environ.get("GREENBITE_POPULARITY_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS))
+    except ValueError:
+        print("⚠ Warning: Invalid GREENBITE_POPULARITY_FLUSH_SECONDS, using default")
+        flush_seconds = DEFAULT_FLUSH_SECONDS
+    return QueryPopularity(path, flush_seconds)
@@ -0,0 +1,129 @@
+import cProfile
+import os
+import pstats
+import random
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+from flask import g, request
+
+PROFILE_DIR = os.environ.get("GREENBITE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "greenbite-profiles"))
+PROFILE_HEADER = "X-Profile"  # Admin requests send "X-Profile: 1" to profile that one request
+
+try:
+    SAMPLE_RATE = float(os.environ.get("GREENBITE_PROFILE_SAMPLE_RATE", "0"))
+except ValueError:
+    print("⚠ Warning: Invalid GREENBITE_PROFILE_SAMPLE_RATE, profiling sampling disabled")
+    SAMPLE_RATE = 0.0
+
+
+def _label(func):
+    """ Short frame label for a pstats function key (filename, line, name). """
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-ins, e.g. "<method 'sort' of 'list' objects>"
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+
+def collapsed_stacks(stats, min_seconds=1e-6, max_depth=64):
+    """
+    Approximate flamegraph stacks ("a;b;c" -> microseconds) from a deterministic profile.
+    cProfile only records caller/callee edges, so each function's time is split across
+    its callees in proportion to the cumulative time spent through each edge.
+    """
+    entries = stats.stats
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge[3]
+
+    stacks = defaultdict(float)
+
+    def walk(func, path, on_stack, seconds):
+        cumulative = entries[func][3]
+        if cumulative <= 0 or seconds < min_seconds:
+            return
+        path = path + (_label(func),)
+        share = min(seconds / cumulative, 1.0)
+        stacks[";".join(path)] += entries[func][2] * share
+        if len(path) >= max_depth:
+            return
+        for callee, edge_seconds in callees.get(func, {}).items():
+            if callee not in on_stack:  # recursive calls are already inside the caller's time
+                walk(callee, path, on_stack | {callee}, edge_seconds * share)
+
+    for func, entry in entries.items():
+        if not entry[4]:  # no callers: a root of the profiled call graph
+            walk(func, (), {func}, entry[3])
+
+    return {stack: int(seconds * 1e6) for stack, seconds in stacks.items() if seconds * 1e6 >= 1}
+
+
+def _request_tag():
+    """ Endpoint plus a filesystem-safe excerpt of the query this request is about. """
+    data = request.get_json(silent=True) if request.is_json else None
+    subject = ""
+    if isinstance(data, dict):
+        for key in ("query", "dish1", "ingredients", "dishes"):
+            if data.get(key):
+                subject = data[key] if isinstance(data[key], str) else "-".join(map(str, data[key]))
+                break
+    endpoint = request.path.strip("/").replace("/", "-") or "root"
+    slug = re.sub(r"[^a-z0-9]+", "-", str(subject).lower()).strip("-")[:40]
+    return f"{endpoint}-{slug}" if slug else endpoint
+
+
+def write_profile(profiler, tag, directory=PROFILE_DIR):
+    """ Dump pstats and collapsed stacks for one profiled request; returns the shared file prefix. """
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{tag}")
+    profiler.dump_stats(prefix + ".pstats")
+
+    stacks = collapsed_stacks(pstats.Stats(profiler))
+    with open(prefix + ".collapsed", "w") as f:
+        for stack, microseconds in sorted(stacks.items()):
+            f.write(f"{stack} {microseconds}\n")
+    return prefix
+
+
+def install_profiling(app, is_admin_request):
+    """
+    Register the profiling hooks on the app. Nothing is registered unless sampling is
+    configured or an admin token exists, so requests pay nothing when profiling is off.
+    """
+    if SAMPLE_RATE <= 0 and not os.environ.get("GREENBITE_ADMIN_TOKEN"):
+        return False
+
+    @app.before_request
+    def start_profile():
+        requested = request.headers.get(PROFILE_HEADER) == "1" and is_admin_request()
+        if not requested and (SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None  # another request on this interpreter is already being profiled
+        g.profiler = profiler
+        g.profile_requested = requested
+        return None
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        try:
+            prefix = write_profile(profiler, _request_tag())
+            print(f"🧪 Profile written: {prefix}.pstats / .collapsed")
+            if g.pop("profile_requested", False):
+                response.headers["X-Profile-Path"] = prefix
+        except OSError as e:
+            print(f"⚠ Warning: Could not write profile: {e}")
+        return response
+
+    print(f"🧪 Request profiling available (sample rate {SAMPLE_RATE}, dir {PROFILE_DIR})")
+    return True
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+from recipe_index import parse_ingredient_list
+
+MAX_NEAR_DUPLICATE_GROUPS = 200  # Distinct ingredient sets per title compared pairwise; larger titles stay exact
+
+
+def _factorize_with_missing(values):
+    """ pd.factorize with missing values as one more code (use_na_sentinel=False needs pandas 1.5). """
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype=object)
+    missing = codes < 0
+    if missing.any():
+        codes = np.where(missing, len(uniques), codes)
+        uniques = np.append(uniques, None)
+    return codes, uniques
+
+
+def _ingredient_sets(raw_column):
+    """ Normalized ingredient set of every row (frozensets are interned per distinct raw value). """
+    codes, uniques = pd.factorize(raw_column)
+    sets = [frozenset(parse_ingredient_list(raw)) for raw in uniques]
+    empty = frozenset()
+    return [sets[code] if code >= 0 else empty for code in codes.tolist()]
+
+
+def _jaccard(a, b):
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+
+def group_recipes(titles, raw_ingredients, near_duplicate=None):
+    """
+    Assign every row to a canonical recipe group. Rows are grouped by exact title plus
+    normalized ingredient set; with `near_duplicate` (a Jaccard threshold in (0, 1]) the
+    groups of one title whose ingredient sets are at least that similar are merged too,
+    each into the earliest group it is close to.
+    Returns (group id per row, in first-row order; first row of each group; rows per group).
+    """
+    title_codes, _ = _factorize_with_missing(titles)
+    ingredient_sets = _ingredient_sets(raw_ingredients)
+    set_codes, distinct_sets = pd.factorize(pd.Series(ingredient_sets, dtype=object))
+    _, first_rows, group_ids = np.unique(
+        np.asarray(title_codes, dtype=np.int64) * len(distinct_sets) + set_codes, return_index=True, return_inverse=True
+    )
+
+    if near_duplicate is not None and len(first_rows):
+        # Exact groups sharing a title, visited in corpus order
+        parents = np.arange(len(first_rows))
+        group_titles = np.asarray(title_codes)[first_rows]
+        order = np.lexsort((first_rows, group_titles))
+        bounds = np.flatnonzero(np.diff(group_titles[order])) + 1
+        for members in np.split(order, bounds):
+            if len(members) < 2 or len(members) > MAX_NEAR_DUPLICATE_GROUPS:
+                continue
+            canonical = []
+            for group in members.tolist():
+                ingredients = ingredient_sets[first_rows[group]]
+                target = next((other for other in canonical
+                               if _jaccard(ingredients, ingredient_sets[first_rows[other]]) >= near_duplicate), None)
+                if target is None:
+                    canonical.append(group)
+                else:
+                    parents[group] = target
+        _, first_rows, group_ids = np.unique(first_rows[parents][group_ids], return_index=True, return_inverse=True)
+
+    # Renumber groups in order of their first row, so compacted rows keep the corpus order
+    order = np.argsort(first_rows, kind="stable")
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    group_ids = renumber[group_ids.reshape(-1)]
+    counts = np.bincount(group_ids, minlength=len(order)).astype(np.int32)
+    return group_ids, first_rows[order], counts
+
+
+def compact_recipes(recipes_df, near_duplicate=None):
+    """
+    Keep one representative row (the first) per canonical recipe group, with the group's
+    size in a Count column (summed when rows already carry counts, e.g. compacted deltas).
+    """
+    group_ids, first_rows, counts = group_recipes(recipes_df["Title"], recipes_df["Cleaned_Ingredients"], near_duplicate)
+    if "Count" in recipes_df.columns:
+        counts = np.bincount(group_ids, weights=recipes_df["Count"].values, minlength=len(first_rows)).astype(np.int32)
+    compacted = recipes_df.iloc[first_rows].reset_index(drop=True)
+    compacted["Count"] = counts
+    print(f"✅ Corpus compacted: {len(recipes_df)} rows -> {len(compacted)} canonical recipes")
+    return compacted
+
+
+def _title_key(title):
+    return None if pd.isna(title) else str(title)
+
+
+class RecipeGroupIndex:
+    """
+    Sorted hashes of a compacted corpus's (title, ingredient set) keys and of its titles,
+    each with the row holding it, so appended rows are grouped against the corpus without
+    regrouping it. Hash hits are verified against the rows themselves.
+    """
+
+    def __init__(self, key_hashes, key_rows, title_hashes, title_rows):
+        self.key_hashes = key_hashes      # sorted (title, ingredient set) hashes
+        self.key_rows = key_rows          # row of each key, ascending within equal hashes
+        self.title_hashes = title_hashes  # sorted title hashes
+        self.title_rows = title_rows
+
+    def extended(self, key_hashes, title_hashes, first_row):
+        """ A copy that also holds rows first_row onwards with the given hashes. """
+        rows = np.arange(first_row, first_row + len(key_hashes), dtype=np.int32)
+        return RecipeGroupIndex(*_insert_sorted(self.key_hashes, self.key_rows, key_hashes, rows),
+                                *_insert_sorted(self.title_hashes, self.title_rows, title_hashes, rows))
+
+    def key_rows_for(self, key_hash):
+        return self.key_rows[np.searchsorted(self.key_hashes, key_hash):np.searchsorted(self.key_hashes, key_hash, "right")]
+
+    def title_rows_for(self, title_hash):
+        return self.title_rows[np.searchsorted(self.title_hashes, title_hash):np.searchsorted(self.title_hashes, title_hash, "right")]
+
+
+def _insert_sorted(hashes, rows, new_hashes, new_rows):
+    """ Insert (hash, row) pairs into sorted arrays; new rows are larger, so they go after equal hashes. """
+    order = np.lexsort((new_rows, new_hashes))
+    positions = np.searchsorted(hashes, new_hashes[order], side="right")
+    return np.insert(hashes, positions, new_hashes[order]), np.insert(rows, positions, new_rows[order])
+
+
+def _row_hashes(titles, raw_ingredients):
+    """ (title, ingredient set) and title hashes of every row, plus the rows' title keys and ingredient sets. """
+    title_codes, unique_titles = _factorize_with_missing(titles)
+    unique_keys = [_title_key(title) for title in unique_titles]
+    title_keys = [unique_keys[code] for code in title_codes.tolist()]
+    ingredient_sets = _ingredient_sets(raw_ingredients)
+    key_hashes = np.fromiter((hash(key) for key in zip(title_keys, ingredient_sets)), dtype=np.int64, count=len(title_keys))
+    title_hashes = np.array([hash(key) for key in unique_keys], dtype=np.int64)[title_codes]
+    return key_hashes, title_hashes, title_keys, ingredient_sets
+
+
+def build_group_index(recipes_df):
+    """ Index a compacted corpus's rows (each one canonical recipe group) for append_compacted. """
+    key_hashes, title_hashes, _, _ = _row_hashes(recipes_df["Title"], recipes_df["Cleaned_Ingredients"])
+    no_rows = np.empty(0, dtype=np.int32)
+    return RecipeGroupIndex(np.empty(0, dtype=np.int64), no_rows, np.empty(0, dtype=np.int64), no_rows).extended(
+        key_hashes, title_hashes, first_row=0
+    )
+
+
+def append_compacted(recipes_df, group_index, delta_df, near_duplicate=None):
+    """
+    Append rows to a compacted corpus, grouping only the new rows: a row whose title and
+    ingredient set are already a canonical row's raises that row's Count, and the rest form
+    new groups appended in first-row order. With `near_duplicate`, a new group merges into the
+    first of its title's canonical recipes (the corpus's, then earlier new ones) it is that
+    close to, as compact_recipes would. The result equals compact_recipes over the corpus plus
+    the rows; recipes_df is not modified.
+    Returns (the extended corpus, its group index).
+    """
+    num_rows = len(recipes_df)
+    key_hashes, title_hashes, title_keys, ingredient_sets = _row_hashes(delta_df["Title"], delta_df["Cleaned_Ingredients"])
+    titles = recipes_df["Title"].values
+    raw_ingredients = recipes_df["Cleaned_Ingredients"].values
+    corpus_sets = {}
+
+    def corpus_set(row):
+        if row not in corpus_sets:
+            corpus_sets[row] = frozenset(parse_ingredient_list(raw_ingredients[row]))
+        return corpus_sets[row]
+
+    # Exact keys: an existing canonical row, else the first appended row with the key
+    targets = np.empty(len(delta_df), dtype=np.int64)
+    new_groups = {}   # key -> new group number
+    first_positions = []
+    for position, key in enumerate(zip(title_keys, ingredient_sets)):
+        group = new_groups.get(key)
+        if group is None:
+            row = next((row for row in group_index.key_rows_for(key_hashes[position]).tolist()
+                        if _title_key(titles[row]) == key[0] and corpus_set(row) == key[1]), None)
+            if row is not None:
+                targets[position] = row
+                continue
+            group = new_groups[key] = len(first_positions)
+            first_positions.append(position)
+        targets[position] = num_rows + group
+
+    parents = np.arange(num_rows, num_rows + len(first_positions))
+    if near_duplicate is not None and first_positions:
+        groups_by_title = {}
+        for group, position in enumerate(first_positions):
+            groups_by_title.setdefault(title_keys[position], []).append(group)
+        for title, groups in groups_by_title.items():
+            rows = sorted(row for row in group_index.title_rows_for(title_hashes[first_positions[groups[0]]]).tolist()
+                          if _title_key(titles[row]) == title)
+            if len(rows) + len(groups) < 2 or len(rows) + len(groups) > MAX_NEAR_DUPLICATE_GROUPS:
+                continue
+            canonical = [(corpus_set(row), row) for row in rows]
+            for group in groups:
+                ingredients = ingredient_sets[first_positions[group]]
+                target = next((other for other_ingredients, other in canonical
+                               if _jaccard(ingredients, other_ingredients) >= near_duplicate), None)
+                if target is None:
+                    canonical.append((ingredients, num_rows + group))
+                else:
+                    parents[group] = target
+        targets = np.where(targets >= num_rows, parents[np.maximum(targets - num_rows, 0)], targets)
+
+    # Surviving new groups are renumbered in first-row order after the corpus rows
+    kept = np.flatnonzero(parents == np.arange(num_rows, num_rows + len(first_positions)))
+    renumber = np.full(len(first_positions), -1, dtype=np.int64)
+    renumber[kept] = num_rows + np.arange(len(kept))
+    targets = np.where(targets >= num_rows, renumber[np.maximum(targets - num_rows, 0)], targets)
+
+    weights = delta_df["Count"].values if "Count" in delta_df.columns else None
+    counts = np.bincount(targets, weights=weights, minlength=num_rows + len(kept))
+    counts[:num_rows] += recipes_df["Count"].values
+    new_positions = np.asarray(first_positions, dtype=np.int64)[kept]
+    compacted = pd.concat([recipes_df, delta_df.iloc[new_positions]], ignore_index=True)
+    compacted["Count"] = counts.astype(np.int32)
+    print(f"✅ Delta compacted: {len(delta_df)} rows -> {len(kept)} new canonical recipes")
+    return compacted, group_index.extended(key_hashes[new_positions], title_hashes[new_positions], num_rows)
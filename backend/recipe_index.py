@@ -0,0 +1,234 @@
+import re
+from array import array
+
+import numpy as np
+
+from emissions import match_ingredients_with_emissions, calculate_total_impact
+
+
+def parse_ingredient_list(raw_ingredients):
+    """ Split a raw Cleaned_Ingredients value into normalized ingredient names. """
+    if not isinstance(raw_ingredients, str) or not raw_ingredients:
+        return []
+
+    # Same cleaning as extract_ingredients so both paths agree on ingredient names
+    cleaned = re.sub(r'[^\w\s,]', '', raw_ingredients)
+    ingredients = []
+    for ingredient in cleaned.split(','):
+        ingredient = " ".join(ingredient.lower().split())
+        if ingredient:
+            ingredients.append(ingredient)
+    return ingredients
+
+
+def _intersect_sorted(small, large):
+    """ Intersect two sorted id arrays by binary-searching the smaller one into the larger one. """
+    if len(small) == 0 or len(large) == 0:
+        return small[:0]
+    positions = np.searchsorted(large, small)
+    positions[positions == len(large)] = len(large) - 1
+    return small[large[positions] == small]
+
+
+class IngredientIndex:
+    """ Inverted index from interned ingredient names to sorted recipe row ids. """
+
+    def __init__(self, vocabulary, offsets, postings, recipe_sizes):
+        self.vocabulary = vocabulary          # ingredient -> token id
+        self.offsets = offsets                # token id -> start of its posting list
+        self.postings = postings              # concatenated sorted row ids (int32)
+        self.recipe_sizes = recipe_sizes      # row id -> number of distinct ingredients
+        self._word_tokens = None
+
+    @property
+    def num_recipes(self):
+        return len(self.recipe_sizes)
+
+    def posting_list(self, token_id):
+        """ Return the sorted row ids for a token id (a view, no copy). """
+        return self.postings[self.offsets[token_id]:self.offsets[token_id + 1]]
+
+    def _tokens_by_word(self):
+        """ Lazily map single words to every token containing them ("chicken" -> "chicken breast"). """
+        if self._word_tokens is None:
+            word_tokens = {}
+            for token, token_id in self.vocabulary.items():
+                for word in set(token.split()):
+                    word_tokens.setdefault(word, []).append(token_id)
+            self._word_tokens = word_tokens
+        return self._word_tokens
+
+    def resolve_term(self, term, expand=True):
+        """ Resolve a user-supplied ingredient to the token ids it should match. """
+        term = " ".join(term.lower().split())
+        if not term:
+            return []
+
+        # Exact token first, then simple singular/plural variants
+        singular = term[:-1] if term.endswith("s") else term
+        for candidate in (term, singular, term + "s", term + "es"):
+            if candidate in self.vocabulary:
+                token_ids = [self.vocabulary[candidate]]
+                break
+        else:
+            token_ids = []
+
+        if expand:
+            word_tokens = self._tokens_by_word()
+            words = term.split()
+            expanded = set(word_tokens.get(words[0], ()))
+            for word in words[1:]:
+                expanded &= set(word_tokens.get(word, ()))
+            token_ids = sorted(set(token_ids) | expanded)
+
+        return token_ids
+
+    def term_postings(self, term, expand=True):
+        """ Return the sorted row ids of every recipe containing the given ingredient. """
+        token_ids = self.resolve_term(term, expand=expand)
+        if not token_ids:
+            return np.empty(0, dtype=np.int32)
+        if len(token_ids) == 1:
+            return self.posting_list(token_ids[0])
+        return np.unique(np.concatenate([self.posting_list(token_id) for token_id in token_ids]))
+
+    def search(self, terms, match="any", limit=20, expand=True):
+        """
+        Find recipes containing the given ingredients.
+
+        Returns (row_ids, overlaps, total_matches) with rows ranked by how many of the
+        requested ingredients they contain, then by how few extra ingredients they need.
+        """
+        term_lists = [self.term_postings(term, expand=expand) for term in terms]
+        term_lists = [postings for postings in term_lists if len(postings)] if match == "any" else term_lists
+        if not term_lists:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), 0
+
+        if match == "all":
+            # Intersect smallest-first so each step only probes the shortest surviving list
+            term_lists.sort(key=len)
+            row_ids = term_lists[0]
+            for postings in term_lists[1:]:
+                row_ids = _intersect_sorted(row_ids, postings)
+                if len(row_ids) == 0:
+                    break
+            overlaps = np.full(len(row_ids), len(term_lists), dtype=np.int32)
+        else:
+            row_ids, overlaps = np.unique(np.concatenate(term_lists), return_counts=True)
+
+        total_matches = len(row_ids)
+        if total_matches == 0:
+            return row_ids, overlaps.astype(np.int32), 0
+
+        # Rank by overlap (desc), then recipe size (asc), then row id for stable output
+        order = np.lexsort((row_ids, self.recipe_sizes[row_ids], -overlaps))
+        order = order[:limit]
+        return row_ids[order].astype(np.int32), overlaps[order].astype(np.int32), total_matches
+
+
+    def matched_ingredient_counts(self, terms, row_ids, expand=True):
+        """ Number of each row's distinct ingredients matched by any of the terms (the rest are missing). """
+        token_ids = sorted({token_id for term in terms for token_id in self.resolve_term(term, expand=expand)})
+        counts = np.zeros(len(row_ids), dtype=np.int32)
+        for token_id in token_ids:
+            postings = self.posting_list(token_id)
+            if len(postings) == 0:
+                continue
+            positions = np.minimum(np.searchsorted(postings, row_ids), len(postings) - 1)
+            counts += postings[positions] == row_ids
+        return counts
+
+
+def _collect_postings(ingredient_column, vocabulary, row_offset=0):
+    """ Parse an ingredient column into (token_ids, row_ids, recipe_sizes), growing vocabulary in place. """
+    token_ids = array("i")
+    row_ids = array("i")
+    recipe_sizes = np.zeros(len(ingredient_column), dtype=np.int16)
+
+    for position, raw_ingredients in enumerate(ingredient_column):
+        seen = set()
+        for ingredient in parse_ingredient_list(raw_ingredients):
+            token_id = vocabulary.setdefault(ingredient, len(vocabulary))
+            if token_id not in seen:
+                seen.add(token_id)
+                token_ids.append(token_id)
+                row_ids.append(row_offset + position)
+        recipe_sizes[position] = min(len(seen), np.iinfo(np.int16).max)
+
+    return np.frombuffer(token_ids, dtype=np.int32), np.frombuffer(row_ids, dtype=np.int32), recipe_sizes
+
+
+def group_postings(token_ids, row_ids, num_tokens):
+    """ Group (token, row) pairs into CSR offsets and postings; a stable sort keeps row ids ascending. """
+    order = np.argsort(token_ids, kind="stable")
+    postings = row_ids[order].copy()
+    counts = np.bincount(token_ids, minlength=num_tokens)
+    offsets = np.zeros(num_tokens + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets, postings
+
+
+def build_ingredient_index(ingredient_column):
+    """ Build an IngredientIndex over a Cleaned_Ingredients column. """
+    vocabulary = {}
+    token_ids, row_ids, recipe_sizes = _collect_postings(ingredient_column, vocabulary)
+    offsets, postings = group_postings(token_ids, row_ids, len(vocabulary))
+
+    print(f"✅ Ingredient index built: {len(vocabulary)} ingredients, {len(postings)} postings")
+    return IngredientIndex(vocabulary, offsets, postings, recipe_sizes)
+
+
+def append_postings(offsets, postings, token_ids, row_ids, num_tokens):
+    """
+    Merge (token, row) pairs into a copy of a CSR index whose rows all precede them.
+
+    Existing posting lists keep their order at the front of each list and the new rows,
+    which have larger ids, go after them, so every list stays sorted without a re-sort.
+    """
+    delta_offsets, delta_postings = group_postings(token_ids, row_ids, num_tokens)
+    old_counts = np.zeros(num_tokens, dtype=np.int64)
+    old_counts[:len(offsets) - 1] = np.diff(offsets)
+    delta_counts = np.diff(delta_offsets)
+
+    merged_offsets = np.zeros(num_tokens + 1, dtype=np.int64)
+    np.cumsum(old_counts + delta_counts, out=merged_offsets[1:])
+    merged = np.empty(merged_offsets[-1], dtype=postings.dtype)
+
+    old_token_of = np.repeat(np.arange(num_tokens), old_counts)
+    old_rank = np.arange(len(postings)) - offsets[old_token_of]
+    merged[merged_offsets[old_token_of] + old_rank] = postings
+
+    delta_token_of = np.repeat(np.arange(num_tokens), delta_counts)
+    delta_rank = np.arange(len(delta_postings)) - delta_offsets[delta_token_of]
+    merged[merged_offsets[delta_token_of] + old_counts[delta_token_of] + delta_rank] = delta_postings
+    return merged_offsets, merged
+
+
+def extend_ingredient_index(index, ingredient_column):
+    """
+    Return a new IngredientIndex covering index's recipes plus appended rows.
+
+    Only the appended rows are parsed; existing posting lists are copied into the
+    merged arrays, and the original index is left untouched for in-flight readers.
+    """
+    vocabulary = dict(index.vocabulary)
+    old_tokens = len(index.vocabulary)
+    token_ids, row_ids, delta_sizes = _collect_postings(ingredient_column, vocabulary, row_offset=index.num_recipes)
+    offsets, postings = append_postings(index.offsets, index.postings, token_ids, row_ids, len(vocabulary))
+
+    recipe_sizes = np.concatenate([index.recipe_sizes, delta_sizes])
+    print(f"✅ Ingredient index extended: +{len(delta_sizes)} recipes, {len(vocabulary) - old_tokens} new ingredients")
+    return IngredientIndex(vocabulary, offsets, postings, recipe_sizes)
+
+
+def rank_recipes_by_emissions(recipes, emissions_dataset):
+    """ Attach total emissions to each recipe dict and resolve every distinct ingredient only once. """
+    unique_ingredients = sorted({ingredient for recipe in recipes for ingredient in recipe["ingredients"]})
+    matched = match_ingredients_with_emissions(unique_ingredients, emissions_dataset)
+
+    for recipe in recipes:
+        recipe_matched = {ingredient: matched[ingredient] for ingredient in recipe["ingredients"] if ingredient in matched}
+        _, total_emissions = calculate_total_impact(recipe_matched)
+        recipe["total_emissions"] = round(total_emissions, 2)
+
+    return recipes
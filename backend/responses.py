@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+
+from flask import Response, request
+
+# Optional faster encoder and brotli support; both fall back to the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("GREENBITE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# Keys kept in every response regardless of `fields`
+ALWAYS_INCLUDED = {"error", "partial", "total_matches", "next_cursor", "retry_after"}
+
+
+def _default(value):
+    """ Serialize numpy scalars/arrays the way jsonify would via float()/list(). """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """ Serialize a payload to compact UTF-8 JSON bytes. """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def requested_fields(data=None):
+    """ Field paths from ?fields=a,b.c or a "fields" list/string in the JSON body (None = everything). """
+    raw = request.args.get("fields")
+    if raw is None and isinstance(data, dict):
+        raw = data.get("fields")
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    fields = [field.strip() for field in raw if isinstance(field, str) and field.strip()]
+    return fields or None
+
+
+def _build_tree(fields):
+    """ Turn dotted paths into a nested selection tree ({} means take the whole value). """
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _project(value, tree):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+def select_fields(payload, fields):
+    """
+    Keep only the requested dotted field paths; lists are traversed, so
+    "recipes.title" keeps the title of every recipe.
+    """
+    if not fields or not isinstance(payload, dict):
+        return payload
+    selected = _project(payload, _build_tree(fields))
+    for key in ALWAYS_INCLUDED:
+        if key in payload and key not in selected:
+            selected[key] = payload[key]
+    return selected
+
+
+def _accepted_encodings():
+    """ Encodings the client accepts (q=0 entries excluded). """
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        pieces = [piece.strip() for piece in part.split(";")]
+        if not pieces[0]:
+            continue
+        if any(piece.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for piece in pieces[1:]):
+            continue
+        accepted.add(pieces[0].lower())
+    return accepted
+
+
+def bytes_response(body, status=200, mimetype="application/json"):
+    """ Build a response from serialized bytes, compressing bodies above the size threshold. """
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        accepted = _accepted_encodings()
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, status=status, mimetype=mimetype, headers=headers)
+
+
+def json_response(payload, status=200, fields=None):
+    """ Serialize (optionally field-selected) payload with the fast encoder and compress it. """
+    return bytes_response(dumps(select_fields(payload, fields)), status)
@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+
+from emissions import (EMISSION_CATEGORIES, match_ingredients_with_emissions, calculate_total_impact,
+                       calculate_emissions_equivalence, calculate_sustainability_score)
+from sustainability import get_emissions_dataset, get_sustainability_score, score_matched_ingredients
+
+# Scoring shared by the API (/predict, /compare-dishes) and the bulk scoring CLI
+
+# In-process sustainability model (model_scoring.ModelScorer); when set, results also carry its "model_score"
+MODEL_SCORER = None
+
+
+def set_model_scorer(scorer):
+    """ Install (or clear with None) the model used for "model_score". """
+    global MODEL_SCORER
+    MODEL_SCORER = scorer
+
+
+def score_ingredients(ingredients, emissions_dataset):
+    """ Sustainability metrics for an ingredient list, as returned by /predict. """
+    matched_ingredients = match_ingredients_with_emissions(ingredients, emissions_dataset) if ingredients else {}
+    if not matched_ingredients:
+        print("⚠ No matching ingredients found in emissions dataset!")
+        result = {
+            "sustainability_score": 3.0,
+            "total_emissions": 0,
+            "emissions_equivalence": calculate_emissions_equivalence(0),
+            "breakdown": {}
+        }
+        if MODEL_SCORER is not None:
+            result["model_score"] = MODEL_SCORER.predict([{}])[0]
+        return result
+
+    # Calculate total impact
+    total_impact, total_emissions = calculate_total_impact(matched_ingredients)
+    print(f"📊 Total Impact: {total_impact}, Total Emissions: {total_emissions}")
+
+    # Calculate sustainability score based on total emissions
+    sustainability_score = calculate_sustainability_score(total_emissions)
+    print(f"📈 Sustainability Score: {sustainability_score}")
+
+    result = {
+        "sustainability_score": sustainability_score,
+        "total_emissions": round(total_emissions, 2),
+        "emissions_equivalence": calculate_emissions_equivalence(total_emissions),
+        "breakdown": {key: round(value, 3) for key, value in total_impact.items()}
+    }
+    if MODEL_SCORER is not None:
+        result["model_score"] = MODEL_SCORER.predict([total_impact])[0]
+    return result
+
+
+def _lower_titles(generation):
+    return np.array([title.lower() for title in generation.title_matcher.titles], dtype=object)
+
+
+def resolve_dish_match(dish_name, generation, deadline=None):
+    """
+    Resolve a dish name to (best matching title, WRatio score, title id, recipe row position)
+    the way /compare-dishes does: the top fuzzy title, then the first row whose title equals
+    it ignoring case. Returns None when nothing matches; the position is None without a row.
+    """
+    matcher = generation.title_matcher
+    matches = matcher.extract(dish_name.lower(), limit=1, deadline=deadline)
+    print(f"📊 Fuzzy match for {dish_name}: {matches}")
+    if not matches:
+        return None
+
+    title, score, title_id = matches[0]
+    return title, score, title_id, _first_rows(generation, [title]).get(title.lower())
+
+
+def _first_rows(generation, titles):
+    """ {lowercase title: first recipe row whose title equals it ignoring case} in one pass over the titles. """
+    matcher = generation.title_matcher
+    lower_titles = generation.derived("lower_titles", _lower_titles)
+    first_rows = {}
+    for title_id in np.flatnonzero(pd.Series(lower_titles).isin({title.lower() for title in titles}).values).tolist():
+        rows = matcher.rows_for(title_id)
+        if len(rows):
+            key = lower_titles[title_id]
+            first_rows[key] = min(first_rows.get(key, int(rows[0])), int(rows[0]))
+    return first_rows
+
+
+def resolve_dish(dish_name, generation, deadline=None):
+    """ (best matching title, recipe row position) for a dish name; (None, None) when nothing matches. """
+    match = resolve_dish_match(dish_name, generation, deadline=deadline)
+    return (match[0], match[3]) if match is not None else (None, None)
+
+
+def resolve_dishes(dish_names, generation, deadline=None, budget_share=0.5, score_cutoff=0):
+    """
+    resolve_dish for several names at once: repeated names are matched once, each unique name
+    gets an equal part of `budget_share` of the deadline, and all matched titles are mapped to
+    recipe rows in a single pass. Returns [(title, position)], (None, None) without a match
+    scoring at least `score_cutoff`.
+    """
+    matcher = generation.title_matcher
+    queries = list(dict.fromkeys(name.lower() for name in dish_names))
+    matches = {}
+    for index, query in enumerate(queries):
+        share = budget_share / len(queries)
+        found = matcher.extract(query, limit=1, score_cutoff=score_cutoff,
+                                deadline=deadline.share(share / (1 - index * share)) if deadline else None)
+        print(f"📊 Fuzzy match for {query}: {found}")
+        matches[query] = found[0][0] if found else None
+
+    first_rows = _first_rows(generation, [title for title in matches.values() if title is not None])
+    resolved = []
+    for name in dish_names:
+        title = matches[name.lower()]
+        resolved.append((title, first_rows.get(title.lower())) if title is not None else (None, None))
+    return resolved
+
+
+def score_dish(position, generation, deadline=None):
+    """ Emissions and sustainability details for one recipe row; returns (details, unrounded total emissions). """
+    dish = generation.recipes.iloc[position]
+    return score_recipe(dish["Title"], dish["Cleaned_Ingredients"], generation.emissions, deadline=deadline)
+
+
+def score_recipe(title, raw_ingredients, emissions_dataset, deadline=None):
+    """ score_dish for a recipe given as its title and Cleaned_Ingredients string (e.g. from a shard node). """
+    # Extract and clean ingredients
+    ingredients = [ing.strip() for ing in raw_ingredients.split(",")]
+    print(f"🔍 {title} ingredients: {ingredients}")
+
+    # Match ingredients with emissions data and calculate total emissions
+    matched = match_ingredients_with_emissions(ingredients, emissions_dataset, deadline=deadline)
+    details, total_emissions, impact = _recipe_details(title, ingredients, matched,
+                                                       get_sustainability_score(ingredients, deadline=deadline))
+    if MODEL_SCORER is not None:
+        details["model_score"] = MODEL_SCORER.predict([impact])[0]
+    return details, total_emissions
+
+
+def score_recipes(recipes, emissions_dataset, deadline=None):
+    """
+    score_recipe for several (title, Cleaned_Ingredients) recipes, matching the union of
+    their ingredients once against each emissions table instead of once per recipe.
+    Returns [(details, unrounded total emissions)] in input order.
+    """
+    ingredient_lists = [[ing.strip() for ing in raw_ingredients.split(",")] for _, raw_ingredients in recipes]
+    union = list(dict.fromkeys(ing for ingredients in ingredient_lists for ing in ingredients))
+    print(f"🔍 {len(union)} distinct ingredients across {len(recipes)} recipes")
+
+    matched = match_ingredients_with_emissions(union, emissions_dataset, deadline=deadline)
+    try:
+        scoring_matched = match_ingredients_with_emissions(union, get_emissions_dataset(), deadline=deadline)
+    except Exception as e:
+        print(f"❌ Error calculating sustainability score: {str(e)}")
+        scoring_matched = None
+
+    results, impacts = [], []
+    for (title, _), ingredients in zip(recipes, ingredient_lists):
+        score = 3.0 if scoring_matched is None else score_matched_ingredients(
+            {ing: scoring_matched[ing] for ing in ingredients if ing in scoring_matched}
+        )
+        details, total_emissions, impact = _recipe_details(
+            title, ingredients, {ing: matched[ing] for ing in ingredients if ing in matched}, score
+        )
+        results.append((details, total_emissions))
+        impacts.append(impact)
+
+    # All recipes go through the model in one vectorized call
+    if MODEL_SCORER is not None:
+        for (details, _), model_score in zip(results, MODEL_SCORER.predict(impacts)):
+            details["model_score"] = model_score
+    return results
+
+
+def _recipe_details(title, ingredients, matched, score):
+    """ score_recipe's details from matched ingredients and the raw sustainability score; also returns totals. """
+    impact, total_emissions = calculate_total_impact(matched)
+    print(f"📈 {title} total emissions: {total_emissions}")
+
+    # Calculate sustainability score, capped at 5.0
+    score = min(5.0, float(score)) if isinstance(score, (int, float)) else 3.0
+    print(f"⭐ {title} sustainability score: {score}")
+
+    details = {
+        "title": title,
+        "ingredients": ingredients,
+        "ingredient_emissions": matched,
+        "sustainability_score": score,
+        "total_emissions": round(total_emissions, 2),
+        "emissions_breakdown": {key: round(value, 3) for key, value in impact.items()},
+        "emissions_equivalence": calculate_emissions_equivalence(total_emissions)
+    }
+    return details, total_emissions, impact
+
+
+# Categories calculate_total_impact sums (every emissions category but the per-kg average)
+IMPACT_CATEGORIES = EMISSION_CATEGORIES[:-1]
+
+
+def _normalized(name):
+    return " ".join(name.lower().split())
+
+
+def _round_breakdown(totals):
+    return {key: round(value, 3) + 0.0 for key, value in totals.items()}  # + 0.0 turns -0.0 from subtraction into 0.0
+
+
+def _summary(totals, total_emissions, count):
+    """ /predict style metrics for aggregated category totals of `count` ingredients. """
+    if count == 0:
+        return {"sustainability_score": 3.0, "total_emissions": 0, "emissions_equivalence": calculate_emissions_equivalence(0),
+                "breakdown": {}}
+    return {
+        "sustainability_score": calculate_sustainability_score(total_emissions),
+        "total_emissions": round(total_emissions, 2),
+        "emissions_equivalence": calculate_emissions_equivalence(total_emissions),
+        "breakdown": _round_breakdown(totals)
+    }
+
+
+def parse_edits(edits):
+    """
+    Normalize substitution edits to (ingredient to remove or None, ingredient to add or None) pairs.
+    Accepts {"op": "add", "ingredient": x}, {"op": "remove", "ingredient": x} and
+    {"op": "replace", "from": x, "to": y}; raises ValueError for anything else.
+    """
+    if not isinstance(edits, list) or not edits:
+        raise ValueError("Edits must be a non-empty list")
+    parsed = []
+    for edit in edits:
+        op = edit.get("op") if isinstance(edit, dict) else None
+        names = [edit.get(key) for key in (("from", "to") if op == "replace" else ("ingredient",))] if op else []
+        if op not in ("add", "remove", "replace") or not all(isinstance(name, str) and name.strip() for name in names):
+            raise ValueError(f"Invalid edit: {edit}")
+        names = [name.strip() for name in names]
+        parsed.append((names[0], names[1]) if op == "replace" else (None, names[0]) if op == "add" else (names[0], None))
+    return parsed
+
+
+def score_substitutions(base_matched, candidates, emissions_dataset):
+    """
+    What-if scoring of edit lists against a base analysis ({ingredient: emissions} as returned
+    by match_ingredients_with_emissions). Every added ingredient is resolved once for all
+    candidates, and each candidate's totals are summed from the kept and added ingredients
+    the way /predict sums them, so results match /predict on the edited ingredient list.
+    Returns (base summary, [candidate result]); raises ValueError for unknown removals.
+    """
+    base_totals, base_total = calculate_total_impact(base_matched)
+    base_summary = _summary(base_totals, base_total, len(base_matched))
+    lookup = {_normalized(name): name for name in base_matched}
+
+    added_names = {name for edits in candidates for _, name in edits if name is not None and name not in base_matched}
+    resolved = match_ingredients_with_emissions(sorted(added_names), emissions_dataset) if added_names else {}
+
+    results, candidate_totals = [], []
+    for edits in candidates:
+        # The edited list in /predict order: kept base ingredients, then additions in the order made
+        matched = dict(base_matched)
+        unresolved = False
+        for remove_name, add_name in edits:
+            if remove_name is not None:
+                # Removals also accept a differently cased or spaced spelling of an ingredient
+                key = remove_name if remove_name in matched else lookup.get(_normalized(remove_name))
+                if key is None or key not in matched:
+                    key = next((name for name in matched if _normalized(name) == _normalized(remove_name)), None)
+                if key is None:
+                    raise ValueError(f"Ingredient not in the dish: {remove_name}")
+                del matched[key]
+
+            # Like /predict, an ingredient already in the list is counted once
+            if add_name is not None and add_name not in matched:
+                values = base_matched.get(add_name, resolved.get(add_name))
+                if values is None:
+                    unresolved = True  # No emissions dataset to match against
+                else:
+                    matched[add_name] = values
+
+        removed = sorted(name for name in base_matched if name not in matched)
+        added = [name for name in matched if name not in base_matched]
+        if unresolved:
+            matched = {}  # What /predict answers when the emissions dataset is not loaded
+        totals, total_emissions = calculate_total_impact(matched)
+        summary = _summary(totals, total_emissions, len(matched))
+        totals = totals or dict.fromkeys(IMPACT_CATEGORIES, 0.0)
+        summary["delta"] = {
+            "total_emissions": round(summary["total_emissions"] - base_summary["total_emissions"], 2),
+            "sustainability_score": round(summary["sustainability_score"] - base_summary["sustainability_score"], 2),
+            "emissions_equivalence": {key: round(value - base_summary["emissions_equivalence"][key], 1)
+                                      for key, value in summary["emissions_equivalence"].items()},
+            "breakdown": _round_breakdown({category: totals[category] - base_totals.get(category, 0.0) for category in totals})
+        }
+        summary["removed"] = removed
+        summary["added"] = added
+        results.append(summary)
+        candidate_totals.append(totals)
+
+    # The base and every candidate go through the model in one vectorized call
+    if MODEL_SCORER is not None:
+        base_summary["model_score"], *model_scores = MODEL_SCORER.predict([base_totals] + candidate_totals)
+        for summary, model_score in zip(results, model_scores):
+            summary["model_score"] = model_score
+            summary["delta"]["model_score"] = round(model_score - base_summary["model_score"], 2)
+    return base_summary, results
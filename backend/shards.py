@@ -0,0 +1,153 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Per-shard HTTP timeout; a request's own latency budget can only shorten it
+DEFAULT_TIMEOUT = 5.0
+SHARD_BUDGET_FRACTION = 0.8  # Shards get this much of the timeout, so they answer partially instead of timing out
+MATCH_LIMIT = 5              # Titles kept after merging, like match_recipe_titles
+
+
+def _merge_key(match):
+    """ Best score first; ties go to the title seen first in the whole corpus, as on a single node. """
+    return -match["score"], match["first_row"]
+
+
+class ShardCoordinator:
+    """
+    Fans title searches out to shard nodes (each serving one partition of the recipes,
+    see GREENBITE_SHARD) and merges their top matches by score. Titles are partitioned
+    whole, so the merged top k equals a single node's top k. Shards that fail or miss
+    the timeout are skipped and the merged result is reported as partial.
+    """
+
+    def __init__(self, nodes, timeout=DEFAULT_TIMEOUT):
+        self.nodes = [node.rstrip("/") for node in nodes]
+        self.timeout = timeout
+        self.counts = {node: {"requests": 0, "failures": 0} for node in self.nodes}
+        self._pool = ThreadPoolExecutor(max_workers=len(self.nodes) * 4, thread_name_prefix="shard-fanout")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self):
+        """ One HTTP session per fan-out thread, so connections to the shards are reused. """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, node, path, body, timeout):
+        response = self._session().post(node + path, json=body, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def fan_out(self, path, bodies, deadline=None, expect=None):
+        """
+        POST every body to every shard in parallel. Returns ({(body index, node): response},
+        failed nodes); a shard that errors, misses the timeout or answers without the `expect`
+        field on any body counts as failed.
+        """
+        import requests
+        timeout = self.timeout
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None:
+            timeout = max(min(timeout, remaining), 0.05)
+        budget_ms = max(int(timeout * SHARD_BUDGET_FRACTION * 1000), 1)
+
+        futures = {}
+        for index, body in enumerate(bodies):
+            for node in self.nodes:
+                future = self._pool.submit(self._post, node, path, dict(body, budget_ms=budget_ms), timeout)
+                futures[future] = (index, node)
+        _, not_done = wait(futures, timeout=timeout + 0.5)
+
+        results, failed = {}, set()
+        for future, (index, node) in futures.items():
+            try:
+                if future in not_done:
+                    future.cancel()
+                    raise TimeoutError(f"no answer within {timeout:.2f}s")
+                response = future.result()
+                if expect is not None and (not isinstance(response, dict) or expect not in response):
+                    raise ValueError(f"response has no {expect!r}")
+                results[(index, node)] = response
+            except (requests.RequestException, ValueError, TimeoutError) as e:
+                print(f"⚠ Shard {node}{path} failed: {e}")
+                failed.add(node)
+                with self._lock:
+                    self.counts[node]["failures"] += 1
+        with self._lock:
+            for node in self.nodes:
+                self.counts[node]["requests"] += len(bodies)
+        return results, sorted(failed)
+
+    def all_failed(self, failed):
+        return len(failed) == len(self.nodes)
+
+    def search_titles(self, query, deadline=None, dedupe=False, normalized=False):
+        """
+        Merged top title matches with their recipes; returns (matches, partial, failed nodes).
+        A `normalized` query (spelling already corrected against the whole corpus, see
+        vocabulary) is matched as is; otherwise every shard normalizes it on its own.
+        """
+        results, failed = self.fan_out("/shard/search", [{"query": query, "dedupe": dedupe, "normalized": normalized}],
+                                       deadline, expect="matches")
+        matches = sorted((match for response in results.values() for match in response["matches"]), key=_merge_key)
+        partial = bool(failed) or any(response.get("partial") for response in results.values())
+        return matches[:MATCH_LIMIT], partial, failed
+
+    def resolve_dishes(self, dish_names, deadline=None):
+        """
+        Resolve several dish names in one fan-out, like scoring.resolve_dish on a single node.
+        Returns ([best shard answer or None per dish], partial, failed nodes); an answer holds
+        the matched title and score and the resolved `recipe` (title, Cleaned_Ingredients).
+        """
+        results, failed = self.fan_out("/shard/resolve", [{"dish": name} for name in dish_names], deadline, expect="title")
+        resolved = []
+        for index in range(len(dish_names)):
+            answers = [results[(index, node)] for node in self.nodes
+                       if (index, node) in results and results[(index, node)].get("title") is not None]
+            resolved.append(min(answers, key=_merge_key, default=None))
+        partial = bool(failed) or any(response.get("partial") for response in results.values())
+        return resolved, partial, failed
+
+    def vocabulary(self):
+        """
+        {title word: titles containing it} over the whole corpus, merged from every shard
+        (titles are partitioned whole, so the counts add up); None unless all shards answered.
+        """
+        results, failed = self.fan_out("/shard/vocabulary", [{}], expect="words")
+        if failed:
+            return None
+        merged = {}
+        for response in results.values():
+            for word, count in response["words"].items():
+                merged[word] = merged.get(word, 0) + count
+        return merged
+
+    def metrics(self):
+        """ Per-shard request and failure counters for /metrics (this worker only). """
+        samples = []
+        with self._lock:
+            for node, counts in self.counts.items():
+                labels = {"shard": node}
+                samples += [
+                    ("greenbite_shard_requests_total", labels, counts["requests"], "Requests fanned out to a shard"),
+                    ("greenbite_shard_failures_total", labels, counts["failures"], "Shard requests that failed or timed out"),
+                ]
+        return samples
+
+
+def shard_coordinator_from_env():
+    """ Coordinator for the shard URLs in GREENBITE_SHARD_NODES (comma-separated); None runs unsharded. """
+    nodes = [node.strip() for node in os.environ.get("GREENBITE_SHARD_NODES", "").split(",") if node.strip()]
+    if not nodes:
+        return None
+    try:
+        timeout = float(os.environ.get("GREENBITE_SHARD_TIMEOUT", DEFAULT_TIMEOUT))
+    except ValueError:
+        print("⚠ Warning: Invalid GREENBITE_SHARD_TIMEOUT, using default")
+        timeout = DEFAULT_TIMEOUT
+    print(f"🧩 Shard coordinator for {len(nodes)} nodes: {nodes}")
+    return ShardCoordinator(nodes, timeout)
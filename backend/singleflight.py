@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# fcntl locks coordinate workers in FileSingleFlight; without it (Windows) coalescing stays in-process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class _Call:
+    """ One in-progress computation that duplicate callers wait on. """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key inside one process: the first caller
+    runs the function, duplicates arriving while it runs wait and share its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"leaders": 0, "shared": 0}
+
+    def do(self, key, fn):
+        """ Run fn() once per concurrent key; returns (result, shared) where shared is True for waiters. """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["shared"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats["leaders"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = self._compute(key, fn)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def _compute(self, key, fn):
+        return fn()
+
+
+class FileSingleFlight(SingleFlight):
+    """
+    Cross-worker coalescing on one host. Within a worker it behaves like SingleFlight;
+    the leading thread then takes a per-key lock file, so a duplicate request in another
+    worker waits for the lock and reuses the JSON result the holder just wrote.
+    Results must therefore be JSON-serializable.
+    """
+
+    def __init__(self, directory, result_ttl=5.0, wait_timeout=60.0):
+        super().__init__()
+        self.directory = directory
+        self.result_ttl = result_ttl      # Seconds a written result may be reused by late waiters
+        self.wait_timeout = wait_timeout  # Give up waiting on another worker and compute locally
+        self._calls_since_prune = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.lock"), os.path.join(self.directory, f"{digest}.json")
+
+    def _read_result(self, result_path, not_before):
+        try:
+            with open(result_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored["written_at"] < not_before or time.time() - stored["written_at"] > self.result_ttl:
+            return None
+        return stored
+
+    def _write_result(self, result_path, result):
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as f:
+            json.dump({"written_at": time.time(), "result": result}, f)
+        os.replace(f.name, result_path)
+
+    def _prune(self):
+        """ Drop result files nobody can reuse any more (every 100 leader calls). """
+        self._calls_since_prune += 1
+        if self._calls_since_prune < 100:
+            return
+        self._calls_since_prune = 0
+        cutoff = time.time() - max(self.result_ttl, self.wait_timeout) * 2
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _compute(self, key, fn):
+        lock_path, result_path = self._paths(key)
+        started_at = time.time()
+        lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(lock_fd)
+            # Another worker is computing this key: block on its lock, then reuse its result
+            lock_fd = _lock_within(lock_path, self.wait_timeout)
+            if lock_fd is None:
+                return fn()
+            stored = self._read_result(result_path, started_at)
+            if stored is not None:
+                os.close(lock_fd)
+                self.stats["shared"] += 1
+                return stored["result"]
+
+        try:
+            result = fn()
+            self._write_result(result_path, result)
+        finally:
+            os.close(lock_fd)  # Releases the lock
+        self._prune()
+        return result
+
+
+def _lock_within(lock_path, timeout):
+    """
+    Block on an exclusive flock of lock_path for up to `timeout` seconds; returns the
+    descriptor holding it (closing it releases the lock), or None on timeout. flock has
+    no timeout of its own, so a helper thread blocks on its own descriptor, and one that
+    only gets the lock after the caller gave up releases it straight away.
+    """
+    acquired = threading.Event()
+    state = {"fd": None, "abandoned": False}
+    guard = threading.Lock()
+
+    def take():
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except OSError:
+            os.close(fd)
+            return
+        with guard:
+            if state["abandoned"]:
+                os.close(fd)
+                return
+            state["fd"] = fd
+            acquired.set()
+
+    threading.Thread(target=take, name="singleflight-lock", daemon=True).start()
+    acquired.wait(timeout)
+    with guard:
+        state["abandoned"] = state["fd"] is None
+        return state["fd"]
+
+
+def single_flight_from_env():
+    """ Build the coalescer selected by GREENBITE_SINGLEFLIGHT: "thread" (default), "file" or "off". """
+    mode = os.environ.get("GREENBITE_SINGLEFLIGHT", "thread").lower()
+    if mode == "off":
+        return None
+    if mode == "file" and fcntl is None:
+        print("⚠️ GREENBITE_SINGLEFLIGHT=file needs fcntl, coalescing within each worker only")
+    elif mode == "file":
+        default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        directory = os.environ.get("GREENBITE_SINGLEFLIGHT_DIR", os.path.join(default_dir, "greenbite-singleflight"))
+        return FileSingleFlight(directory)
+    return SingleFlight()
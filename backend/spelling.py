@@ -0,0 +1,137 @@
+from array import array
+
+import numpy as np
+
+from recipe_index import group_postings
+
+# rapidfuzz (thefuzz's backend) has a native edit distance; fall back to the pure Python one
+try:
+    from rapidfuzz.distance import OSA
+except ImportError:
+    OSA = None
+
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7         # Deletes are generated from the first 7 letters only; candidates are verified on whole words
+MIN_WORD_LENGTH = 4       # Shorter query words are never corrected
+SHORT_WORD_LENGTH = 5     # Words up to this length are corrected by at most one edit
+MIN_COUNT = 2             # Title words seen fewer times are left alone but never offered as corrections
+MEMO_SIZE = 50000
+
+
+def _deletes(word, max_distance):
+    """ Every string reachable from word by deleting up to max_distance characters (word included). """
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {part[:i] + part[i + 1:] for part in frontier if len(part) > 1 for i in range(len(part))}
+        results |= frontier
+    return results
+
+
+def _edit_distance(a, b, limit):
+    """ Optimal string alignment distance (a transposition is one edit); anything above limit is limit + 1. """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if OSA is not None:
+        return OSA.distance(a, b, score_cutoff=limit)
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SpellCorrector:
+    """
+    Symmetric-delete (SymSpell) word correction over the recipe title vocabulary.
+
+    Every dictionary word is indexed under all strings reachable by deleting up to
+    MAX_EDIT_DISTANCE letters from its prefix, stored as sorted 64-bit hashes with CSR
+    postings of word ids. A misspelled word generates its own deletes, looks them up
+    with one searchsorted, and the candidates are verified by edit distance; the
+    closest, then most frequent, word wins.
+    """
+
+    def __init__(self, known, words, counts, delete_hashes, delete_offsets, delete_postings):
+        self.known = known                      # every title word (including rare ones), never corrected
+        self.words = words                      # correction candidates
+        self.counts = counts                    # titles containing each candidate
+        self.delete_hashes = delete_hashes      # sorted unique hashes of delete strings
+        self.delete_offsets = delete_offsets
+        self.delete_postings = delete_postings  # delete hash -> candidate word ids
+        self._memo = {}
+
+    def correct(self, word):
+        """ The dictionary word closest to `word`, or `word` itself when it is known or nothing is close. """
+        if len(word) < MIN_WORD_LENGTH or word in self.known or not word.isalpha():
+            return word
+        corrected = self._memo.get(word)
+        if corrected is None:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            corrected = self._memo[word] = self._lookup(word)
+        return corrected
+
+    def _lookup(self, word):
+        max_distance = 1 if len(word) <= SHORT_WORD_LENGTH else MAX_EDIT_DISTANCE
+        hashes = np.array([hash(part) for part in _deletes(word[:PREFIX_LENGTH], max_distance)], dtype=np.int64)
+        slots = np.searchsorted(self.delete_hashes, hashes)
+        found = slots < len(self.delete_hashes)
+        found[found] = self.delete_hashes[slots[found]] == hashes[found]
+
+        slots = slots[found]
+        if len(slots) == 0:
+            return word
+        candidate_ids = np.unique(np.concatenate([
+            self.delete_postings[start:end] for start, end in zip(self.delete_offsets[slots], self.delete_offsets[slots + 1])
+        ]))
+
+        best = None
+        for word_id in candidate_ids.tolist():
+            candidate = self.words[word_id]
+            distance = _edit_distance(word, candidate, max_distance)
+            if distance <= max_distance:
+                key = (distance, -int(self.counts[word_id]), candidate)
+                if best is None or key < best:
+                    best = key
+        return best[2] if best is not None else word
+
+
+def build_spell_corrector(title_matcher):
+    """ Build the symmetric-delete dictionary from the title matcher's word vocabulary, weighted by title counts. """
+    title_counts = np.diff(title_matcher.token_offsets)
+    vocabulary = title_matcher.token_vocabulary
+    return _build(vocabulary, ((word, title_counts[token_id]) for word, token_id in vocabulary.items()))
+
+
+def spell_corrector_from_counts(word_counts):
+    """ Build the dictionary from {title word: titles containing it}, e.g. merged from every shard's vocabulary. """
+    return _build(word_counts, word_counts.items())
+
+
+def _build(known, word_counts):
+    words, counts = [], []
+    hashes, word_ids = array("q"), array("i")
+    for word, count in word_counts:
+        if len(word) < 3 or not word.isalpha() or count < MIN_COUNT:
+            continue
+        for part in _deletes(word[:PREFIX_LENGTH], MAX_EDIT_DISTANCE):
+            hashes.append(hash(part))
+            word_ids.append(len(words))
+        words.append(word)
+        counts.append(count)
+
+    delete_hashes, inverse = np.unique(np.frombuffer(hashes, dtype=np.int64), return_inverse=True)
+    delete_offsets, delete_postings = group_postings(
+        inverse.astype(np.int32), np.frombuffer(word_ids, dtype=np.int32), len(delete_hashes)
+    )
+    print(f"✅ Spell corrector built: {len(words)} words, {len(delete_hashes)} deletes")
+    return SpellCorrector(known, words, np.array(counts, dtype=np.int32), delete_hashes, delete_offsets, delete_postings)
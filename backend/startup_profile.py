@@ -0,0 +1,83 @@
+"""
+Import-time profile of the API, for tracking cold-start regressions.
+
+Runs `python -X importtime` on `import main` in background-load mode (so only module
+imports are measured, not dataset loading), prints the slowest imports and optionally
+compares the total against a saved baseline.
+
+Usage:
+    python startup_profile.py                       # print the profile
+    python startup_profile.py --save baseline.json  # record a baseline
+    python startup_profile.py --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def profile_imports(module="main"):
+    """ Return ({module: (self_us, cumulative_us)}, wall_seconds) for importing a module. """
+    env = dict(os.environ, GREENBITE_BACKGROUND_LOAD="1")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    wall_seconds = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    imports = {}
+    for line in completed.stderr.splitlines():
+        # Format: "import time:   self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return imports, wall_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the API's import-time cost.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest imports to show")
+    parser.add_argument("--save", help="Write the profile to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a profile saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown vs. baseline")
+    args = parser.parse_args()
+
+    imports, wall_seconds = profile_imports(args.module)
+    total_us = imports.get(args.module, (0, 0))[1]
+
+    print(f"📊 import {args.module}: {total_us / 1000:.1f} ms cumulative, {wall_seconds:.2f} s wall (incl. interpreter)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    top_level = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in top_level:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    profile = {"module": args.module, "total_us": total_us, "wall_seconds": round(wall_seconds, 3),
+               "imports": {name: cumulative for name, (_, cumulative) in imports.items()}}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(profile, f, indent=2)
+        print(f"✅ Profile saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit_us = baseline["total_us"] * (1 + args.tolerance)
+        print(f"📈 Baseline {baseline['total_us'] / 1000:.1f} ms, limit {limit_us / 1000:.1f} ms")
+        if total_us > limit_us:
+            print("❌ Import time regression")
+            return 1
+        print("✅ Import time within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,36 @@
+import threading
 import pandas as pd
-import requests
 from difflib import get_close_matches
 from emissions import match_ingredients_with_emissions, calculate_total_impact
+from dataset_store import EMISSIONS_FILENAME, dataset_path
 
-# Load dataset
-try:
-    emissions_df = pd.read_csv("datasets/Food_Product_Emissions.csv")
-    emissions_df["Food product"] = emissions_df["Food product"].str.lower().str.strip()
-    print("✅ Emissions dataset loaded successfully.")
-except Exception as e:
-    print(f"❌ Error loading emissions dataset: {e}")
-    emissions_df = None
+emissions_df = None
+
+def load_emissions_dataset(path):
+    """Load (or reload) the emissions dataset used for scoring."""
+    global emissions_df
+    try:
+        dataset = pd.read_csv(path)
+        dataset["Food product"] = dataset["Food product"].str.lower().str.strip()
+        emissions_df = dataset  # Swap in one assignment so in-flight scoring keeps the old table
+        print("✅ Emissions dataset loaded successfully.")
+    except Exception as e:
+        print(f"❌ Error loading emissions dataset: {e}")
+    return emissions_df
+
+_load_lock = threading.Lock()
+
+def get_emissions_dataset():
+    """Return the scoring emissions dataset, loading it from the datasets directory on first use."""
+    if emissions_df is None:
+        with _load_lock:
+            if emissions_df is None:
+                load_emissions_dataset(dataset_path(EMISSIONS_FILENAME))
+    return emissions_df
 
 def get_best_match(ingredient):
     """Find closest match for an ingredient in the dataset."""
-    matches = get_close_matches(ingredient.lower(), emissions_df["Food product"].tolist(), n=1, cutoff=0.5)
+    matches = get_close_matches(ingredient.lower(), get_emissions_dataset()["Food product"].tolist(), n=1, cutoff=0.5)
 
     if matches:
         print(f"🔍 Best match for '{ingredient}': {matches[0]}")
@@ -23,13 +39,22 @@ def get_best_match(ingredient):
         print(f"⚠ No close match found for '{ingredient}'")
         return None
 
-def get_sustainability_score(ingredients):
+def get_sustainability_score(ingredients, deadline=None):
     """Calculate sustainability score based on emissions data."""
     print(f"🧐 Debug: Processing ingredients → {ingredients}")  # ✅ Debug ingredient list
 
     try:
         # First, calculate the total emissions for the dish
-        matched_ingredients = match_ingredients_with_emissions(ingredients, emissions_df)
+        matched_ingredients = match_ingredients_with_emissions(ingredients, get_emissions_dataset(), deadline=deadline)
+        return score_matched_ingredients(matched_ingredients)
+
+    except Exception as e:
+        print(f"❌ Error calculating sustainability score: {str(e)}")
+        return 3.0  # Default score if error occurs
+
+def score_matched_ingredients(matched_ingredients):
+    """Sustainability score for ingredients already matched against the scoring emissions dataset."""
+    try:
         if not matched_ingredients:
             print("⚠ No matching ingredients found in emissions dataset!")
             return 3.0  # Default score if no matches found
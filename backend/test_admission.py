@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import AdmissionController, _SharedBoard
+
+
+def _controller(limit=1, max_queue=1, queue_timeout=0.1):
+    board = _SharedBoard(slots=4)
+    return AdmissionController("expensive", limit, max_queue, queue_timeout, board=board), board
+
+
+def test_sheds_over_the_limit_and_admits_after_recovery():
+    controller, board = _controller()
+    assert controller.acquire()
+    assert not controller.acquire()  # Waited queue_timeout for the only slot
+
+    totals, workers = board.totals()
+    assert workers == 1
+    assert totals["expensive"] == {"in_flight": 1, "queued": 0, "admitted": 1, "rejected": 1}
+
+    controller.release(0.2)
+    assert controller.acquire()
+    controller.release(0.2)
+    assert board.totals()[0]["expensive"] == {"in_flight": 0, "queued": 0, "admitted": 2, "rejected": 1}
+
+
+def test_queued_request_gets_the_released_slot_and_a_full_queue_sheds_at_once():
+    controller, _ = _controller(queue_timeout=5.0)
+    assert controller.acquire()
+    outcome = {}
+    waiter = threading.Thread(target=lambda: outcome.update(admitted=controller.acquire()))
+    waiter.start()
+    while controller.counts["queued"] == 0:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    assert not controller.acquire()  # The one queue place is taken
+    assert time.monotonic() - started < 1.0
+
+    controller.release(0.2)
+    waiter.join(5)
+    assert outcome == {"admitted": True} and controller.counts["in_flight"] == 1
+
+
+def test_dead_workers_slots_are_ignored():
+    _, board = _controller()
+    board.values[board.stride] = 2 ** 22 + 1  # Beyond the default pid_max: no such process
+    board.values[board.stride + 1] = 5
+    board.publish(0, dict.fromkeys(admission.FIELDS, 1))
+    totals, workers = board.totals()
+    assert workers == 1 and totals["expensive"]["in_flight"] == 1
+    assert board.values[0] == os.getpid()
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize("endpoint_class, path, body", [
+    ("cheap", "/predict", {"ingredients": ["beef", "rice"]}),
+    ("expensive", "/compare-dishes", {"dish1": "beef stew", "dish2": "lentil soup"}),
+])
+def test_endpoints_answer_503_with_retry_after_while_at_capacity(client, monkeypatch, endpoint_class, path, body):
+    controller = AdmissionController(endpoint_class, 1, 0, 0.0)
+    monkeypatch.setitem(admission.CONTROLLERS, endpoint_class, controller)
+
+    assert controller.acquire()  # Another request holds the only slot
+    response = client.post(path, json=body)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.get_json()["retry_after"] == int(response.headers["Retry-After"])
+
+    controller.release(0.2)
+    assert client.post(path, json=body).status_code == 200
+    assert controller.counts == {"in_flight": 0, "queued": 0, "admitted": 2, "rejected": 1}
@@ -0,0 +1,170 @@
+import json
+import random
+
+import pytest
+
+from conftest import DISHES, EMISSIONS
+from deadline import Deadline
+from recipe_index import parse_ingredient_list
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+def test_rank_dishes_orders_by_score_then_emissions(client):
+    names = ["beef stew", "lentil soup", "buttermilk pancakes"]
+    response = client.post("/rank-dishes", json={"dishes": names})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert sorted(entry["title"] for entry in body["ranking"]) == sorted(DISHES)
+    assert [entry["rank"] for entry in body["ranking"]] == [1, 2, 3]
+    assert body["unmatched"] == []
+    keys = [(-entry["sustainability_score"], entry["total_emissions"]) for entry in body["ranking"]]
+    assert keys == sorted(keys)
+
+    # Every dish is scored exactly as /compare-dishes scores it
+    compared = client.post("/compare-dishes", json={"dish1": names[0], "dish2": names[1]}).get_json()
+    compared.update(extra=client.post("/compare-dishes", json={"dish1": names[2], "dish2": names[0]}).get_json()["dish1"])
+    by_title = {details["title"]: details for details in (compared["dish1"], compared["dish2"], compared["extra"])}
+    for entry in body["ranking"]:
+        expected = by_title[entry["title"]]
+        assert (entry["sustainability_score"], entry["total_emissions"]) == (expected["sustainability_score"],
+                                                                             expected["total_emissions"])
+
+
+def test_rank_dishes_breaks_score_ties_by_loaded_emissions(client, monkeypatch):
+    import scoring
+
+    names = ["beef stew", "buttermilk pancakes", "lentil soup"]
+    monkeypatch.setattr(scoring, "calculate_sustainability_score", lambda total_emissions: 3.0)
+    body = client.post("/rank-dishes", json={"dishes": names}).get_json()
+
+    # With every score tied, the order is decided by the emissions of the loaded table alone
+    assert [entry["title"] for entry in body["ranking"]] == ["Lentil Soup", "Buttermilk Pancakes", "Beef Stew"]
+    totals = [entry["total_emissions"] for entry in body["ranking"]]
+    assert totals[0] > 0 and totals == sorted(set(totals))
+
+
+def test_rank_dishes_reports_unmatched_names(client):
+    response = client.post("/rank-dishes", json={"dishes": ["lentil soup", "zzzzqqq", "lentil soup"]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [entry["dish"] for entry in body["ranking"]] == ["lentil soup", "lentil soup"]
+    assert body["unmatched"] == ["zzzzqqq"]
+
+    assert client.post("/rank-dishes", json={"dishes": ["zzzzqqq"]}).status_code == 404
+    assert client.post("/rank-dishes", json={"dishes": []}).status_code == 400
+
+
+def test_search_by_ingredients_matches_a_full_scan(api, client):
+    recipes = api.dataset_store.current_generation().recipes
+    row_sets = [set(parse_ingredient_list(raw)) for raw in recipes["Cleaned_Ingredients"]]
+    rng = random.Random(3)
+    for _ in range(40):
+        requested = rng.sample(sorted(EMISSIONS), rng.randint(1, 4))
+        match = rng.choice(["any", "all"])
+        body = client.post("/search/by-ingredients", json={"ingredients": requested, "match": match,
+                                                           "limit": 100, "expand": False}).get_json()
+
+        expected = []
+        for row, ingredients in enumerate(row_sets):
+            overlap = sum(term in ingredients for term in requested)
+            if overlap and (match == "any" or overlap == len(requested)):
+                expected.append((-overlap, len(ingredients), row))
+        expected.sort()
+        assert body["total_matches"] == len(expected)
+        assert [(recipe["title"], recipe["matched_count"], recipe["missing_count"]) for recipe in body["recipes"]] == \
+            [(recipes["Title"].iloc[row], -overlap, size + overlap) for overlap, size, row in expected[:100]]
+        assert all(recipe["uses_only_requested"] == (recipe["missing_count"] == 0) for recipe in body["recipes"])
+
+
+def test_search_by_ingredients_ranks_by_emissions_and_checks_expand(client):
+    request = {"ingredients": ["beef", "lentils", "rice"], "rank_by": "emissions", "limit": 50}
+    recipes = client.post("/search/by-ingredients", json=request).get_json()["recipes"]
+    assert recipes and all(recipe["total_emissions"] > 0 for recipe in recipes)
+    keys = [(-recipe["matched_count"], recipe["total_emissions"]) for recipe in recipes]
+    assert keys == sorted(keys)
+    assert len({recipe["total_emissions"] for recipe in recipes}) > 1
+
+    for expand in ("false", 0, None):
+        response = client.post("/search/by-ingredients", json={"ingredients": ["beef"], "expand": expand})
+        assert response.status_code == 400
+
+
+def test_search_reports_partial_results_when_the_budget_runs_out(api, client, monkeypatch):
+    body = client.post("/search", json={"query": "lentil soup"}).get_json()
+    assert body["partial"] is False
+
+    monkeypatch.setattr(api, "deadline_for", lambda endpoint, requested_ms=None: Deadline(0))
+    response = client.post("/search", json={"query": "lentil soup", "budget_ms": 1})
+    assert response.get_json()["partial"] is True
+
+
+def _ndjson(response):
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return {"recipes": lines[:-1], **lines[-1]["meta"]}
+
+
+@pytest.mark.parametrize("dedupe", [False, True])
+def test_search_cursors_page_through_the_unpaged_results(client, dedupe):
+    request = {"query": "roasted garden salad", "dedupe": dedupe}
+    full = client.post("/search", json=request).get_json()
+    assert len(full["recipes"]) >= 5
+
+    recipes, body = [], client.post("/search", json=dict(request, limit=2)).get_json()
+    while True:
+        assert body["total_matches"] == len(full["recipes"])
+        recipes += body["recipes"]
+        if body["next_cursor"] is None:
+            break
+        body = client.post("/search", json={"cursor": body["next_cursor"]}).get_json()
+    assert recipes == full["recipes"]
+
+    assert client.post("/search", json={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_search_rejects_forged_cursors_and_clamps_their_page_size(api, client, monkeypatch):
+    generation = api.dataset_store.current_generation()
+    valid = {"g": generation.fingerprint, "t": [0, 1], "o": 0, "l": 1}
+    for forged in ({"t": [len(generation.title_matcher)]}, {"t": [-1]}, {"t": ["0"]}, {"t": 0}, {"o": -1},
+                   {"o": "1"}, {"l": 0}, {"l": True}):
+        cursor = api._encode_cursor(dict(valid, **forged))
+        assert client.post("/search", json={"cursor": cursor}).status_code == 400
+
+    monkeypatch.setattr(api, "SEARCH_PAGE_MAX", 3)
+    all_titles = list(range(len(generation.title_matcher)))
+    cursor = api._encode_cursor(dict(valid, t=all_titles, l=10 ** 6))
+    body = client.post("/search", json={"cursor": cursor}).get_json()
+    assert len(body["recipes"]) == 3 and body["next_cursor"] is not None
+
+
+def test_search_ndjson_stream_matches_the_json_body(client):
+    request = {"query": "roasted garden salad", "dedupe": True}
+    for extra in ({}, {"limit": 2}, {"fields": "recipes.title"}):
+        expected = client.post("/search", json=dict(request, **extra)).get_json()
+        streamed = client.post("/search", json=dict(request, stream=True, **extra))
+        assert streamed.mimetype == "application/x-ndjson"
+        assert _ndjson(streamed) == expected
+        accepted = client.post("/search", json=dict(request, **extra), headers={"Accept": "application/x-ndjson"})
+        assert _ndjson(accepted) == expected
+
+    cursor = client.post("/search", json=dict(request, limit=2)).get_json()["next_cursor"]
+    assert _ndjson(client.post("/search", json={"cursor": cursor, "stream": True})) == \
+        client.post("/search", json={"cursor": cursor}).get_json()
+
+
+def test_scoring_uses_every_emission_category_of_the_loaded_table(client):
+    predicted = client.post("/predict", json={"ingredients": ["beef", "rice"]}).get_json()
+    assert predicted["total_emissions"] == pytest.approx(EMISSIONS["beef"] + EMISSIONS["rice"], abs=0.01)
+    assert all(value > 0 for value in predicted["breakdown"].values())
+
+    body = client.post("/substitute", json={"ingredients": ["beef", "rice"],
+                                            "edits": [{"op": "replace", "from": "beef", "to": "lentils"}]}).get_json()
+    result = body["results"][0]
+    assert result["delta"]["total_emissions"] == pytest.approx(EMISSIONS["lentils"] - EMISSIONS["beef"], abs=0.01)
+    assert all(value < 0 for value in result["delta"]["breakdown"].values())
+    edited = client.post("/predict", json={"ingredients": ["rice", "lentils"]}).get_json()
+    for key in ("sustainability_score", "total_emissions", "breakdown"):
+        assert result[key] == edited[key]
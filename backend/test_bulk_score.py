@@ -0,0 +1,37 @@
+import pytest
+
+import bulk_score
+import dataset_store
+import emissions
+import sustainability
+from conftest import EMISSIONS, write_corpus
+
+
+@pytest.fixture
+def emissions_only(tmp_path, monkeypatch):
+    """ bulk_score loaded for ingredient records, with the module state it sets restored afterwards. """
+    write_corpus(tmp_path)
+    monkeypatch.setattr(dataset_store, "DATASETS_DIR", str(tmp_path))
+    for module, name in ((bulk_score, "_generation"), (bulk_score, "_emissions"), (emissions, "RESOLUTION_TABLE"),
+                         (sustainability, "emissions_df")):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    bulk_score.load_scoring_data(False, None, str(tmp_path / dataset_store.EMISSIONS_FILENAME))
+
+
+def test_score_record_sums_the_emissions_of_ingredient_records(emissions_only):
+    row = bulk_score.score_record({"id": "1", "ingredients": '["beef", "rice"]'})
+    assert row["status"] == "ok"
+    assert row["total_emissions"] == pytest.approx(EMISSIONS["beef"] + EMISSIONS["rice"], abs=0.01)
+
+    lighter = bulk_score.score_record({"id": "2", "ingredients": "lentils, carrots"})
+    assert 0 < lighter["total_emissions"] < row["total_emissions"]
+    assert lighter["sustainability_score"] > row["sustainability_score"]
+
+
+@pytest.mark.parametrize("arguments", [["menu.parquet", "out.csv"], ["menu.csv", "out.jsonl"]])
+def test_unsupported_formats_are_rejected(arguments, monkeypatch, capsys):
+    monkeypatch.setattr("sys.argv", ["bulk_score.py"] + arguments)
+    with pytest.raises(SystemExit) as exited:
+        bulk_score.main()
+    assert exited.value.code == 2
+    assert "unsupported" in capsys.readouterr().err
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from dataset_fetch import DatasetFetchError, LocalStorageBackend, fetch_dataset
+
+
+class CountingBackend(LocalStorageBackend):
+    """Local backend that records how many ranged reads were made."""
+
+    def __init__(self, root, corrupt=False):
+        super().__init__(root)
+        self.reads = 0
+        self.corrupt = corrupt
+
+    def read_range(self, name, start, end):
+        self.reads += 1
+        data = super().read_range(name, start, end)
+        return bytes(len(data)) if self.corrupt else data
+
+
+class SlowSharedBackend(LocalStorageBackend):
+    """Local backend with slow ranged reads, counted across processes."""
+
+    def __init__(self, root, reads):
+        super().__init__(root)
+        self.reads = reads
+
+    def read_range(self, name, start, end):
+        with self.reads.get_lock():
+            self.reads.value += 1
+        time.sleep(0.02)
+        return super().read_range(name, start, end)
+
+
+def _make_blob(tmp_path, size=10_000):
+    source = tmp_path / "bucket"
+    source.mkdir()
+    (source / "recipes.csv.gz").write_bytes(os.urandom(size))
+    return source
+
+
+def test_fetch_downloads_in_ranges_and_verifies(tmp_path):
+    source = _make_blob(tmp_path)
+    backend = CountingBackend(str(source))
+    destination = tmp_path / "datasets" / "recipes.csv.gz"
+
+    fetch_dataset(backend, "recipes.csv.gz", str(destination), str(tmp_path / "cache"), chunk_size=1024, max_workers=4)
+
+    assert destination.read_bytes() == (source / "recipes.csv.gz").read_bytes()
+    assert backend.reads == 10
+
+
+def test_restart_uses_cache_without_downloading(tmp_path):
+    source = _make_blob(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    destination = tmp_path / "datasets" / "recipes.csv.gz"
+    fetch_dataset(CountingBackend(str(source)), "recipes.csv.gz", str(destination), cache_dir, chunk_size=1024)
+
+    destination.unlink()
+    backend = CountingBackend(str(source))
+    fetch_dataset(backend, "recipes.csv.gz", str(destination), cache_dir, chunk_size=1024)
+
+    assert backend.reads == 0
+    assert destination.read_bytes() == (source / "recipes.csv.gz").read_bytes()
+
+
+def test_checksum_mismatch_is_rejected(tmp_path):
+    source = _make_blob(tmp_path)
+    destination = tmp_path / "datasets" / "recipes.csv.gz"
+
+    with pytest.raises(DatasetFetchError):
+        fetch_dataset(CountingBackend(str(source), corrupt=True), "recipes.csv.gz", str(destination), str(tmp_path / "cache"))
+
+    assert not destination.exists()
+
+
+def test_concurrent_fetches_download_once(tmp_path):
+    source = _make_blob(tmp_path)
+    context = multiprocessing.get_context("fork")
+    reads = context.Value("i", 0)
+    backend = SlowSharedBackend(str(source), reads)
+    destination = tmp_path / "datasets" / "recipes.csv.gz"
+
+    def fetch():
+        fetch_dataset(backend, "recipes.csv.gz", str(destination), str(tmp_path / "cache"), chunk_size=1024, max_workers=2)
+
+    workers = [context.Process(target=fetch) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    assert [worker.exitcode for worker in workers] == [0, 0]
+    assert reads.value == 10
+    assert destination.read_bytes() == (source / "recipes.csv.gz").read_bytes()
+    assert not [name for name in os.listdir(tmp_path / "cache" / "objects") if name.endswith(".partial")]
@@ -0,0 +1,142 @@
+import gzip
+import json
+import random
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_store
+from conftest import EMISSIONS, FILLER_WORDS, write_corpus
+from recipe_groups import compact_recipes
+from recipe_index import build_ingredient_index
+from title_search import build_title_matcher
+
+
+def write_delta(path, seed, rows=150):
+    """ A delta recipes file repeating base titles, adding new ones and new ingredients, with a few untitled rows. """
+    rng = random.Random(seed)
+    words = FILLER_WORDS + ["braised", "cobbler", "stew", "soup"]
+    ingredients = sorted(EMISSIONS) + ["saffron", "kale", "chickpeas"]
+    with gzip.open(path, "wt") as f:
+        f.write("title,NER\n")
+        for _ in range(rows):
+            title = "" if rng.random() < 0.03 else " ".join(rng.sample(words, rng.randint(2, 3))).title()
+            f.write(f'{title},"{json.dumps(rng.sample(ingredients, rng.randint(2, 6))).replace(chr(34), chr(34) * 2)}"\n')
+    return str(path)
+
+
+def _assert_same_matcher(extended, rebuilt):
+    assert list(extended.titles) == list(rebuilt.titles)
+    assert extended.token_vocabulary == rebuilt.token_vocabulary
+    for name in ("histograms", "lengths", "joined_lengths", "token_offsets", "token_postings", "row_offsets", "row_ids"):
+        np.testing.assert_array_equal(getattr(extended, name), getattr(rebuilt, name), err_msg=name)
+
+
+@pytest.mark.parametrize("compaction", [None, 1.0])
+def test_extend_generation_matches_a_rebuild_of_its_rows(tmp_path, compaction):
+    write_corpus(tmp_path)
+    base = dataset_store.build_generation(str(tmp_path / dataset_store.RECIPES_FILENAME),
+                                          str(tmp_path / dataset_store.EMISSIONS_FILENAME), compaction=compaction)
+    generation = base
+    for seed in (1, 2):
+        generation = dataset_store.extend_generation(generation, delta_path=write_delta(tmp_path / f"delta{seed}.csv.gz", seed))
+
+    assert len(base.title_matcher.titles) < len(generation.title_matcher.titles)
+    _assert_same_matcher(generation.title_matcher, build_title_matcher(generation.recipes["Title"]))
+
+    rebuilt_index = build_ingredient_index(generation.recipes["Cleaned_Ingredients"])
+    assert generation.ingredient_index.vocabulary == rebuilt_index.vocabulary
+    for name in ("offsets", "postings", "recipe_sizes"):
+        np.testing.assert_array_equal(getattr(generation.ingredient_index, name), getattr(rebuilt_index, name))
+
+    # The base generation still serves in-flight requests unchanged
+    _assert_same_matcher(base.title_matcher, build_title_matcher(base.recipes["Title"]))
+
+
+def _wait_for_reload():
+    while dataset_store.reload_status()["state"] == "running":
+        time.sleep(0.01)
+    assert dataset_store.reload_status()["state"] == "idle", dataset_store.reload_status()["error"]
+
+
+def test_workers_follow_reloads_logged_by_another(tmp_path, monkeypatch):
+    write_corpus(tmp_path)
+    monkeypatch.setattr(dataset_store, "DATASETS_DIR", str(tmp_path))
+    monkeypatch.setattr(dataset_store, "_swap_listeners", [])
+    stale = dataset_store.build_generation(dataset_store.dataset_path(dataset_store.RECIPES_FILENAME),
+                                           dataset_store.dataset_path(dataset_store.EMISSIONS_FILENAME))
+    delta_path = write_delta(tmp_path / "delta1.csv.gz", 1)
+
+    # One worker reloads a delta and logs it
+    monkeypatch.setattr(dataset_store, "_current_generation", stale)
+    assert dataset_store.start_reload(delta_path=delta_path)
+    _wait_for_reload()
+    reloaded = dataset_store.current_generation()
+    assert reloaded.sources["deltas"] == [delta_path]
+
+    # Another worker still on the old generation applies it on its next check, once
+    monkeypatch.setattr(dataset_store, "_current_generation", stale)
+    monkeypatch.setattr(dataset_store, "_applied_reload_id", 0)
+    assert dataset_store.apply_logged_reloads()
+    caught_up = dataset_store.current_generation()
+    assert (caught_up.fingerprint, len(caught_up.recipes)) == (reloaded.fingerprint, len(reloaded.recipes))
+    assert not dataset_store.apply_logged_reloads()
+
+    # A full reload is replayed by workers whose generation predates it, with the logged deltas
+    assert dataset_store.start_reload(full=True)
+    _wait_for_reload()
+    assert not dataset_store.apply_logged_reloads()  # The worker that logged it is already there
+    monkeypatch.setattr(dataset_store, "_current_generation", reloaded)
+    monkeypatch.setattr(dataset_store, "_applied_reload_id", 1)
+    assert dataset_store.apply_logged_reloads()
+    rebuilt = dataset_store.current_generation()
+    assert rebuilt is not reloaded and rebuilt.created_at > reloaded.created_at
+    assert (rebuilt.fingerprint, len(rebuilt.recipes)) == (reloaded.fingerprint, len(reloaded.recipes))
+
+
+def write_near_duplicates(path, recipes, seed, rows=300):
+    """ A delta of base recipes repeated exactly, with an ingredient added or dropped, or under new titles. """
+    rng = random.Random(seed)
+    written = []
+    for _ in range(rows):
+        if written and rng.random() < 0.2:
+            written.append(rng.choice(written))
+            continue
+        row = rng.randrange(len(recipes))
+        title, ingredients = recipes["Title"].iloc[row], json.loads(recipes["Cleaned_Ingredients"].iloc[row])
+        kind = rng.random()
+        if kind < 0.3:
+            ingredients = ingredients + [rng.choice(["saffron", "kale", "chickpeas"])]
+        elif kind < 0.5 and len(ingredients) > 2:
+            ingredients = ingredients[1:]
+        elif kind < 0.6:
+            title = f"{title} Deluxe"
+        written.append((title, ingredients))
+    with gzip.open(path, "wt") as f:
+        f.write("title,NER\n")
+        for title, ingredients in written:
+            f.write(f'{title},"{json.dumps(ingredients).replace(chr(34), chr(34) * 2)}"\n')
+    return str(path)
+
+
+@pytest.mark.parametrize("compaction", [1.0, 0.6])
+def test_delta_compaction_matches_regrouping_the_whole_corpus(tmp_path, compaction):
+    write_corpus(tmp_path)
+    recipes_path = str(tmp_path / dataset_store.RECIPES_FILENAME)
+    generation = dataset_store.build_generation(recipes_path, str(tmp_path / dataset_store.EMISSIONS_FILENAME),
+                                                compaction=compaction)
+    near_duplicate = compaction if compaction < 1 else None
+    raw = dataset_store.load_recipes(recipes_path)
+    for seed in (1, 2, 3):
+        delta_path = write_near_duplicates(tmp_path / f"delta{seed}.csv.gz", generation.recipes, seed)
+        delta = dataset_store.load_recipes(delta_path)
+        expected = compact_recipes(pd.concat([generation.recipes, delta.assign(Count=1)], ignore_index=True), near_duplicate)
+        generation = dataset_store.extend_generation(generation, delta_path=delta_path)
+        pd.testing.assert_frame_equal(generation.recipes, expected)
+        raw = pd.concat([raw, delta], ignore_index=True)
+
+    # Exact groups do not depend on how the rows arrived
+    if near_duplicate is None:
+        pd.testing.assert_frame_equal(generation.recipes, compact_recipes(raw))
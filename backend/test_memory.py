@@ -0,0 +1,80 @@
+import gc
+import json
+import random
+
+import pytest
+
+import dataset_store
+from emissions import EMISSION_CATEGORIES
+from memory_report import generation_breakdown, process_rss_bytes
+
+# Fixed synthetic corpus: budgets below are for exactly this scale, with ~1.5x headroom
+NUM_RECIPES = 50000
+WORDS = ["chicken", "beef", "tofu", "rice", "bean", "cake", "soup", "stew", "salad", "pie", "curry",
+         "pasta", "chocolate", "lemon", "garlic", "roasted", "spicy", "vegan", "quick", "grilled"]
+INGREDIENTS = ["chicken", "beef", "rice", "beans", "flour", "milk", "butter", "onion", "garlic", "tomato",
+               "lemon", "olive oil", "sugar", "eggs", "salt", "black pepper", "cheese", "potatoes", "carrots", "tofu"]
+
+MB = 1024 * 1024
+BUDGETS = {
+    "recipes.Title": 5 * MB,
+    "recipes.Cleaned_Ingredients": 8 * MB,
+    "emissions": 64 * 1024,
+    "ingredient_index": 2 * MB,
+    "title_matcher": 5 * MB,
+}
+TOTAL_BUDGET = 20 * MB
+RSS_GROWTH_BUDGET = 128 * MB  # Loading includes transient parse buffers on top of the structures
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    rng = random.Random(1234)
+    directory = tmp_path_factory.mktemp("corpus")
+    recipes_path = directory / "recipes.csv"
+    with open(recipes_path, "w") as f:
+        f.write("title,NER\n")
+        for _ in range(NUM_RECIPES):
+            title = " ".join(rng.sample(WORDS, rng.randint(2, 4))).title()
+            ingredients = json.dumps(rng.sample(INGREDIENTS, rng.randint(3, 10)))
+            f.write(f'{title},"{ingredients.replace(chr(34), chr(34) * 2)}"\n')
+
+    emissions_path = directory / "emissions.csv"
+    with open(emissions_path, "w") as f:
+        f.write(",".join(["Food product"] + EMISSION_CATEGORIES) + "\n")
+        for i, ingredient in enumerate(INGREDIENTS):
+            f.write(",".join([ingredient] + [str(i + 0.5)] * len(EMISSION_CATEGORIES)) + "\n")
+    return str(recipes_path), str(emissions_path)
+
+
+@pytest.fixture(scope="module")
+def loaded(corpus):
+    gc.collect()
+    rss_before = process_rss_bytes()
+    generation = dataset_store.build_generation(*corpus)
+    gc.collect()
+    return generation, process_rss_bytes() - rss_before
+
+
+def test_corpus_loaded(loaded):
+    generation, _ = loaded
+    assert len(generation.recipes) == NUM_RECIPES
+    assert len(generation.ingredient_index.vocabulary) == len(INGREDIENTS)
+
+
+@pytest.mark.parametrize("structure", sorted(BUDGETS))
+def test_structure_within_budget(loaded, structure):
+    generation, _ = loaded
+    used = generation_breakdown(generation)[structure]
+    assert used <= BUDGETS[structure], f"{structure} uses {used / MB:.2f} MB, budget {BUDGETS[structure] / MB:.2f} MB"
+
+
+def test_total_structures_within_budget(loaded):
+    generation, _ = loaded
+    total = sum(generation_breakdown(generation).values())
+    assert total <= TOTAL_BUDGET, f"structures use {total / MB:.2f} MB, budget {TOTAL_BUDGET / MB:.2f} MB"
+
+
+def test_rss_growth_within_budget(loaded):
+    _, rss_growth = loaded
+    assert rss_growth <= RSS_GROWTH_BUDGET, f"loading grew RSS by {rss_growth / MB:.1f} MB"
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from model_scoring import MODEL_FEATURES, ModelScorer, PackedForest
+
+ensemble = pytest.importorskip("sklearn.ensemble")
+
+
+@pytest.fixture(scope="module")
+def forest_model():
+    rng = np.random.default_rng(0)
+    features = rng.gamma(1.0, 1.5, size=(400, len(MODEL_FEATURES)))
+    target = features @ rng.uniform(-1, 1, size=len(MODEL_FEATURES)) + rng.normal(0, 0.1, size=400)
+    return ensemble.RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(features, target)
+
+
+def test_packed_forest_matches_model_predict(forest_model):
+    forest = PackedForest.from_model(forest_model)
+    assert forest is not None
+    samples = np.random.default_rng(1).gamma(1.0, 1.5, size=(300, len(MODEL_FEATURES)))
+    np.testing.assert_allclose(forest.predict(samples), forest_model.predict(samples), rtol=0, atol=1e-9)
+
+
+def test_scorer_rounds_like_predict(forest_model):
+    scorer = ModelScorer(forest_model, path=None)
+    totals = [dict(zip(MODEL_FEATURES, row)) for row in np.random.default_rng(2).gamma(1.0, 1.5, size=(50, 8)).tolist()]
+    expected = forest_model.predict(np.array([[t[name] for name in MODEL_FEATURES] for t in totals]))
+    assert scorer.predict(totals) == [round(float(value), 2) for value in expected]
+    assert scorer.predict([]) == []
+
+
+def test_different_dishes_get_different_model_scores(api, monkeypatch):
+    import scoring
+    from model_scoring import DEFAULT_MODEL_PATH, load_model_scorer
+
+    scorer = load_model_scorer(DEFAULT_MODEL_PATH)
+    if scorer is None:
+        pytest.skip("the bundled model does not load with this scikit-learn")
+    monkeypatch.setattr(scoring, "MODEL_SCORER", scorer)
+    client = api.app.test_client()
+
+    scores = [client.post("/predict", json={"ingredients": ingredients}).get_json()["model_score"]
+              for ingredients in (["beef", "cheese"], ["lentils", "carrots"], ["rice", "tofu", "onion"])]
+    assert len(set(scores)) == len(scores)
+
+    compared = client.post("/compare-dishes", json={"dish1": "beef stew", "dish2": "lentil soup"}).get_json()
+    assert compared["dish1"]["model_score"] != compared["dish2"]["model_score"]
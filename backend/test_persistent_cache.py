@@ -0,0 +1,55 @@
+import itertools
+from types import SimpleNamespace
+
+import persistent_cache
+from persistent_cache import GenerationCacheView, PersistentCache, cache_version
+
+
+def test_workers_share_hits_and_misses(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = PersistentCache(path), PersistentCache(path)
+    assert first.get("search", "g1", ["lentil soup", 800]) is None
+    first.set("search", "g1", ["lentil soup", 800], [{"title_ids": [3, 1]}, 200])
+
+    assert second.get("search", "g1", ["lentil soup", 800]) == [{"title_ids": [3, 1]}, 200]
+    assert second.get("search", "g1", ["lentil soup", 400]) is None  # Keys are compared whole
+
+    first.flush_stats()
+    stats = second.stats()["search"]
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+    assert stats["hit_rate"] == round(1 / 3, 4)
+
+
+def test_eviction_drops_other_generations_then_least_recently_used(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(persistent_cache, "time", SimpleNamespace(time=lambda: float(next(clock))))
+    monkeypatch.setattr(persistent_cache, "EVICT_CHECK_EVERY", 1)
+    value = "x" * 998  # 1000 bytes once JSON-encoded
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"), max_bytes=10_000)
+
+    for index in range(5):
+        cache.set("search", "new", index, value)
+    for index in range(4):
+        cache.set("search", "old", index, value)  # Used more recently, but by an older generation
+    for index in range(5, 12):
+        cache.set("search", "new", index, value)  # Every write past max_bytes trims the cache back to 90%
+
+    assert all(cache.get("search", "old", index) is None for index in range(4))
+    assert [index for index in range(12) if cache.get("search", "new", index) is not None] == list(range(2, 12))
+    assert cache.stats()["search"]["bytes"] == 10_000
+
+
+def test_version_change_invalidates_older_entries(tmp_path):
+    module = tmp_path / "title_search.py"
+    module.write_text("SCORE_CUTOFF = 70\n")
+    before = cache_version([str(module)], {"spelling": True})
+    assert cache_version([str(module)], {"spelling": True}) == before
+    assert cache_version([str(module)], {"spelling": False}) != before
+    module.write_text("SCORE_CUTOFF = 80\n")
+    after = cache_version([str(module)], {"spelling": True})
+    assert after != before
+
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"))
+    GenerationCacheView(cache, "ingredient", f"fingerprint:{before}").set("lentils", "other pulses")
+    assert GenerationCacheView(cache, "ingredient", f"fingerprint:{after}").get("lentils") is None
+    assert GenerationCacheView(cache, "ingredient", f"fingerprint:{before}").get("lentils") == "other pulses"
@@ -0,0 +1,35 @@
+import random
+from collections import Counter
+
+from popularity import CountMinSketch, QueryPopularity
+
+
+def test_sketch_never_undercounts():
+    sketch = CountMinSketch(width=64, depth=3)  # Small enough that keys collide
+    rng = random.Random(5)
+    counts = Counter()
+    for _ in range(5000):
+        key = f"query {int(rng.paretovariate(1.2)) % 500}"
+        counts[key] += 1
+        sketch.add(key)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+
+
+def test_flush_merges_workers_sharing_a_file(tmp_path):
+    path = str(tmp_path / "query_popularity.json")
+    first = QueryPopularity(path, flush_seconds=3600, capacity=4)
+    second = QueryPopularity(path, flush_seconds=3600, capacity=4)
+    for _ in range(3):
+        first.record("search", "lentil soup")
+    for _ in range(5):
+        second.record("search", "lentil soup")
+    second.record("compare-dishes", "beef stew", "lentil soup")
+
+    first.flush()
+    second.flush()
+    first.flush()  # Picks up the second worker's counts without adding its own again
+    for tracker in (first, second):
+        assert tracker.top(2) == [(("search", "lentil soup"), 8), (("compare-dishes", "beef stew", "lentil soup"), 1)]
+
+    # A restarted worker starts from the shared file
+    assert QueryPopularity(path, flush_seconds=3600).top(1) == [(("search", "lentil soup"), 8)]
@@ -0,0 +1,25 @@
+import json
+
+import pandas as pd
+
+from recipe_index import build_ingredient_index
+
+RECIPES = [
+    ["chicken breast", "chicken thighs", "rice"],
+    ["chicken breast", "rice"],
+    ["chicken", "salt"],
+    ["tofu", "rice", "soy sauce"],
+]
+
+
+def test_missing_ingredients_count_every_ingredient_a_term_matches():
+    index = build_ingredient_index(pd.Series([json.dumps(recipe) for recipe in RECIPES], dtype="string"))
+
+    row_ids, overlaps, total = index.search(["chicken", "rice"], limit=10)
+    assert (row_ids.tolist(), overlaps.tolist(), total) == ([1, 0, 2, 3], [2, 2, 1, 1], 4)
+    # "chicken" expands to both chicken cuts of row 0, so it has nothing missing
+    assert index.matched_ingredient_counts(["chicken", "rice"], row_ids).tolist() == [2, 3, 1, 1]
+
+    row_ids, _, _ = index.search(["chicken", "rice"], limit=10, expand=False)
+    assert row_ids.tolist() == [1, 2, 0, 3]
+    assert index.matched_ingredient_counts(["chicken", "rice"], row_ids, expand=False).tolist() == [1, 1, 1, 1]
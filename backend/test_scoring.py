@@ -0,0 +1,52 @@
+import random
+
+import pandas as pd
+import pytest
+
+from emissions import EMISSION_CATEGORIES, match_ingredients_with_emissions
+from scoring import IMPACT_CATEGORIES, score_ingredients, score_substitutions
+
+PRODUCTS = ["Rice", "Tomatoes", "Potatoes", "Bananas", "Apples", "Tofu", "Peas", "Oatmeal", "Nuts", "Coffee"]
+
+
+@pytest.fixture(scope="module")
+def emissions():
+    rng = random.Random(0)
+    rows = []
+    for product in PRODUCTS:
+        stages = {category: round(rng.uniform(0, 3), 2) for category in IMPACT_CATEGORIES[:-1]}
+        rows.append(dict(stages, **{"Food product": product, "Total from Land to Retail": round(sum(stages.values()), 2),
+                                    "Total Global Average GHG Emissions per kg": round(rng.uniform(0, 20), 2)}))
+    return pd.DataFrame(rows, columns=["Food product"] + EMISSION_CATEGORIES)
+
+
+def _metrics(result):
+    return {key: result[key] for key in ("sustainability_score", "total_emissions", "emissions_equivalence", "breakdown")}
+
+
+def test_substitutions_match_predict_on_the_edited_list(emissions):
+    rng = random.Random(1)
+    names = [product.lower() for product in PRODUCTS]
+    for _ in range(300):
+        base = rng.sample(names, rng.randint(1, 5))
+        base_matched = match_ingredients_with_emissions(base, emissions)
+        edits, edited = [], list(base)
+        for _ in range(rng.randint(1, 3)):
+            op = rng.choice(["add", "remove", "replace"])
+            if op != "add" and edited:
+                removed = edited.pop(rng.randrange(len(edited)))
+                added = rng.choice([name for name in names if name not in edited]) if op == "replace" else None
+            else:
+                removed, added = None, rng.choice(names)
+            if added is not None and added not in edited:
+                edited.append(added)
+            edits.append((removed, added))
+
+        _, (result,) = score_substitutions(base_matched, [edits], emissions)
+        assert _metrics(result) == _metrics(score_ingredients(edited, emissions)), (base, edits)
+
+
+def test_substitutions_without_emissions_dataset_score_like_predict(emissions):
+    base_matched = match_ingredients_with_emissions(["rice"], emissions)
+    _, (result,) = score_substitutions(base_matched, [[(None, "tofu")]], None)
+    assert _metrics(result) == _metrics(score_ingredients(["rice", "tofu"], None))
@@ -0,0 +1,92 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from conftest import write_corpus
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVE = "import sys, main; main.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+ADMIN_TOKEN = "shard-test"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until(check, timeout=120):
+    stop_at = time.time() + timeout
+    while time.time() < stop_at:
+        try:
+            if check():
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("node did not become ready")
+
+
+@pytest.fixture(scope="module")
+def cluster(tmp_path_factory):
+    """ A whole-corpus node, two shard nodes over the same corpus and a coordinator in front of them, as processes. """
+    directory = tmp_path_factory.mktemp("datasets")
+    write_corpus(directory)
+    base_env = dict(os.environ, GREENBITE_DATASETS_DIR=str(directory), GREENBITE_BACKGROUND_LOAD="0",
+                    GREENBITE_CACHE="off", GREENBITE_POPULARITY="off", GREENBITE_RELOAD_POLL_SECONDS="off",
+                    GREENBITE_ADMIN_TOKEN=ADMIN_TOKEN)
+    processes = []
+
+    def start(**env):
+        port = _free_port()
+        processes.append(subprocess.Popen([sys.executable, "-c", SERVE, str(port)], cwd=BACKEND_DIR,
+                                          env=dict(base_env, **env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        return f"http://127.0.0.1:{port}"
+
+    def ready(url):
+        return requests.get(f"{url}/readyz", timeout=5).status_code == 200
+
+    try:
+        single = start()
+        shards = [start(GREENBITE_SHARD=f"{index}/2") for index in range(2)]
+        for url in [single] + shards:
+            _wait_until(lambda: ready(url))
+        coordinator = start(GREENBITE_SHARD_NODES=",".join(shards))
+        _wait_until(lambda: ready(coordinator))
+
+        # Queries are spell-corrected once the vocabulary merged from the shards is loaded
+        def corrector_loaded():
+            report = requests.get(f"{coordinator}/debug/memory", headers={"X-Admin-Token": ADMIN_TOKEN}, timeout=5).json()
+            return report["structures"].get("ingredients.spell_corrector", 0) > 0
+        _wait_until(corrector_loaded)
+        yield single, coordinator
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(10)
+
+
+@pytest.mark.parametrize("dedupe", [False, True])
+def test_merged_search_matches_a_single_node(cluster, dedupe):
+    single, coordinator = cluster
+    for query in ("roasted garden salad", "lentil soup", "spicy smoky bowl"):
+        request = {"query": query, "dedupe": dedupe}
+        expected = requests.post(f"{single}/search", json=request, timeout=30).json()
+        merged = requests.post(f"{coordinator}/search", json=request, timeout=30).json()
+        assert merged["failed_shards"] == []
+        assert merged["recipes"] == expected["recipes"]
+
+
+def test_merged_compare_dishes_matches_a_single_node(cluster):
+    single, coordinator = cluster
+    request = {"dish1": "beef stew", "dish2": "lentil soup"}
+    expected = requests.post(f"{single}/compare-dishes", json=request, timeout=30).json()
+    merged = requests.post(f"{coordinator}/compare-dishes", json=request, timeout=30).json()
+    assert merged.pop("failed_shards", []) == []
+    assert merged == expected
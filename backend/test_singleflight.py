@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+
+import pytest
+
+import singleflight
+from singleflight import FileSingleFlight, SingleFlight, single_flight_from_env
+
+fcntl = pytest.importorskip("fcntl")
+
+
+def _run_concurrently(calls):
+    """ Start every call at once; returns their results in order. """
+    results = [None] * len(calls)
+    barrier = threading.Barrier(len(calls))
+
+    def run(index):
+        barrier.wait()
+        results[index] = calls[index]()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(calls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def _slow_counter():
+    computed = []
+
+    def compute():
+        computed.append(1)
+        time.sleep(0.3)  # Long enough for every duplicate to arrive while it runs
+        return {"recipes": ["Lentil Soup"]}
+    return computed, compute
+
+
+def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight()
+    computed, compute = _slow_counter()
+    results = _run_concurrently([lambda: flight.do(("search", "lentil soup"), compute)] * 8)
+
+    assert len(computed) == 1
+    assert all(result == {"recipes": ["Lentil Soup"]} for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flight.stats == {"leaders": 1, "shared": 7}
+
+
+def test_workers_sharing_a_directory_share_one_computation(tmp_path):
+    workers = [FileSingleFlight(str(tmp_path)) for _ in range(3)]
+    computed, compute = _slow_counter()
+    results = _run_concurrently([lambda worker=worker: worker.do(("search", "lentil soup"), compute)
+                                 for worker in workers for _ in range(2)])
+
+    assert len(computed) == 1
+    assert all(result == {"recipes": ["Lentil Soup"]} for result, _ in results)
+
+
+def _wait_behind_held_lock(flight, key, publish):
+    """ Hold the key's lock as another worker would, publish a result, release it; returns what flight.do gave. """
+    lock_path, result_path = flight._paths(key)
+    holder = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    outcome = {}
+    waiter = threading.Thread(target=lambda: outcome.update(result=flight.do(key, lambda: "computed")))
+    waiter.start()
+    time.sleep(0.1)
+    publish(flight, result_path)
+    os.close(holder)
+    waiter.join(10)
+    return outcome["result"]
+
+
+def test_waiter_reuses_a_fresh_result_and_recomputes_an_expired_one(tmp_path):
+    fresh = FileSingleFlight(str(tmp_path), result_ttl=5.0)
+    assert _wait_behind_held_lock(fresh, ("search", "beef stew"),
+                                  lambda flight, path: flight._write_result(path, "from another worker")) == \
+        ("from another worker", False)
+
+    def publish_then_expire(flight, path):
+        flight._write_result(path, "from another worker")
+        time.sleep(0.2)
+
+    expiring = FileSingleFlight(str(tmp_path), result_ttl=0.05)
+    assert _wait_behind_held_lock(expiring, ("search", "lentil soup"), publish_then_expire) == ("computed", False)
+
+
+def test_file_mode_without_fcntl_falls_back_to_in_process(monkeypatch, tmp_path):
+    monkeypatch.setenv("GREENBITE_SINGLEFLIGHT", "file")
+    monkeypatch.setenv("GREENBITE_SINGLEFLIGHT_DIR", str(tmp_path))
+    assert isinstance(single_flight_from_env(), FileSingleFlight)
+
+    monkeypatch.setattr(singleflight, "fcntl", None)
+    assert type(single_flight_from_env()) is SingleFlight
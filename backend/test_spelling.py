@@ -0,0 +1,58 @@
+import random
+
+import ingredients
+from ingredients import normalize_input
+from spelling import MAX_EDIT_DISTANCE, SHORT_WORD_LENGTH, _edit_distance, spell_corrector_from_counts
+
+WORD_COUNTS = {"chicken": 40, "curry": 25, "lentil": 12, "soup": 30, "chocolate": 18, "cookies": 9, "banana": 7,
+               "bread": 22, "garlic": 15, "roasted": 11, "salmon": 6, "fist": 3, "prawn": 4, "stew": 14,
+               "stem": 2, "pancakes": 8, "pancake": 5, "cake": 20, "rare": 1}
+
+
+def _closest(word):
+    """ The reference answer: nearest candidate by edit distance, then most frequent, then alphabetical. """
+    max_distance = 1 if len(word) <= SHORT_WORD_LENGTH else MAX_EDIT_DISTANCE
+    candidates = [(_edit_distance(word, candidate, max_distance), -count, candidate)
+                  for candidate, count in WORD_COUNTS.items() if count >= 2]
+    best = min(candidates)
+    return best[2] if best[0] <= max_distance else word
+
+
+def test_correct_fixes_typos_like_a_full_scan():
+    corrector = spell_corrector_from_counts(WORD_COUNTS)
+    assert [corrector.correct(word) for word in ["chiken", "curyy", "lentl", "chocolat", "garlik", "salomn"]] == \
+        ["chicken", "curry", "lentil", "chocolate", "garlic", "salmon"]
+
+    rng = random.Random(11)
+    for _ in range(500):
+        word = list(rng.choice(list(WORD_COUNTS)))
+        for _ in range(rng.randint(1, 2)):
+            position = rng.randrange(len(word))
+            edit = rng.choice(["substitute", "insert", "delete", "transpose"])
+            if edit == "substitute":
+                word[position] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+            elif edit == "insert":
+                word.insert(position, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+            elif edit == "delete" and len(word) > 1:
+                del word[position]
+            elif position + 1 < len(word):
+                word[position], word[position + 1] = word[position + 1], word[position]
+        word = "".join(word)
+        if len(word) >= 4 and word not in WORD_COUNTS:
+            assert corrector.correct(word) == _closest(word), word
+
+
+def test_correct_leaves_known_short_and_non_alphabetic_words_alone():
+    corrector = spell_corrector_from_counts(WORD_COUNTS)
+    for word in ["stew", "stem", "rare", "pancakes", "pie", "cak", "b4con", "zzzzzzzz"]:
+        assert corrector.correct(word) == word
+    assert corrector.correct("raer") == "raer"  # Words seen once are known but never offered
+
+
+def test_normalize_input_keeps_synonym_words(monkeypatch):
+    monkeypatch.setattr(ingredients, "SPELL_CORRECTOR", spell_corrector_from_counts(WORD_COUNTS))
+    # "fish" and "prawns" are one edit from title words but are synonym map words
+    assert normalize_input("Chiken Curyy") == "chicken breast curry"
+    assert normalize_input("fish") == "salmon fillet"
+    assert normalize_input("prawns soup") == "prawns soup"
+    assert normalize_input("garlik Bread") == "garlic bread"
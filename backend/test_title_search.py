@@ -0,0 +1,99 @@
+import random
+
+import pandas as pd
+import pytest
+from thefuzz import fuzz, process
+
+from deadline import Deadline
+from title_search import build_title_matcher, process_title
+
+WORDS = ["chicken", "curry", "beef", "stew", "lentil", "soup", "chocolate", "chip", "cookies", "banana", "bread",
+         "lemon", "garlic", "roasted", "spicy", "vegan", "grilled", "salmon", "pie", "tart", "mac", "cheese", "a", "la"]
+
+
+def _title(rng):
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+    if rng.random() < 0.2:
+        title = title.title() + rng.choice(["!", " (Easy)", "'s", " - 2", " & Co."])
+    return title
+
+
+def _query(rng, titles):
+    kind = rng.random()
+    if kind < 0.4:
+        words = rng.choice(titles).split()
+        return " ".join(rng.sample(words, rng.randint(1, len(words))))
+    if kind < 0.7:
+        title = list(rng.choice(titles).lower())
+        for _ in range(rng.randint(1, 3)):
+            title[rng.randrange(len(title))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        return "".join(title)
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+
+
+def _assert_same_top(query, found, expected):
+    """ Same scores in the same order; titles tied at the lowest kept score may be any of the tied ones. """
+    assert [score for _, score in found] == [score for _, score in expected], query
+    if found:
+        lowest = found[-1][1]
+        assert {title for title, score in found if score > lowest} == {title for title, score in expected if score > lowest}
+        assert all(fuzz.WRatio(query, title) == score for title, score in found), query
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(42)
+    return [_title(rng) for _ in range(2000)]
+
+
+def test_extract_matches_process_extract_over_unique_titles(corpus):
+    matcher = build_title_matcher(pd.Series(corpus, dtype="string"))
+    unique_titles = list(dict.fromkeys(corpus))
+    assert list(matcher.titles) == unique_titles
+    for title_id in (0, len(unique_titles) // 2, len(unique_titles) - 1):
+        assert matcher.rows_for(title_id).tolist() == [row for row, title in enumerate(corpus) if title == unique_titles[title_id]]
+
+    rng = random.Random(7)
+    for _ in range(150):
+        query = _query(rng, unique_titles)
+        if not process_title(query):
+            assert matcher.extract(query) == []  # thefuzz would score every title 0
+            continue
+        top = process.extract(query, unique_titles, limit=5)
+        for limit, cutoff in ((5, 0), (5, 80), (1, 0)):
+            expected = [(title, score) for title, score in top[:limit] if score >= cutoff]
+            found = [(title, score) for title, score, _ in matcher.extract(query, limit=limit, score_cutoff=cutoff)]
+            _assert_same_top(query, found, expected)
+
+
+class ExpiringDeadline(Deadline):
+    """ Unbounded, but reports expiry from the given check onwards. """
+
+    def __init__(self, checks_left):
+        super().__init__()
+        self.checks_left = checks_left
+
+    def expired(self):
+        self.checks_left -= 1
+        if self.checks_left < 0:
+            self.exhausted = True
+        return self.exhausted
+
+
+def test_extract_returns_the_best_so_far_when_the_deadline_expires(corpus):
+    # Pad the corpus so a broad query has several 256-candidate deadline checks to get through
+    matcher = build_title_matcher(pd.Series(corpus + [f"{title} {n}" for n, title in enumerate(corpus)], dtype="string"))
+    query = "a la"  # Short words bound loosely, so most titles stay candidates
+    full = matcher.extract(query, limit=5)
+
+    deadline = Deadline(0)
+    assert matcher.extract(query, limit=5, deadline=deadline) == []
+    assert deadline.exhausted
+
+    deadline = ExpiringDeadline(2)
+    partial = matcher.extract(query, limit=5, deadline=deadline)
+    assert deadline.exhausted
+    assert len(partial) == 5
+    assert all(fuzz.WRatio(query, title) == score for title, score, _ in partial)
+    # Only part of the titles were scored, so no partial match beats the full search's at the same rank
+    assert all(found[1] <= best[1] for found, best in zip(partial, full))
@@ -0,0 +1,213 @@
+import heapq
+from array import array
+
+import numpy as np
+import pandas as pd
+from thefuzz import fuzz, utils
+
+from recipe_index import append_postings, group_postings
+
+# Character-bag bins: a-z, 0-9 and the space that full_process leaves between words.
+# Any other byte shares a letter bin; merged bins only loosen the bound, never break it.
+NUM_BINS = 37
+SPACE_BIN = 36
+_BIN_OF_BYTE = (np.arange(256) % SPACE_BIN).astype(np.int16)
+_BIN_OF_BYTE[ord("a"):ord("z") + 1] = np.arange(26)
+_BIN_OF_BYTE[ord("0"):ord("9") + 1] = np.arange(26, 36)
+_BIN_OF_BYTE[ord(" ")] = SPACE_BIN
+
+
+def process_title(title):
+    """ Normalize a title exactly as thefuzz does before WRatio (lowercase, ascii, alnum + spaces). """
+    return utils.full_process(title, force_ascii=True)
+
+
+def _signature(processed):
+    """ Return (histogram, processed length, token-set length, tokens) for one processed string. """
+    encoded = np.frombuffer(processed.encode("ascii"), dtype=np.uint8)
+    histogram = np.bincount(_BIN_OF_BYTE[encoded], minlength=NUM_BINS).astype(np.int32)
+    tokens = set(processed.split())
+
+    # Length of the distinct words joined by single spaces: the shortest full form token_set_ratio compares
+    joined_length = sum(len(token) for token in tokens) + max(len(tokens) - 1, 0)
+    return histogram, len(processed), joined_length, tokens
+
+
+class TitleMatcher:
+    """
+    Top-k WRatio title search with a cheap upper-bound prefilter.
+
+    Every unique title gets a character histogram and its lengths at load time. A query
+    then computes, for all titles at once, an upper bound on the WRatio it could reach;
+    only titles whose bound clears the cutoff are scored exactly, best bound first, and
+    scoring stops once the current top k can no longer be displaced.
+    """
+
+    def __init__(self, titles, histograms, lengths, joined_lengths, token_vocabulary, token_offsets,
+                 token_postings, row_offsets, row_ids):
+        self.titles = titles                        # unique original titles
+        self.histograms = histograms                # (n, NUM_BINS) uint8 character bags
+        self.lengths = lengths                      # processed lengths (what WRatio compares)
+        self.joined_lengths = joined_lengths        # lengths of the distinct words re-joined with single spaces
+        self.token_vocabulary = token_vocabulary    # title word -> token id
+        self.token_offsets = token_offsets
+        self.token_postings = token_postings        # token id -> sorted unique-title ids
+        self.row_offsets = row_offsets
+        self.row_ids = row_ids                      # unique-title id -> dataset row ids
+
+    def __len__(self):
+        return len(self.titles)
+
+    def rows_for(self, title_id):
+        """ Dataset row ids whose title is the given unique title. """
+        return self.row_ids[self.row_offsets[title_id]:self.row_offsets[title_id + 1]]
+
+    def _shares_token(self, tokens):
+        """ Boolean mask of titles sharing at least one whole word with the query. """
+        mask = np.zeros(len(self.titles), dtype=bool)
+        for token in tokens:
+            token_id = self.token_vocabulary.get(token)
+            if token_id is not None:
+                mask[self.token_postings[self.token_offsets[token_id]:self.token_offsets[token_id + 1]]] = True
+        return mask
+
+    def upper_bounds(self, processed_query):
+        """ Upper bound of WRatio(query, title) for every title. """
+        histogram, length, joined_length, tokens = _signature(processed_query)
+
+        # Shared characters: letters/digits by bag overlap, spaces by the smaller space count
+        alnum_overlap = np.minimum(self.histograms[:, :SPACE_BIN], histogram[:SPACE_BIN]).sum(axis=1, dtype=np.int32)
+        overlap = alnum_overlap + np.minimum(self.histograms[:, SPACE_BIN], histogram[SPACE_BIN])
+
+        # Any ratio between strings built from these characters is at most 2*O / (n + O)
+        shortest = np.minimum(self.joined_lengths, joined_length)
+        char_bound = np.minimum(2.0 * overlap / np.maximum(shortest + overlap, 1), 1.0)
+
+        longer = np.maximum(self.lengths, length).astype(np.float64)
+        shorter = np.maximum(np.minimum(self.lengths, length), 1)
+        length_ratio = longer / shorter
+        base_bound = 100.0 * np.minimum(char_bound, 2.0 / (1.0 + length_ratio))
+
+        # WRatio only uses partial ratios (scaled by .9, or .6 past 8x) when lengths differ by 1.5x;
+        # a shared word makes the partial token ratios 100 regardless of the character bag
+        partial_scale = np.where(length_ratio > 8, 0.6, 0.9)
+        shared = self._shares_token(tokens)
+        partial_bound = np.maximum(100.0 * partial_scale * char_bound, np.where(shared, 95.0 * partial_scale, 0.0))
+
+        return np.where(length_ratio < 1.5, 100.0 * char_bound, np.maximum(base_bound, partial_bound))
+
+    def extract(self, query, limit=5, score_cutoff=0, deadline=None):
+        """
+        Return up to `limit` (title, score, title_id) tuples like process.extract(query, titles, limit),
+        skipping titles that provably score below score_cutoff. If `deadline` expires, the best
+        matches scored so far are returned.
+        """
+        processed_query = process_title(query)
+        if not processed_query or len(self.titles) == 0:
+            return []
+
+        bounds = self.upper_bounds(processed_query)
+
+        # WRatio rounds to an int, so allow half a point of slack on the cutoff
+        candidates = np.flatnonzero(bounds >= score_cutoff - 0.5)
+        candidates = candidates[np.argsort(-bounds[candidates], kind="stable")]
+
+        best = []  # min-heap of (score, -title_id)
+        for position, title_id in enumerate(candidates.tolist()):
+            if len(best) == limit and best[0][0] > bounds[title_id] + 0.5:
+                break  # no remaining title can displace the current top k
+            if deadline is not None and position % 256 == 0 and deadline.expired():
+                print(f"⏱ Title search budget exhausted after {position} of {len(candidates)} candidates")
+                break
+            score = fuzz.WRatio(processed_query, self.titles[title_id])
+            if score < score_cutoff:
+                continue
+            entry = (score, -title_id)
+            if len(best) < limit:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+
+        best.sort(reverse=True)
+        return [(self.titles[-negative_id], score, -negative_id) for score, negative_id in best]
+
+
+def _title_signatures(titles, token_vocabulary, first_title_id=0):
+    """ Signatures and (token id, title id) pairs of titles numbered from first_title_id, growing token_vocabulary in place. """
+    num_titles = len(titles)
+    histograms = np.zeros((num_titles, NUM_BINS), dtype=np.uint8)
+    lengths = np.zeros(num_titles, dtype=np.int32)
+    joined_lengths = np.zeros(num_titles, dtype=np.int32)
+    token_ids = array("i")
+    title_ids = array("i")
+
+    for position, title in enumerate(titles):
+        histogram, length, joined_length, tokens = _signature(process_title(title))
+        histograms[position] = np.minimum(histogram, 255)
+        lengths[position] = length
+        joined_lengths[position] = joined_length
+        for token in tokens:
+            token_ids.append(token_vocabulary.setdefault(token, len(token_vocabulary)))
+            title_ids.append(first_title_id + position)
+
+    return (histograms, lengths, joined_lengths,
+            np.frombuffer(token_ids, dtype=np.int32), np.frombuffer(title_ids, dtype=np.int32))
+
+
+def build_title_matcher(title_column):
+    """ Precompute title signatures, word postings and title -> rows groups for a Title column. """
+    codes, titles = pd.factorize(title_column)
+    titles = np.asarray(titles, dtype=object)
+    num_titles = len(titles)
+
+    token_vocabulary = {}
+    histograms, lengths, joined_lengths, token_ids, title_ids = _title_signatures(titles, token_vocabulary)
+    token_offsets, token_postings = group_postings(token_ids, title_ids, len(token_vocabulary))
+
+    # Group dataset rows by unique title so matched titles resolve to rows without a column scan
+    codes = np.asarray(codes)
+    valid_rows = np.flatnonzero(codes >= 0).astype(np.int32)
+    row_offsets, row_ids = group_postings(codes[valid_rows].astype(np.int32), valid_rows, num_titles)
+
+    print(f"✅ Title matcher built: {num_titles} unique titles, {len(token_vocabulary)} title words")
+    return TitleMatcher(titles, histograms, lengths, joined_lengths, token_vocabulary, token_offsets,
+                        token_postings, row_offsets, row_ids)
+
+
+def extend_title_matcher(matcher, title_column, row_offset):
+    """
+    Return a new TitleMatcher covering matcher's rows plus appended ones (dataset rows
+    row_offset onwards), equal to build_title_matcher over all rows.
+
+    Only titles not seen before get signatures; existing word postings and row groups are
+    copied into the merged arrays, and the original matcher is left untouched for in-flight readers.
+    """
+    codes, uniques = pd.factorize(title_column)
+    uniques = np.asarray(uniques, dtype=object)
+
+    # Unique titles keep their ids; new ones are numbered after them in first-row order
+    title_ids = pd.Index(matcher.titles, dtype=object).get_indexer(uniques)
+    is_new = title_ids < 0
+    title_ids[is_new] = len(matcher.titles) + np.arange(np.count_nonzero(is_new))
+    new_titles = uniques[is_new]
+    num_titles = len(matcher.titles) + len(new_titles)
+
+    token_vocabulary = dict(matcher.token_vocabulary)
+    histograms, lengths, joined_lengths, token_ids, new_title_ids = _title_signatures(
+        new_titles, token_vocabulary, first_title_id=len(matcher.titles)
+    )
+    token_offsets, token_postings = append_postings(matcher.token_offsets, matcher.token_postings,
+                                                    token_ids, new_title_ids, len(token_vocabulary))
+
+    codes = np.asarray(codes)
+    valid_rows = np.flatnonzero(codes >= 0)
+    row_offsets, row_ids = append_postings(matcher.row_offsets, matcher.row_ids, title_ids[codes[valid_rows]].astype(np.int32),
+                                           (valid_rows + row_offset).astype(np.int32), num_titles)
+
+    print(f"✅ Title matcher extended: +{len(new_titles)} unique titles, "
+          f"{len(token_vocabulary) - len(matcher.token_vocabulary)} new title words")
+    return TitleMatcher(np.concatenate([matcher.titles, new_titles]),
+                        np.concatenate([matcher.histograms, histograms]),
+                        np.concatenate([matcher.lengths, lengths]),
+                        np.concatenate([matcher.joined_lengths, joined_lengths]),
+                        token_vocabulary, token_offsets, token_postings, row_offsets, row_ids)